@@ -0,0 +1,64 @@
+"""
+Build the deployment zip for the photon-code-executor Lambda function.
+
+The handler parses and profiles URL datasets with the API server's own code,
+so the zip carries lambda_function.py plus the modules it imports from the
+backend, at the same package paths, and the sitecustomize.py that keeps
+parsed frames warm for the execution subprocess:
+
+    photon-function.zip
+    ├── lambda_function.py
+    ├── sandbox_site/
+    │   └── sitecustomize.py
+    └── app/
+        ├── __init__.py
+        └── services/
+            ├── compaction.py
+            ├── frame_profile.py
+            ├── loaders.py
+            └── sketches.py
+
+pandas and numpy come from the layer (see create_layer.sh). Usage:
+
+    python aws/build_function.py [--output photon-function.zip]
+"""
+
+import argparse
+import os
+import zipfile
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_BACKEND = os.path.join(_ROOT, "photon")
+
+# (path in the repo, path in the zip)
+FILES = [
+    (os.path.join(_ROOT, "aws", "lambda_function.py"), "lambda_function.py"),
+    (os.path.join(_ROOT, "aws", "sandbox_site", "sitecustomize.py"), "sandbox_site/sitecustomize.py"),
+    (os.path.join(_BACKEND, "app", "__init__.py"), "app/__init__.py"),
+] + [
+    (os.path.join(_BACKEND, "app", "services", name), f"app/services/{name}")
+    for name in ("compaction.py", "frame_profile.py", "loaders.py", "sketches.py")
+]
+
+
+def build(output: str) -> str:
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname in FILES:
+            zf.write(path, arcname)
+    return output
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default="photon-function.zip")
+    args = parser.parse_args()
+    print(f"Wrote {build(args.output)}")
+    print("Deploy it with:")
+    print("  aws lambda update-function-code \\")
+    print("    --function-name photon-code-executor \\")
+    print(f"    --zip-file fileb://{args.output} \\")
+    print("    --region us-east-1")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,199 @@
+"""
+Sandbox handler of the photon-code-executor Lambda function.
+
+Runs generated analysis code in a subprocess and, for {"action": "profile"}
+events, downloads and profiles URL datasets. Downloads stay in DATA_DIR
+for the warm container's later invocations. The code runs in a fresh
+subprocess each time, so the parsed frame itself cannot stay in memory;
+sandbox_site/sitecustomize.py keeps a pickled copy of each frame the code
+reads next to the download, and later executions load that instead of
+parsing the file again.
+"""
+
 import base64
+import hashlib
 import json
 import os
 import subprocess
 import sys
+import time
+import urllib.error
+import urllib.request
+
+# URL datasets are downloaded once per warm container and kept here, so the
+# profile action and the execution that follows share one download.
+DATA_DIR = os.environ.get("PHOTON_SANDBOX_DATA_DIR", "/tmp/photon_data")
+# Re-check a cached URL with a conditional GET after this many seconds.
+URL_TTL_SECONDS = int(os.environ.get("PHOTON_SANDBOX_URL_TTL", 3600))
+# /tmp is small; least recently used datasets go past this many bytes.
+DATA_MAX_BYTES = int(os.environ.get("PHOTON_SANDBOX_DATA_BYTES", 256 * 1024 * 1024))
+_CHUNK_BYTES = 1024 * 1024
+# Put on the execution subprocess's PYTHONPATH; its sitecustomize.py
+# serves warm datasets from pickled frames.
+_SITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_site")
+
+# Loading and profiling settings the API server forwards with each profile
+# event, so the sandbox parses and samples exactly as the server would.
+_PROFILE_SETTINGS = (
+    "PHOTON_LOAD_MAX_MB",
+    "PHOTON_COMPACT_DTYPES",
+    "PHOTON_PROFILE_SAMPLE_THRESHOLD",
+    "PHOTON_PROFILE_SAMPLE_SIZE",
+)
+
+
+def _url_extension(url, content_type):
+    path = url.split("?", 1)[0].lower()
+    if path.endswith((".xlsx", ".xls")) or "spreadsheet" in content_type or "excel" in content_type:
+        return ".xlsx"
+    if path.endswith(".json") or "json" in content_type:
+        return ".json"
+    return ".csv"
+
+
+def _evict(keep):
+    """Drop least recently used dataset files until DATA_DIR fits its budget."""
+    entries = []
+    for name in os.listdir(DATA_DIR):
+        full = os.path.join(DATA_DIR, name)
+        if os.path.isfile(full) and not name.endswith(".tmp"):
+            entries.append((os.path.getmtime(full), os.path.getsize(full), full))
+    total = sum(size for _, size, _ in entries)
+    for _, size, full in sorted(entries):
+        if total <= DATA_MAX_BYTES:
+            break
+        if keep and full.startswith(keep):
+            continue
+        try:
+            os.remove(full)
+            total -= size
+        except OSError:
+            pass
+
+
+def fetch_url(url):
+    """Return (local path, sha256) for url, downloading only when needed.
+
+    Within URL_TTL_SECONDS of the last fetch the cached file is used as is;
+    after that it is revalidated with If-None-Match / If-Modified-Since.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    base = os.path.join(DATA_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest()[:32])
+    meta_path = base + ".meta.json"
+    meta = None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if not os.path.exists(meta["path"]):
+            meta = None
+    except (OSError, ValueError, KeyError):
+        meta = None
+
+    if meta is not None and time.time() - meta["fetched_at"] < URL_TTL_SECONDS:
+        os.utime(meta["path"])
+        return meta["path"], meta["digest"]
+
+    headers = {}
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        resp = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=20)
+    except urllib.error.HTTPError as e:
+        if e.code != 304 or meta is None:
+            raise
+        meta["fetched_at"] = time.time()
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+        os.utime(meta["path"])
+        return meta["path"], meta["digest"]
+
+    with resp:
+        path = base + _url_extension(url, resp.headers.get("Content-Type", "") or "")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        digest = hashlib.sha256()
+        with open(tmp, "wb") as f:
+            for block in iter(lambda: resp.read(_CHUNK_BYTES), b""):
+                digest.update(block)
+                f.write(block)
+        os.replace(tmp, path)
+        meta = {
+            "url": url,
+            "path": path,
+            "digest": digest.hexdigest(),
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    _evict(keep=base)
+    return path, meta["digest"]
+
+
+def _read_frame(path, sheet=None):
+    """Parse path the way the API server's profiler.read_source() does."""
+    from app.services import compaction, loaders
+
+    limit_bytes = int(os.environ.get("PHOTON_LOAD_MAX_MB", 2048)) * 1024 * 1024
+    with open(path, "rb") as f:
+        df = loaders.read(f, os.path.splitext(path)[1], limit_bytes, sheet)
+    if os.environ.get("PHOTON_COMPACT_DTYPES", "1") == "1":
+        df, _ = compaction.compact_dtypes(df)
+    return df
+
+
+def _profile_action(event):
+    """Download (or reuse) a URL dataset, profile it, and cache the profile in /tmp.
+
+    Parsing and profiling use the API server's own modules (loaders,
+    compaction, frame_profile), which build_function.py packages next to
+    this file.
+    """
+    from app.services.frame_profile import profile
+
+    settings = {k: str(v) for k, v in (event.get("settings") or {}).items() if k in _PROFILE_SETTINGS}
+    for name in _PROFILE_SETTINGS:
+        if name in settings:
+            os.environ[name] = settings[name]
+        else:
+            os.environ.pop(name, None)
+    url = event.get("source_url")
+    sheet = event.get("sheet")
+    if not url:
+        return {"statusCode": 400, "body": json.dumps({"error": "No source_url provided"})}
+    try:
+        path, digest = fetch_url(url)
+    except Exception as e:
+        return {"statusCode": 400, "body": json.dumps({"error": f"Could not fetch {url}: {e}"})}
+
+    # One cached profile per sheet and sampling setting.
+    variant = json.dumps([sheet, sorted(settings.items())])
+    suffix = hashlib.sha256(variant.encode("utf-8")).hexdigest()[:16]
+    cache_path = os.path.join(DATA_DIR, f"{digest}.{suffix}.profile.json")
+    try:
+        with open(cache_path) as f:
+            data_profile = json.load(f)
+    except (OSError, ValueError):
+        try:
+            data_profile = profile(_read_frame(path, sheet))
+        except Exception as e:
+            return {"statusCode": 400, "body": json.dumps({"error": f"Could not parse {url}: {e}"})}
+        with open(cache_path, "w") as f:
+            json.dump(data_profile, f, default=str)
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"profile": data_profile, "digest": digest, "path": path}),
+    }
 
 
 def lambda_handler(event, context):
+    if event.get("action") == "profile":
+        return _profile_action(event)
+
     code = event.get("code", "")
     job_id = event.get("job_id", "unknown")
     file_content = event.get("file_content")
@@ -17,12 +205,34 @@ def lambda_handler(event, context):
             "body": json.dumps({"error": "No code provided"}),
         }
 
+    # Dataset files the generated code reads, by content digest, for
+    # sitecustomize.py to keep their parsed frames warm.
+    warm = {}
+
+    # URL datasets profiled in the sandbox are read by the generated code from
+    # the local copy; make sure it is there (a cold container re-downloads).
+    if event.get("source_url"):
+        try:
+            path, digest = fetch_url(event["source_url"])
+            warm[path] = digest
+        except Exception as e:
+            return {
+                "statusCode": 200,
+                "body": json.dumps({
+                    "stdout": "",
+                    "stderr": f"Could not fetch {event['source_url']}: {e}",
+                    "exit_code": 1,
+                    "output_image": None,
+                }),
+            }
+
     # Write embedded file content to /tmp so generated code can read it
     if file_content:
         file_bytes = base64.b64decode(file_content)
         file_path = f"/tmp/uploaded_data{file_extension}"
         with open(file_path, "wb") as f:
             f.write(file_bytes)
+        warm[file_path] = hashlib.sha256(file_bytes).hexdigest()
 
     # Write the generated code to /tmp
     code_file = f"/tmp/photon_job_{job_id}.py"
@@ -30,7 +240,10 @@ def lambda_handler(event, context):
         f.write(code)
 
     # Execute in subprocess with the data science layer on PYTHONPATH
-    env = {**os.environ, "PYTHONPATH": "/opt/python", "MPLBACKEND": "Agg"}
+    env = {**os.environ, "PYTHONPATH": f"{_SITE_DIR}{os.pathsep}/opt/python", "MPLBACKEND": "Agg"}
+    if warm:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        env.update(PHOTON_WARM_FRAMES=json.dumps(warm), PHOTON_WARM_FRAMES_DIR=DATA_DIR)
     try:
         result = subprocess.run(
             [sys.executable, code_file],
@@ -57,6 +270,9 @@ def lambda_handler(event, context):
             os.remove(code_file)
         except OSError:
             pass
+        if warm:
+            # New pickled frames count against the data budget too.
+            _evict(keep=None)
 
     # Read and encode the output image if it was produced
     output_image = None
@@ -0,0 +1,80 @@
+"""
+Keeps parsed datasets warm between executions on one Lambda container.
+
+lambda_function.py runs generated code in a fresh subprocess, so a frame
+parsed by one invocation cannot stay in memory for the next. Instead this
+module, which Python imports at startup from the subprocess's PYTHONPATH,
+wraps pandas.read_csv / read_excel / read_json: the first read of a warm
+dataset file pickles the result next to it, and later reads of the same
+file with the same arguments load that pickle instead of parsing again.
+
+The handler lists the warm files in PHOTON_WARM_FRAMES as a JSON object
+{path: sha256 of the content} and the directory for the pickles in
+PHOTON_WARM_FRAMES_DIR. Pickles are named by content digest and reader
+arguments, so a changed download never serves a stale frame, and they sit
+in the handler's data directory, which keeps them under its byte budget.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import pickle
+
+_READERS = ("read_csv", "read_excel", "read_json")
+
+
+def _artifact(directory, digest, reader, kwargs):
+    try:
+        args = json.dumps([reader, kwargs], sort_keys=True)
+    except (TypeError, ValueError):
+        # Callables and other unserialisable arguments: not worth caching.
+        return None
+    key = hashlib.sha256(args.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(directory, f"{digest}.{key}.frame.pkl")
+
+
+def _wrap(reader, original, warm, directory):
+    @functools.wraps(original)
+    def read(source, *args, **kwargs):
+        digest = warm.get(os.path.abspath(source)) if isinstance(source, str) and not args else None
+        path = _artifact(directory, digest, reader, kwargs) if digest else None
+        if path is None:
+            return original(source, *args, **kwargs)
+        try:
+            with open(path, "rb") as f:
+                frame = pickle.load(f)
+            os.utime(path)
+            return frame
+        except Exception:
+            # Missing, half-written or unreadable: parse again and rewrite it.
+            pass
+        frame = original(source, **kwargs)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        return frame
+
+    return read
+
+
+def _install():
+    warm = json.loads(os.environ.get("PHOTON_WARM_FRAMES") or "{}")
+    directory = os.environ.get("PHOTON_WARM_FRAMES_DIR")
+    if not warm or not directory:
+        return
+    import pandas as pd
+
+    warm = {os.path.abspath(path): digest for path, digest in warm.items()}
+    for reader in _READERS:
+        setattr(pd, reader, _wrap(reader, getattr(pd, reader), warm, directory))
+
+
+_install()
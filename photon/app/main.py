@@ -11,6 +11,7 @@ import threading
 import os
 
 from app.routes import query, workflow, health, execute, upload, demo
+from app.services import lambda_executor
 from app.services.auth import is_valid_key
 from app.services.redis_rate_limiter import RedisRateLimiter
 
@@ -55,6 +56,12 @@ async def startup_event():
     threading.Thread(target=_warmup_embedding_model, daemon=True).start()
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the shared async Lambda client and its connections."""
+    await lambda_executor.close_async_client()
+
+
 class ApiKeyRateLimitMiddleware(BaseHTTPMiddleware):
     """Simple in-memory API key auth + rate limiter.
 
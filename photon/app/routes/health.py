@@ -1,4 +1,16 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services import (
+    code_cache,
+    compaction,
+    http_cache,
+    metrics,
+    profile_cache,
+    speculation,
+    upload_store,
+    workflow_cache,
+)
 
 router = APIRouter()
 
@@ -6,3 +18,23 @@ router = APIRouter()
 @router.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@router.get("/health/caches")
+def cache_stats():
+    """Occupancy and hit/miss counters for the in-process caches, for sizing."""
+    return {
+        "profile": profile_cache.stats(),
+        "http": http_cache.stats(),
+        "compaction": compaction.stats(),
+        "uploads": upload_store.stats(),
+        "workflow": workflow_cache.stats(),
+        "speculation": speculation.stats(),
+        "code": code_cache.stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def stage_metrics():
+    """Per-stage workflow latency histograms, in the Prometheus text format."""
+    return metrics.render()
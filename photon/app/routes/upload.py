@@ -1,39 +1,234 @@
 import base64
 import os
 import uuid
+from contextlib import aclosing
+from typing import Optional
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from python_multipart.multipart import parse_options_header
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 
-from app.services import upload_store
+from app.services import preprocess, upload_sessions, upload_store
+from app.services.profiler import list_sheets
+from app.services.upload_sessions import CHUNK_BYTES, ChunkConflict, UploadTooLarge
 
 router = APIRouter()
 
 _ALLOWED = {'.csv', '.xlsx', '.xls'}
 
 
-@router.post("/")
-async def upload_file(file: UploadFile = File(...)):
-    ext = os.path.splitext(file.filename)[1].lower()
+# Room for multipart framing (boundaries, part headers) around the file itself.
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+_MULTIPART_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+async def _limited_stream(request: Request):
+    """The request body, stopping with UploadTooLarge once it passes the upload limit."""
+    received = 0
+    async for block in request.stream():
+        received += len(block)
+        upload_sessions.check_size(received - _MULTIPART_OVERHEAD_BYTES)
+        yield block
+
+
+def _copy_to_spool(src, spool: upload_sessions.Spool) -> None:
+    with spool.open() as f:
+        while block := src.read(CHUNK_BYTES):
+            spool.write(f, block)
+
+
+@router.post("/", openapi_extra=_MULTIPART_BODY)
+async def upload_file(request: Request):
+    # The form is parsed here rather than through an UploadFile parameter,
+    # which FastAPI would buffer in full before the size limit could apply.
+    length = request.headers.get("content-length")
+    try:
+        if length is not None and length.isdigit():
+            upload_sessions.check_size(int(length) - _MULTIPART_OVERHEAD_BYTES)
+        content_type, _ = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data":
+            raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+        async with aclosing(_limited_stream(request)) as stream:
+            form = await MultiPartParser(request.headers, stream, max_files=1, max_fields=10).parse()
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=400, detail="No file in the upload")
+        ext = os.path.splitext(file.filename or "")[1].lower()
+        if ext not in _ALLOWED:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"File type {ext} not supported. Use CSV or Excel."},
+            )
+
+        # Copy block by block into a spool file, hashing on the way, so memory
+        # stays flat. The copy is blocking file I/O, so it runs off the event loop.
+        spool = await run_in_threadpool(upload_sessions.Spool)
+        try:
+            await run_in_threadpool(_copy_to_spool, file.file, spool)
+            upload_id = str(uuid.uuid4())
+            await run_in_threadpool(
+                spool.commit, upload_id, {"filename": file.filename, "extension": ext}
+            )
+        except UploadTooLarge as e:
+            await run_in_threadpool(spool.discard)
+            raise HTTPException(status_code=413, detail=str(e))
+        except BaseException:
+            # Not awaited: a cancelled request must still remove its spool.
+            spool.discard()
+            raise
+    finally:
+        await form.close()
+
+    # Parse, profile and stage in the background; /workflow/generate picks up the result.
+    preprocess.schedule(upload_id)
+    return {"path": f"photon-upload://{upload_id}", "filename": file.filename}
+
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: Optional[int] = None
+
+
+class CompleteRequest(BaseModel):
+    sha256: Optional[str] = None
+
+
+def _session_or_404(session_id: str):
+    try:
+        return upload_sessions.get(session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+
+
+@router.post("/sessions")
+def start_upload_session(req: UploadSessionRequest):
+    """Open a resumable upload; send chunks with PUT /sessions/{id}/chunks/{index}."""
+    ext = os.path.splitext(req.filename)[1].lower()
     if ext not in _ALLOWED:
-        return JSONResponse(
-            status_code=400,
-            content={"error": f"File type {ext} not supported. Use CSV or Excel."},
+        raise HTTPException(status_code=400, detail=f"File type {ext} not supported. Use CSV or Excel.")
+    try:
+        session = upload_sessions.create(req.filename, ext, req.size)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return {**session.state(), "max_bytes": upload_sessions.max_upload_bytes()}
+
+
+@router.get("/sessions/{session_id}")
+def upload_session_state(session_id: str):
+    """Bytes and chunks received so far; a client resumes from offset/next_index."""
+    return _session_or_404(session_id).state()
+
+
+@router.put("/sessions/{session_id}/chunks/{index}")
+async def upload_chunk(session_id: str, index: int, offset: int, request: Request):
+    """Append the raw request body as chunk index, starting at byte offset.
+
+    Returns 409 with the expected offset when the chunk is out of order.
+    A chunk that is cut off is discarded whole and can simply be resent.
+    """
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit():
+        try:
+            upload_sessions.check_size(offset + int(length))
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+    try:
+        writer = await run_in_threadpool(upload_sessions.begin_chunk, session_id, index, offset)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    except ChunkConflict as e:
+        state = (await run_in_threadpool(_session_or_404, session_id)).state()
+        return JSONResponse(status_code=409, content={"error": str(e), **state})
+
+    ok = False
+    try:
+        async for block in request.stream():
+            await run_in_threadpool(writer.write, block)
+        ok = True
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    finally:
+        try:
+            session = await run_in_threadpool(upload_sessions.end_chunk, writer, ok)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    return session.state()
+
+
+@router.post("/sessions/{session_id}/complete")
+def complete_upload_session(session_id: str, req: Optional[CompleteRequest] = None):
+    """Store the assembled file; optionally verify it against the client's sha256."""
+    try:
+        upload_id, digest, filename = upload_sessions.complete(
+            session_id, req.sha256 if req else None
         )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    except ChunkConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    preprocess.schedule(upload_id)
+    return {"path": f"photon-upload://{upload_id}", "filename": filename, "sha256": digest}
 
-    contents = await file.read()
-    upload_id = str(uuid.uuid4())
-    upload_store.put(upload_id, {
-        "content": base64.b64encode(contents).decode(),
-        "filename": file.filename,
-        "extension": ext,
-    })
 
-    return {"path": f"photon-upload://{upload_id}", "filename": file.filename}
+@router.delete("/sessions/{session_id}")
+def abort_upload_session(session_id: str):
+    upload_sessions.abort(session_id)
+    return {"status": "aborted"}
 
 
 @router.get("/retrieve/{upload_id}")
-async def retrieve_upload(upload_id: str):
+def retrieve_upload(upload_id: str):
+    # Plain def: loading a spilled blob and base64-encoding it are blocking
+    # work, so FastAPI runs this in its threadpool instead of on the event loop.
+    if not upload_store.contains(upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    data = upload_store.get(upload_id)
+    # JSON cannot carry raw bytes; encode only on the way out.
+    return {**data, "content": base64.b64encode(data["content"]).decode("ascii")}
+
+
+@router.get("/{upload_id}/status")
+def upload_status(upload_id: str):
+    """Pre-processing progress, so the frontend knows when questions will be fast."""
+    try:
+        return {"upload_id": upload_id, **preprocess.status(upload_id)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+
+
+@router.get("/{upload_id}/sheets")
+def list_upload_sheets(upload_id: str):
+    """List the worksheets of an uploaded workbook without parsing them."""
     if not upload_store.contains(upload_id):
         raise HTTPException(status_code=404, detail="Upload not found or expired")
-    return upload_store.get(upload_id)
+    try:
+        sheets = list_sheets(f"photon-upload://{upload_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"sheets": sheets}
@@ -1,28 +1,57 @@
+import asyncio
 import json
 import logging
+import os
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from app.services import upload_store
-from app.services.lambda_executor import execute_via_lambda
+from app.services import (
+    code_cache,
+    deadline,
+    metrics,
+    preprocess,
+    speculation,
+    upload_store,
+    workflow_cache,
+)
+from app.services.lambda_executor import (
+    execute_via_lambda_async,
+    profile_via_lambda_async,
+    sandbox_profile_enabled,
+)
 from app.services.llm import (
-    generate_analysis_code,
-    generate_follow_up_suggestions,
-    generate_insight_narrative,
+    MODEL,
+    default_suggestions,
+    generate_analysis_code_async,
+    generate_follow_up_suggestions_async,
+    generate_insight_narrative_async,
+    stream_analysis_code,
+    strip_fences,
 )
-from app.services.profiler import load_dataframe, profile
+from app.services.profiler import DatasetSource
 from app.services.vector_db import search_playbooks
 
 router = APIRouter()
 log = logging.getLogger(__name__)
 
+# Shared deadline for the narrative and suggestion calls after execution.
+_POST_PROCESS_TIMEOUT_SECONDS = 20
+# Below this much remaining request budget, the optional post-processing
+# LLM calls are skipped in favour of their fallbacks.
+_OPTIONAL_STAGE_MIN_SECONDS = 3
+
 
 class WorkflowRequest(BaseModel):
     question: str
     source: str
     conversation_history: list = []
     session_id: str = ""
+    sheet: Optional[str] = None
+    # Skip the workflow result cache lookup; the fresh result is still stored.
+    bypass_cache: bool = False
 
 
 def _parse_summary(stdout: str) -> tuple:
@@ -37,52 +66,188 @@ def _parse_summary(stdout: str) -> tuple:
         return [], []
 
 
-@router.post("/generate")
-def generate_workflow(req: WorkflowRequest):
-    # Step 1: load and profile the data.
+async def _with_fallback(coro, timeout: float, fallback, stage: str):
+    """Await coro within timeout as a timed stage; on timeout or error log it and return fallback."""
     try:
-        df = load_dataframe(req.source)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        with metrics.span(stage):
+            return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        log.warning("Stage %s timed out after %.1fs; using fallback", stage, timeout)
+    except Exception as e:
+        log.warning("Stage %s failed: %s; using fallback", stage, e)
+    return fallback
+
+
+async def _post_process(
+    req: WorkflowRequest, data_profile: dict, kpi_cards: list, anomalies: list, has_output: bool
+) -> tuple:
+    """Run the narrative and suggestion LLM calls concurrently; returns (narrative, suggestions).
+
+    Each call falls back independently (empty narrative, default
+    suggestions), so a slow or failing one never holds up the other. Both
+    are bounded by the request's remaining budget, and skipped outright when
+    too little of it is left for them to be worth starting.
+    """
+    defaults = default_suggestions(data_profile["data_type"])
+    remaining = deadline.current().remaining()
+    min_seconds = float(
+        os.environ.get("PHOTON_OPTIONAL_STAGE_MIN_SECONDS", _OPTIONAL_STAGE_MIN_SECONDS)
+    )
+    if remaining < min_seconds:
+        log.info("%.1fs of request budget left; skipping narrative and suggestions", remaining)
+        return "", defaults
+
+    timeout = deadline.current().timeout(
+        float(os.environ.get("PHOTON_POST_PROCESS_TIMEOUT_SECONDS", _POST_PROCESS_TIMEOUT_SECONDS))
+    )
+    if has_output:
+        narrative = _with_fallback(
+            generate_insight_narrative_async(
+                req.question, data_profile, kpi_cards, anomalies, req.conversation_history,
+                timeout=timeout,
+            ),
+            timeout, "", "narrative",
+        )
+    else:
+        narrative = asyncio.sleep(0, result="")
+    suggestions = _with_fallback(
+        generate_follow_up_suggestions_async(req.question, data_profile, kpi_cards, timeout=timeout),
+        timeout, defaults, "suggestions",
+    )
+    return tuple(await asyncio.gather(narrative, suggestions))
+
+
+def _out_of_time(stage: str) -> HTTPException:
+    budget = deadline.current().budget
+    return HTTPException(
+        status_code=504, detail=f"Request budget of {budget:g}s ran out during {stage}"
+    )
+
+
+async def _run_pipeline(req: WorkflowRequest, stream_code: bool = False, api_key: str = ""):
+    """Run the workflow, yielding (event, data) pairs as each stage completes.
+
+    Events, in order: profile, cache (HIT, MISS or BYPASS), code_delta (only
+    when stream_code is set, one per LLM text chunk), code, execution,
+    insights. A cache hit skips straight to the stored code, execution and
+    insights. Failures raise HTTPException with the status the JSON
+    endpoint returns. Each stage runs in a metrics span.
+
+    Downstream timeouts come from the request's deadline.Deadline; running
+    out of budget in a required stage is a 504. api_key scopes the code
+    cache, so code generated for one tenant's data is never served to another.
+    """
+    dl = deadline.current()
+    # The pipeline is async end to end: LLM and Lambda calls are awaited, and
+    # blocking work runs on dedicated executors, so a request waiting 30 s on
+    # Lambda holds no thread and never starves /health or other endpoints.
+
+    # Step 1: load and profile the data. Profiles are cached by content hash,
+    # so follow-up questions on the same dataset skip parsing and profiling;
+    # uploads are usually already profiled by their background job. With
+    # PHOTON_SANDBOX_PROFILE=1, URL datasets are profiled by the Lambda
+    # sandbox instead, which keeps its copy for the execution in step 4.
+    sandbox_path = None
+    try:
+        if sandbox_profile_enabled(req.source):
+            with metrics.span("sandbox_profile"):
+                result = await profile_via_lambda_async(req.source, req.sheet, timeout=dl.timeout())
+            digest = DatasetSource(req.source, "", result["digest"], sheet=req.sheet).key
+            data_profile, sandbox_path = result["profile"], result["path"]
+        else:
+            digest, data_profile = await preprocess.profile_source_async(req.source, req.sheet)
     except Exception as e:
+        # Checked first: a call cut short by the budget may surface as any error.
+        if dl.expired():
+            raise _out_of_time("data loading")
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=str(e))
         log.error("Failed to load data from %s: %s", req.source, e)
         raise HTTPException(status_code=400, detail=f"Could not load data: {e}")
-
-    data_profile = profile(df)
+    yield "profile", {"profile": data_profile, "methodology_used": data_profile["data_type"]}
 
     # Step 2: retrieve methodology playbook.
-    playbook = search_playbooks(data_profile["data_type"])
+    with metrics.span("playbook"):
+        playbook = await asyncio.to_thread(search_playbooks, data_profile["data_type"])
 
     # For uploaded files, the LLM must generate code using the /tmp path that
     # Lambda will write the file to — not the photon-upload:// URI.
-    code_source = req.source
+    # Sandbox-profiled URLs are read from the sandbox's local copy.
+    code_source = sandbox_path or req.source
     if req.source.startswith("photon-upload://"):
         upload_id = req.source.removeprefix("photon-upload://")
         try:
-            meta = upload_store.get(upload_id)
+            meta = upload_store.metadata(upload_id)
             code_source = f"/tmp/uploaded_data{meta['extension']}"
         except KeyError:
             code_source = "/tmp/uploaded_data.csv"
 
+    # Identical questions on identical data reuse the finished result.
+    cache_key = None
+    cached = None
+    if workflow_cache.enabled():
+        cache_key = workflow_cache.make_key(
+            digest, req.question, req.conversation_history, playbook, code_source, MODEL
+        )
+        if not req.bypass_cache:
+            with metrics.span("cache"):
+                cached = await asyncio.to_thread(workflow_cache.get, cache_key)
+    if req.bypass_cache:
+        yield "cache", {"status": "BYPASS"}
+    else:
+        yield "cache", {"status": "HIT" if cached is not None else "MISS"}
+    if cached is not None:
+        yield "code", {"code": cached["code"]}
+        yield "execution", {key: cached[key] for key in ("execution", "kpi_cards", "anomalies")}
+        yield "insights", {
+            key: cached[key] for key in ("insight_narrative", "follow_up_suggestions")
+        }
+        return
+
     # Step 3: generate dashboard code grounded in profile + playbook + history.
+    if dl.expired():
+        raise _out_of_time("code generation")
+    # Standalone questions close enough to an earlier one on the same schema
+    # reuse its code instead of calling the LLM (see code_cache).
+    use_code_cache = code_cache.enabled() and not req.conversation_history
+    code_hit, embedding = None, None
+    if use_code_cache and not req.bypass_cache:
+        with metrics.span("code_cache"):
+            code_hit, embedding = await asyncio.to_thread(
+                code_cache.lookup, req.question, data_profile, code_source, MODEL, req.sheet, api_key
+            )
+    args = (req.question, data_profile, playbook, code_source, req.conversation_history)
     try:
-        code = generate_analysis_code(
-            req.question,
-            data_profile,
-            playbook,
-            code_source,
-            req.conversation_history,
-        )
+        if code_hit is not None:
+            code = code_hit["code"]
+        elif stream_code:
+            with metrics.span("codegen"):
+                parts = []
+                async for text in stream_analysis_code(*args, sheet=req.sheet, timeout=dl.timeout()):
+                    parts.append(text)
+                    yield "code_delta", {"text": text}
+            code = strip_fences("".join(parts))
+        else:
+            with metrics.span("codegen"):
+                code = await generate_analysis_code_async(*args, sheet=req.sheet, timeout=dl.timeout())
     except ValueError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
+        if dl.expired():
+            raise _out_of_time("code generation")
         log.error("LLM generation failed: %s", e)
         raise HTTPException(status_code=500, detail="Code generation failed")
+    yield "code", {"code": code}
 
     # Step 4: execute in Lambda sandbox.
+    if dl.expired():
+        raise _out_of_time("execution")
     try:
-        execution = execute_via_lambda(code, req.source)
+        with metrics.span("execute"):
+            execution = await execute_via_lambda_async(code, req.source, timeout=dl.timeout())
     except Exception as e:
+        if dl.expired():
+            raise _out_of_time("execution")
         log.error("Lambda invocation failed: %s", e)
         raise HTTPException(
             status_code=503,
@@ -106,32 +271,192 @@ def generate_workflow(req: WorkflowRequest):
     stdout = execution_result["stdout"]
     has_output = bool(execution_result["output_image"]) or "PHOTON_SUMMARY:" in stdout
     kpi_cards, anomalies = _parse_summary(stdout)
+    yield "execution", {"execution": execution_result, "kpi_cards": kpi_cards, "anomalies": anomalies}
 
-    # Step 6: generate insight narrative (second LLM pass, only when output exists).
-    insight_narrative = ""
-    if has_output:
-        insight_narrative = generate_insight_narrative(
-            req.question,
-            data_profile,
-            kpi_cards,
-            anomalies,
-            req.conversation_history,
-        )
-
-    # Step 7: generate follow-up suggestions (third LLM call).
-    follow_up_suggestions = generate_follow_up_suggestions(
-        req.question,
-        data_profile,
-        kpi_cards,
+    # Steps 6-7: insight narrative (only when output exists) and follow-up
+    # suggestions. Both depend only on the question, profile and KPIs, so they
+    # run concurrently under one deadline, and are optional: when the request
+    # budget is nearly spent they fall back rather than delay the response.
+    insight_narrative, follow_up_suggestions = await _post_process(
+        req, data_profile, kpi_cards, anomalies, has_output
     )
-
-    return {
-        "code": code,
-        "profile": data_profile,
-        "methodology_used": data_profile["data_type"],
-        "execution": execution_result,
-        "kpi_cards": kpi_cards,
-        "anomalies": anomalies,
+    yield "insights", {
         "insight_narrative": insight_narrative,
         "follow_up_suggestions": follow_up_suggestions,
     }
+
+    # Only complete results are cached: an empty narrative means its LLM
+    # call failed or timed out, and a rerun would likely do better.
+    if cache_key is not None and has_output and insight_narrative:
+        result = {
+            "code": code,
+            "execution": execution_result,
+            "kpi_cards": kpi_cards,
+            "anomalies": anomalies,
+            "insight_narrative": insight_narrative,
+            "follow_up_suggestions": follow_up_suggestions,
+        }
+        with metrics.span("cache_write"):
+            await asyncio.to_thread(workflow_cache.put, cache_key, result)
+
+    # Code that produced a summary is worth reusing; reused code that no
+    # longer does is dropped.
+    has_summary = "PHOTON_SUMMARY:" in stdout
+    if code_hit is not None and not has_summary:
+        await asyncio.to_thread(code_cache.discard, code_hit["id"])
+    elif use_code_cache and code_hit is None and has_summary:
+        with metrics.span("code_cache_write"):
+            await asyncio.to_thread(
+                code_cache.put,
+                req.question,
+                data_profile,
+                code_source,
+                MODEL,
+                code,
+                embedding,
+                req.sheet,
+                api_key,
+            )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _speculation_group(request: Request, req: WorkflowRequest) -> tuple:
+    """(api key, conversation key) used to budget and cancel speculative runs."""
+    api_key = request.headers.get("x-api-key") or request.query_params.get("api_key") or ""
+    return api_key, f"{api_key}:{req.session_id or req.source}"
+
+
+async def _join_speculation(group: str, question: str) -> None:
+    """Cancel other speculative runs in the conversation; wait out one for this question.
+
+    Once a joined run finishes its result is in the workflow cache, so the
+    pipeline that follows is a hit. The wait is bounded by the request's
+    deadline; a run still going by then is cancelled and the request runs
+    the pipeline itself.
+    """
+    task = speculation.claim(group, question)
+    if task is not None:
+        with metrics.span("speculation_wait"):
+            done, _ = await asyncio.wait({task}, timeout=deadline.current().timeout())
+        if not done:
+            log.info("Speculative run for %r outlived the request budget", question)
+            task.cancel()
+
+
+def _speculate_follow_ups(request: Request, req: WorkflowRequest, insights: dict) -> None:
+    """Precompute the suggested follow-ups in the background, if enabled."""
+    if not speculation.enabled():
+        return
+    api_key, group = _speculation_group(request, req)
+    # The history the client will send when a suggestion is clicked.
+    history = list(req.conversation_history) + [
+        {"role": "user", "content": req.question},
+        {"role": "assistant", "content": insights["insight_narrative"]},
+    ]
+
+    async def _run(question: str) -> None:
+        # Runs in its own context: the same budget as a foreground request.
+        deadline.start()
+        follow_up = WorkflowRequest(
+            question=question,
+            source=req.source,
+            sheet=req.sheet,
+            session_id=req.session_id,
+            conversation_history=history,
+        )
+        async for _ in _run_pipeline(follow_up, api_key=api_key):
+            pass
+
+    speculation.submit(group, api_key, insights["follow_up_suggestions"], _run)
+
+
+def _finish_timings(timings: metrics.Timings) -> str:
+    """Record the request total and log the per-stage breakdown; returns the Server-Timing value."""
+    metrics.observe("total", timings.total())
+    header = timings.header()
+    log.info("Workflow timings: %s", header)
+    return header
+
+
+@router.post("/generate")
+async def generate_workflow(req: WorkflowRequest, request: Request, response: Response):
+    timings = metrics.track()
+    deadline.start()
+    api_key, group = _speculation_group(request, req)
+    await _join_speculation(group, req.question)
+    result = {}
+    with speculation.foreground():
+        async for event, data in _run_pipeline(req, api_key=api_key):
+            if event == "cache":
+                response.headers["X-Cache"] = data["status"]
+            else:
+                result.update(data)
+    _speculate_follow_ups(request, req, result)
+    response.headers["Server-Timing"] = _finish_timings(timings)
+    body = {
+        "code": result["code"],
+        "profile": result["profile"],
+        "methodology_used": result["methodology_used"],
+        "execution": result["execution"],
+        "kpi_cards": result["kpi_cards"],
+        "anomalies": result["anomalies"],
+        "insight_narrative": result["insight_narrative"],
+        "follow_up_suggestions": result["follow_up_suggestions"],
+    }
+    if metrics.debug_enabled():
+        body["timings"] = timings.as_dict()
+    return body
+
+
+@router.post("/generate/stream")
+async def generate_workflow_stream(req: WorkflowRequest, request: Request):
+    """/generate as Server-Sent Events, one event per completed stage.
+
+    Profiling and the cache lookup run before the response starts, so a bad
+    source is still a plain 400 and X-Cache can be set. Later failures
+    arrive as an ``error`` event, and a ``done`` event closes a successful
+    stream. Server-Timing covers the stages before the stream starts; with
+    PHOTON_DEBUG=1 the ``done`` event carries the full ``timings``.
+    """
+    timings = metrics.track()
+    deadline.start()
+    api_key, group = _speculation_group(request, req)
+    await _join_speculation(group, req.question)
+    pipeline = _run_pipeline(req, stream_code=True, api_key=api_key)
+    head = []
+    with speculation.foreground():
+        async for event, data in pipeline:
+            head.append((event, data))
+            if event == "cache":
+                break
+
+    async def _events():
+        for event, data in head:
+            yield _sse(event, data)
+        insights = None
+        with speculation.foreground():
+            try:
+                async for name, payload in pipeline:
+                    if name == "insights":
+                        insights = payload
+                    yield _sse(name, payload)
+            except HTTPException as e:
+                yield _sse("error", {"status": e.status_code, "detail": e.detail})
+                return
+        _finish_timings(timings)
+        yield _sse("done", {"timings": timings.as_dict()} if metrics.debug_enabled() else {})
+        _speculate_follow_ups(request, req, insights)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Cache": head[-1][1]["status"],
+            "Server-Timing": timings.header(),
+        },
+    )
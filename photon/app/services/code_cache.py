@@ -0,0 +1,189 @@
+"""
+Semantic cache of generated analysis code.
+
+Paraphrased questions about the same schema ("defects by department",
+"which department has most defects") would each cost a code-generation
+LLM call. With PHOTON_CODE_CACHE=1, code that produced a PHOTON_SUMMARY
+is stored in a ChromaDB collection under the embedding of its question.
+A later question is answered with that code, skipping the LLM, when:
+  - the request comes with the same API key: code can embed values from
+    the data it was written for (category names, thresholds), so entries
+    are never shared between tenants
+  - the dataset has the same schema fingerprint (column names and dtypes)
+  - the workbook sheet is the same (generated code names it in read_excel)
+  - the code was generated by the same model
+  - the questions' cosine similarity reaches PHOTON_CODE_CACHE_THRESHOLD
+
+The path the code reads the data from is stored as a placeholder, so code
+is shared between a tenant's datasets with the same schema. API keys are
+stored only as hashes. Only standalone questions
+(no conversation history) use the cache, since a follow-up like "now by
+month" means something different in every conversation. Code that fails
+to produce a summary when reused is dropped from the cache.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+from app.services import vector_db
+from app.services.hf_api import get_embedding
+from app.services.workflow_cache import normalize_question
+
+log = logging.getLogger(__name__)
+
+_DEFAULT_THRESHOLD = 0.9
+_SOURCE_PLACEHOLDER = "__PHOTON_SOURCE__"
+
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "writes": 0, "discarded": 0, "errors": 0}
+
+
+def enabled() -> bool:
+    return os.environ.get("PHOTON_CODE_CACHE", "0") == "1"
+
+
+def _threshold() -> float:
+    return float(os.environ.get("PHOTON_CODE_CACHE_THRESHOLD", _DEFAULT_THRESHOLD))
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[name] += 1
+
+
+def schema_fingerprint(profile: dict) -> str:
+    """Hash of the profile's column names and dtypes, in order."""
+    columns = [[c["name"], c["dtype"]] for c in profile["columns"]]
+    return hashlib.sha256(json.dumps(columns, default=str).encode("utf-8")).hexdigest()
+
+
+def _tenant(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _where(tenant: str, fingerprint: str, model: str, sheet: Optional[str]) -> dict:
+    return {
+        "$and": [
+            {"tenant": tenant},
+            {"fingerprint": fingerprint},
+            {"model": model},
+            {"sheet": sheet or ""},
+        ]
+    }
+
+
+def lookup(
+    question: str,
+    profile: dict,
+    code_source: str,
+    model: str,
+    sheet: Optional[str] = None,
+    api_key: str = "",
+) -> tuple:
+    """Find cached code for a question similar enough to question, stored under api_key.
+
+    Returns (hit, embedding): hit is {"id", "code", "score"} with the code
+    pointing at code_source, or None on a miss; embedding is the question's
+    embedding for a later put(), or None when embedding failed.
+    """
+    try:
+        embedding = get_embedding(normalize_question(question))
+        where = _where(_tenant(api_key), schema_fingerprint(profile), model, sheet)
+        matches = vector_db.search_code_examples(embedding, where)
+    except Exception as e:
+        _count("errors")
+        log.warning("Code cache lookup failed: %s", e)
+        return None, None
+    if not matches or matches[0]["score"] < _threshold():
+        _count("misses")
+        return None, embedding
+    best = matches[0]
+    _count("hits")
+    log.info(
+        "Code cache hit for %r (score %.3f, cached for %r)",
+        question, best["score"], best["meta"].get("question"),
+    )
+    code = best["code"].replace(_SOURCE_PLACEHOLDER, code_source)
+    return {"id": best["id"], "code": code, "score": best["score"]}, embedding
+
+
+def put(
+    question: str,
+    profile: dict,
+    code_source: str,
+    model: str,
+    code: str,
+    embedding: Optional[list] = None,
+    sheet: Optional[str] = None,
+    api_key: str = "",
+) -> None:
+    """Store code that produced a summary for question, visible only to api_key.
+
+    embedding is the one lookup() returned; it is computed when missing.
+    Code that does not mention code_source is not stored: it reads its data
+    from somewhere else and could not be pointed at another dataset.
+    """
+    if not code_source or code_source not in code:
+        return
+    tenant = _tenant(api_key)
+    fingerprint = schema_fingerprint(profile)
+    question = normalize_question(question)
+    entry_id = hashlib.sha256(
+        json.dumps([tenant, fingerprint, model, sheet or "", question]).encode("utf-8")
+    ).hexdigest()
+    try:
+        if embedding is None:
+            embedding = get_embedding(question)
+        vector_db.add_code_example(
+            entry_id,
+            question,
+            code.replace(code_source, _SOURCE_PLACEHOLDER),
+            embedding,
+            {"tenant": tenant, "fingerprint": fingerprint, "model": model, "sheet": sheet or ""},
+        )
+    except Exception as e:
+        _count("errors")
+        log.warning("Code cache write failed: %s", e)
+        return
+    _count("writes")
+
+
+def discard(entry_id: str) -> None:
+    """Drop an entry whose code no longer produces a summary."""
+    try:
+        vector_db.delete_code_example(entry_id)
+    except Exception as e:
+        _count("errors")
+        log.warning("Code cache delete failed: %s", e)
+        return
+    _count("discarded")
+
+
+def stats() -> dict:
+    with _lock:
+        counters = dict(_counters)
+    entries = 0
+    if enabled():
+        try:
+            entries = vector_db.count_code_examples()
+        except Exception as e:
+            log.warning("Code cache stats failed: %s", e)
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        "enabled": enabled(),
+        "threshold": _threshold(),
+        "entries": entries,
+        **counters,
+        "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+    }
+
+
+def _reset() -> None:
+    """Zero the counters. For use in tests only."""
+    with _lock:
+        for name in _counters:
+            _counters[name] = 0
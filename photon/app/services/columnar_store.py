@@ -0,0 +1,115 @@
+"""
+Columnar copies of parsed datasets, keyed by content digest.
+
+A dataset is parsed from CSV/Excel once and written as an uncompressed Arrow
+IPC file under PHOTON_COLUMNAR_DIR. Later loads memory-map that file instead
+of parsing again and can read just the columns they need.
+
+Keys start with the digest of the bytes they were parsed from: the digest
+itself for a whole file, "<digest>-<suffix>" for one sheet of a workbook.
+delete() removes every copy derived from a digest, so dropping an upload
+or cached download never leaves per-sheet copies behind.
+
+pyarrow is optional: without it every call reports a miss and writes are
+skipped, so callers always fall back to parsing the original bytes.
+"""
+
+import glob
+import logging
+import os
+import tempfile
+import threading
+from typing import List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as paipc
+except Exception:
+    pa = None
+    paipc = None
+
+log = logging.getLogger(__name__)
+
+
+def _dir() -> str:
+    return os.environ.get(
+        "PHOTON_COLUMNAR_DIR", os.path.join(tempfile.gettempdir(), "photon", "columnar")
+    )
+
+
+def path_for(key: str) -> str:
+    return os.path.join(_dir(), f"{key}.arrow")
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def exists(key: str) -> bool:
+    return pa is not None and os.path.exists(path_for(key))
+
+
+def write(key: str, df: pd.DataFrame) -> bool:
+    """Persist df as an Arrow IPC file. Returns False if the frame cannot be converted."""
+    if pa is None:
+        return False
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        # Object columns holding mixed Python types have no Arrow equivalent.
+        log.info("Skipping columnar copy for %s: %s", key, e)
+        return False
+    path = path_for(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with pa.OSFile(tmp, "wb") as sink:
+            with paipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning("Columnar write failed for %s: %s", key, e)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def read(key: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """Memory-map the columnar copy of key, optionally projecting to columns.
+
+    Returns None when there is no columnar copy.
+    """
+    if not exists(key):
+        return None
+    try:
+        with pa.memory_map(path_for(key), "r") as source:
+            table = paipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid) as e:
+        log.warning("Columnar read failed for %s: %s", key, e)
+        return None
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def files_for(digest: str) -> List[str]:
+    """Paths of all columnar copies derived from digest (the whole file and any sheets)."""
+    paths = glob.glob(os.path.join(glob.escape(_dir()), f"{glob.escape(digest)}-*.arrow"))
+    whole = path_for(digest)
+    if os.path.exists(whole):
+        paths.append(whole)
+    return paths
+
+
+def delete(digest: str) -> None:
+    """Remove every columnar copy derived from digest."""
+    for path in files_for(digest):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,90 @@
+"""
+Lossless dtype compaction for freshly loaded DataFrames.
+
+Parsers hand back every string column as object and every number as 64-bit.
+compact_dtypes() rewrites columns in place of that:
+- integers are downcast to the smallest integer type holding their range;
+- floats become float32 only when every value survives the round trip;
+- low-cardinality string columns become category;
+- other string columns become Arrow-backed strings when pyarrow is installed.
+
+Columns mixing strings with other Python objects are left alone, so values
+never change, only their representation.
+"""
+
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+
+    _ARROW_STRINGS = True
+except Exception:
+    _ARROW_STRINGS = False
+
+log = logging.getLogger(__name__)
+
+# A string column becomes category when distinct values are at most this share of rows.
+_CATEGORY_MAX_RATIO = 0.5
+
+_totals_lock = threading.Lock()
+_totals = {"frames": 0, "bytes_before": 0, "bytes_after": 0}
+
+
+def _compact_column(series: pd.Series) -> pd.Series:
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return series
+    if pd.api.types.is_integer_dtype(dtype) and isinstance(dtype, np.dtype):
+        return pd.to_numeric(series, downcast="integer")
+    if pd.api.types.is_float_dtype(dtype) and dtype == np.float64:
+        narrowed = series.astype(np.float32)
+        if np.array_equal(narrowed.to_numpy(np.float64), series.to_numpy(), equal_nan=True):
+            return narrowed
+        return series
+    if dtype == object:
+        if pd.api.types.infer_dtype(series, skipna=True) != "string":
+            return series
+        non_null = int(series.notna().sum())
+        if non_null and series.nunique(dropna=True) <= _CATEGORY_MAX_RATIO * non_null:
+            return series.astype("category")
+        if _ARROW_STRINGS:
+            return series.astype("string[pyarrow]")
+    return series
+
+
+def compact_dtypes(df: pd.DataFrame) -> tuple:
+    """Return (compacted_df, report) where report holds bytes before/after and changed columns."""
+    before = int(df.memory_usage(index=True, deep=True).sum())
+    if df.columns.has_duplicates:
+        return df, {"bytes_before": before, "bytes_after": before, "columns": {}}
+    changed = {}
+    out = {}
+    for col in df.columns:
+        series = df[col]
+        compacted = _compact_column(series)
+        if compacted.dtype != series.dtype:
+            changed[str(col)] = f"{series.dtype} -> {compacted.dtype}"
+        out[col] = compacted
+    result = pd.DataFrame(out, index=df.index)
+    result.attrs = dict(df.attrs)
+    after = int(result.memory_usage(index=True, deep=True).sum())
+    report = {"bytes_before": before, "bytes_after": after, "columns": changed}
+    with _totals_lock:
+        _totals["frames"] += 1
+        _totals["bytes_before"] += before
+        _totals["bytes_after"] += after
+    log.info(
+        "Compacted DataFrame from %d to %d bytes (%d columns changed)",
+        before, after, len(changed),
+    )
+    return result, report
+
+
+def stats() -> dict:
+    """Cumulative bytes before/after compaction for this process."""
+    with _totals_lock:
+        return dict(_totals)
@@ -0,0 +1,68 @@
+"""
+Request-scoped time budget for the workflow pipeline.
+
+Clients give up after about 30 s, so work finishing later is wasted. The
+route starts a Deadline of PHOTON_REQUEST_BUDGET_SECONDS; each stage asks it
+how long it may take, and optional stages are skipped when too little is
+left. Like metrics.Timings, the current Deadline lives in a context
+variable, so services reached through executor threads (HTTP fetches,
+waits on pre-processing jobs) see it too. Speculative runs start their own
+budget; other work outside a request, such as background pre-processing,
+has no deadline.
+"""
+
+import math
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+_DEFAULT_BUDGET_SECONDS = 28.0
+# Timeouts handed to downstream calls never go below this: clients such as
+# requests reject a zero timeout outright instead of timing out.
+_MIN_TIMEOUT_SECONDS = 0.05
+
+
+class Deadline:
+    """A point in time by which a request must finish; None means unlimited."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.budget = seconds
+        self.expires = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        if self.expires is None:
+            return math.inf
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Timeout for a downstream call: the remaining budget, at most cap.
+
+        None when neither bounds it, i.e. keep the callee's own default.
+        Callers should check expired() first; once the budget is spent this
+        returns a small positive floor rather than 0.
+        """
+        if self.expires is None:
+            return cap
+        remaining = max(_MIN_TIMEOUT_SECONDS, self.remaining())
+        return remaining if cap is None else min(cap, remaining)
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("photon_deadline", default=None)
+
+
+def start(seconds: Optional[float] = None) -> Deadline:
+    """Start the budget for a request in the current context and return it."""
+    if seconds is None:
+        seconds = float(os.environ.get("PHOTON_REQUEST_BUDGET_SECONDS", _DEFAULT_BUDGET_SECONDS))
+    deadline = Deadline(seconds if seconds > 0 else None)
+    _current.set(deadline)
+    return deadline
+
+
+def current() -> Deadline:
+    """The current request's Deadline, or an unlimited one outside a request."""
+    return _current.get() or Deadline()
@@ -0,0 +1,304 @@
+"""
+Profiling of an in-memory DataFrame: column types, null ratios, distinct
+counts and the dataset summary the LLM prompts are built from.
+
+No I/O and no dependencies beyond pandas and sketches.py, so the Lambda
+sandbox ships this very module (aws/build_function.py) and its profiles
+match the API server's.
+"""
+
+import multiprocessing
+import os
+import re
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import pandas as pd
+
+from app.services.sketches import approx_distinct, reservoir_indices
+
+# Frames with more rows than this are profiled from a reservoir sample.
+_SAMPLE_THRESHOLD = 1_000_000
+_SAMPLE_SIZE = 100_000
+_ESTIMATED_FIELDS = ["null_pct", "n_unique", "dtype"]
+
+# Narrower frames are profiled serially; pool overhead outweighs the gain.
+_PARALLEL_MIN_COLUMNS = 16
+
+# A string column is a datetime column when more than this share of it parses.
+_DATETIME_MIN_RATIO = 0.8
+_DATETIME_SNIFF_SIZE = 200
+# Tried in order against the sniff sample; "ISO8601" covers dates, datetimes
+# and timezone offsets in a single vectorized pass.
+_DATETIME_FORMATS = [
+    "ISO8601",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y %H:%M:%S",
+    "%Y/%m/%d",
+    "%Y/%m/%d %H:%M:%S",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%d %b %Y",
+    "%d %B %Y",
+    "%b %d, %Y",
+    "%B %d, %Y",
+    "%b %Y",
+    "%B %Y",
+]
+# Literal characters each explicit format needs; a format is only tried when
+# all of them occur in the sniff sample.
+_FORMAT_LITERALS = {fmt: set(re.sub(r"%.", "", fmt)) for fmt in _DATETIME_FORMATS[1:]}
+_MONTH_OR_DAY = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?"
+# How a date starts: digits then a date separator, a day then a month name,
+# a month or weekday name then a number, or a compact ISO date. Codes such as
+# "EQ-007", "cat-3" and "Line 1" fail this before any parse is attempted.
+_DATE_SHAPE = re.compile(
+    rf"^\s*(?:\d{{1,4}}[-/. ]\d{{1,2}}"
+    rf"|\d{{1,2}}[-/. ]?{_MONTH_OR_DAY}"
+    rf"|{_MONTH_OR_DAY},?\s+(?:\d|{_MONTH_OR_DAY})"
+    rf"|\d{{8}}(?:$|[T ]))",
+    re.IGNORECASE,
+)
+
+
+def _parse_ratio(series: pd.Series, fmt: str) -> float:
+    """Fraction of series (nulls included) that parses as a datetime with fmt."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        parsed = pd.to_datetime(series, errors="coerce", format=fmt)
+    return float(parsed.notna().mean())
+
+
+def _looks_like_datetime(series: pd.Series) -> bool:
+    """Decide whether a string column holds dates, i.e. more than 80% of it parses.
+
+    Staged so that most columns never reach a full element-by-element parse:
+    1. reject when too many nulls, non-string values or strings that do not
+       start like a date (codes, free text) appear in a small sniff sample;
+    2. try the known explicit formats whose separators occur in the sample
+       and confirm the winner with one vectorized parse of the whole column;
+    3. only columns whose sample parses with format="mixed" but matches no
+       known format pay for a full mixed parse.
+    """
+    if len(series) == 0:
+        return False
+    non_null = series.dropna()
+    if len(non_null) <= _DATETIME_MIN_RATIO * len(series):
+        return False
+
+    sniff = non_null.head(_DATETIME_SNIFF_SIZE)
+    if not sniff.map(lambda v: isinstance(v, str)).all():
+        # datetime/date objects or mixed types: keep the general parser.
+        return _parse_ratio(series, "mixed") > _DATETIME_MIN_RATIO
+    plausible = sniff.str.len().between(4, 40) & sniff.str.match(_DATE_SHAPE)
+    if plausible.mean() <= _DATETIME_MIN_RATIO:
+        return False
+
+    seen = set("".join(sniff))
+    formats = [_DATETIME_FORMATS[0]] + [
+        fmt for fmt, literals in _FORMAT_LITERALS.items() if literals <= seen
+    ]
+    best_fmt, best_ratio = None, 0.0
+    for fmt in formats:
+        ratio = _parse_ratio(sniff, fmt)
+        if ratio > best_ratio:
+            best_fmt, best_ratio = fmt, ratio
+        if ratio == 1.0:
+            break
+    if best_ratio > _DATETIME_MIN_RATIO and _parse_ratio(series, best_fmt) > _DATETIME_MIN_RATIO:
+        return True
+
+    if _parse_ratio(sniff, "mixed") <= _DATETIME_MIN_RATIO:
+        return False
+    return _parse_ratio(series, "mixed") > _DATETIME_MIN_RATIO
+
+
+def _sampling_enabled(row_count: int, mode: str) -> bool:
+    if mode == "exact":
+        return False
+    if mode == "sampled":
+        return True
+    if mode != "auto":
+        raise ValueError(f"Unknown profile mode: {mode!r}")
+    threshold = int(os.environ.get("PHOTON_PROFILE_SAMPLE_THRESHOLD", _SAMPLE_THRESHOLD))
+    return row_count > threshold
+
+
+def _holds_text(dtype) -> bool:
+    """True for string columns in any of their forms: object, string, or the
+    string-valued category that compaction turns low-cardinality text into."""
+    if dtype == object or isinstance(dtype, pd.StringDtype):
+        return True
+    return isinstance(dtype, pd.CategoricalDtype) and not pd.api.types.is_numeric_dtype(
+        dtype.categories
+    )
+
+
+def _profile_column(col, series: pd.Series, full: Optional[pd.Series]) -> dict:
+    """Profile one column. series is the (possibly sampled) view; full is the
+    whole column when distinct counts must be sketched, else None."""
+    null_pct = round(float(series.isna().mean() * 100), 1)
+    if full is not None:
+        n_unique = approx_distinct(full)
+    else:
+        n_unique = int(series.nunique(dropna=True))
+    sample_values = [str(v) for v in series.dropna().head(3).tolist()]
+
+    if pd.api.types.is_numeric_dtype(series):
+        dtype_label = "numeric"
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        dtype_label = "datetime"
+    elif series.dtype == object or isinstance(series.dtype, pd.StringDtype):
+        dtype_label = "datetime" if _looks_like_datetime(series) else "string"
+    elif isinstance(series.dtype, pd.CategoricalDtype) and not pd.api.types.is_numeric_dtype(
+        series.cat.categories
+    ):
+        # Compacted string columns: classify as the original object column would be.
+        dtype_label = "datetime" if _looks_like_datetime(series.astype(object)) else "string"
+    else:
+        dtype_label = "string"
+
+    return {
+        "name": col,
+        "dtype": dtype_label,
+        "null_pct": null_pct,
+        "n_unique": n_unique,
+        "sample_values": sample_values,
+    }
+
+
+# Lazily created, process-wide pools for column-parallel profiling, one per
+# kind, each remembered with its worker count: {kind: (workers, pool)}.
+_pools: dict = {}
+_pool_lock = threading.Lock()
+
+
+def _process_context():
+    # The server is threaded, and a forked child can inherit a lock another
+    # thread held at fork time; forkserver (or spawn) starts clean processes.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_pool(kind: str, workers: int):
+    """Return the shared pool of this kind, rebuilt if the worker count changed."""
+    with _pool_lock:
+        cached = _pools.get(kind)
+        if cached is not None and cached[0] == workers:
+            return cached[1]
+        if kind == "process":
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=_process_context())
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photon-profile")
+        _pools[kind] = (workers, pool)
+    if cached is not None:
+        # Work already submitted to the old pool still finishes.
+        cached[1].shutdown(wait=False)
+    return pool
+
+
+def _profile_columns(df: pd.DataFrame, view: pd.DataFrame, sampled: bool) -> list:
+    """Profile every column, spreading the work over a pool on wide frames.
+
+    PHOTON_PROFILE_EXECUTOR selects "thread" (default), "process" or
+    "serial". Threads suit most frames because the pandas/NumPy kernels
+    release the GIL; "process" is used only when more than half of the
+    columns hold text (object, string or string category after compaction),
+    where per-element Python work holds the GIL.
+    PHOTON_PROFILE_WORKERS sets the pool size; a new value takes effect on
+    the next call. Process workers are started with forkserver (spawn where
+    unavailable), never forked from the threaded server. Output order always
+    follows df.columns, so the result is identical to a serial run.
+    """
+    names = list(df.columns)
+    args = [(col, view[col], df[col] if sampled else None) for col in names]
+    kind = os.environ.get("PHOTON_PROFILE_EXECUTOR", "thread")
+    workers = int(os.environ.get("PHOTON_PROFILE_WORKERS", min(8, os.cpu_count() or 1)))
+    if kind == "serial" or workers <= 1 or len(names) < _PARALLEL_MIN_COLUMNS:
+        return [_profile_column(*a) for a in args]
+    if kind == "process":
+        text_cols = sum(1 for dtype in view.dtypes if _holds_text(dtype))
+        if text_cols * 2 <= len(names):
+            kind = "thread"
+    pool = _get_pool(kind, workers)
+    return list(pool.map(_profile_column, *zip(*args)))
+
+
+def profile(df: pd.DataFrame, mode: str = "auto") -> dict:
+    """Inspect a DataFrame and return structured metadata about its content.
+
+    mode is "exact", "sampled", or "auto". Auto profiles exactly up to
+    PHOTON_PROFILE_SAMPLE_THRESHOLD rows and switches to sampled mode above
+    it: null ratios and dtypes come from a reservoir sample of
+    PHOTON_PROFILE_SAMPLE_SIZE rows, distinct counts from a HyperLogLog
+    sketch over the full column. Sampled profiles carry a "sampling" block
+    listing which figures are estimates; exact profiles have sampling=None.
+    """
+    row_count = len(df)
+    column_count = len(df.columns)
+
+    sampled = _sampling_enabled(row_count, mode)
+    sampling = None
+    view = df
+    if sampled:
+        sample_size = int(os.environ.get("PHOTON_PROFILE_SAMPLE_SIZE", _SAMPLE_SIZE))
+        view = df.iloc[reservoir_indices(row_count, sample_size)]
+        sampling = {
+            "method": "reservoir",
+            "sample_size": len(view),
+            "estimated_fields": list(_ESTIMATED_FIELDS),
+        }
+
+    columns = _profile_columns(df, view, sampled)
+    numeric_columns = [c["name"] for c in columns if c["dtype"] == "numeric"]
+    datetime_columns = [c["name"] for c in columns if c["dtype"] == "datetime"]
+
+    has_nulls = any(c["null_pct"] > 5.0 for c in columns)
+
+    if datetime_columns and numeric_columns:
+        data_type = "time_series"
+    elif column_count > 20 and row_count < 100:
+        data_type = "wide_format"
+    else:
+        data_type = "tabular"
+
+    null_count = sum(1 for c in columns if c["null_pct"] > 5.0)
+    type_label = data_type.replace("_", " ").title()
+    summary = (
+        f"{type_label} dataset with {row_count} rows, {column_count} columns"
+    )
+    type_mentions = []
+    if datetime_columns:
+        type_mentions.append("datetime")
+    if numeric_columns:
+        type_mentions.append("numeric")
+    if type_mentions:
+        summary += f", including {' and '.join(type_mentions)} columns"
+    summary += "."
+    if null_count:
+        summary += (
+            f" {null_count} column{'s' if null_count > 1 else ''} "
+            "have significant nulls."
+        )
+    if sampling:
+        summary += (
+            f" Column statistics are estimated from a {sampling['sample_size']}-row sample."
+        )
+
+    return {
+        "row_count": row_count,
+        "column_count": column_count,
+        "columns": columns,
+        "data_type": data_type,
+        "has_nulls": has_nulls,
+        "numeric_columns": numeric_columns,
+        "datetime_columns": datetime_columns,
+        "summary": summary,
+        "sampling": sampling,
+    }
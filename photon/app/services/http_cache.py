@@ -0,0 +1,298 @@
+"""
+On-disk HTTP cache for URL dataset sources.
+
+Each URL maps to two files under PHOTON_HTTP_CACHE_DIR, named by the
+SHA-256 of the URL:
+  <key>.body  raw response body
+  <key>.json  metadata: url, etag, last_modified, content_type, digest,
+              size, fetched_at, accessed_at
+
+Within PHOTON_HTTP_CACHE_TTL seconds of the last fetch an entry is served
+with no network traffic. After that it is revalidated with If-None-Match /
+If-Modified-Since, and a 304 only refreshes the timestamps. When the total
+size passes PHOTON_HTTP_CACHE_MAX_BYTES, least recently used entries are
+evicted together with their parsed columnar copies.
+
+Bodies are streamed to disk and hashed on the way, so the returned digest
+is available without reading the file again. Read them with open_body():
+a body open in this process is never evicted, and one that another worker
+evicted between fetch() and open_body() is fetched again. A columnar copy
+is only dropped once neither a cached URL nor an upload has its digest.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import BinaryIO
+
+import requests
+
+from app.services import columnar_store, upload_store
+
+log = logging.getLogger(__name__)
+
+_DEFAULT_TTL_SECONDS = 3600
+_DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+_CHUNK_BYTES = 1024 * 1024
+
+_url_locks: dict = {}
+_url_locks_guard = threading.Lock()
+_stats_lock = threading.Lock()
+# Body paths with open readers in this process; _evict() leaves them alone.
+_pins: Counter = Counter()
+_pins_lock = threading.Lock()
+_stats = {"fresh_hits": 0, "revalidated": 0, "downloads": 0, "stale_served": 0, "evictions": 0}
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    path: str
+    digest: str
+    content_type: str
+
+
+def _dir() -> str:
+    return os.environ.get(
+        "PHOTON_HTTP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "photon", "http")
+    )
+
+
+def _ttl() -> float:
+    return float(os.environ.get("PHOTON_HTTP_CACHE_TTL", _DEFAULT_TTL_SECONDS))
+
+
+def _max_bytes() -> int:
+    return int(os.environ.get("PHOTON_HTTP_CACHE_MAX_BYTES", _DEFAULT_MAX_BYTES))
+
+
+def _paths(url: str) -> tuple:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    base = os.path.join(_dir(), key)
+    return f"{base}.body", f"{base}.json"
+
+
+def _lock_for(url: str) -> threading.Lock:
+    with _url_locks_guard:
+        return _url_locks.setdefault(url, threading.Lock())
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _read_meta(meta_path: str):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path: str, meta: dict) -> None:
+    tmp = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+def _response(meta: dict, body_path: str) -> CachedResponse:
+    return CachedResponse(meta["url"], body_path, meta["digest"], meta.get("content_type", ""))
+
+
+def fetch(url: str, timeout: float = 30) -> CachedResponse:
+    """Return a local copy of url, downloading or revalidating only when needed.
+
+    Raises ValueError if the URL cannot be fetched and nothing is cached.
+    """
+    body_path, meta_path = _paths(url)
+    os.makedirs(_dir(), exist_ok=True)
+    with _lock_for(url):
+        meta = _read_meta(meta_path)
+        if meta is not None and not os.path.exists(body_path):
+            meta = None
+        now = time.time()
+
+        if meta is not None and now - meta["fetched_at"] < _ttl():
+            meta["accessed_at"] = now
+            _write_meta(meta_path, meta)
+            _count("fresh_hits")
+            return _response(meta, body_path)
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            resp = requests.get(url, timeout=timeout, stream=True, headers=headers)
+            if resp.status_code == 304 and meta is not None:
+                resp.close()
+                meta["fetched_at"] = meta["accessed_at"] = now
+                _write_meta(meta_path, meta)
+                _count("revalidated")
+                return _response(meta, body_path)
+            resp.raise_for_status()
+            previous = meta["digest"] if meta is not None else None
+            meta = _store_body(url, resp, body_path, meta_path, now)
+            if previous is not None and previous != meta["digest"]:
+                _drop_columnar_if_unused(previous)
+        except requests.RequestException as e:
+            if meta is not None:
+                log.warning("Revalidation of %s failed (%s); serving cached copy", url, e)
+                _count("stale_served")
+                return _response(meta, body_path)
+            raise ValueError(f"Failed to fetch URL: {e}")
+
+    _count("downloads")
+    _evict(keep=meta_path)
+    return _response(meta, body_path)
+
+
+def _store_body(url: str, resp, body_path: str, meta_path: str, now: float) -> dict:
+    h = hashlib.sha256()
+    size = 0
+    tmp = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with resp, open(tmp, "wb") as out:
+            for block in resp.iter_content(chunk_size=_CHUNK_BYTES):
+                h.update(block)
+                size += len(block)
+                out.write(block)
+        os.replace(tmp, body_path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    meta = {
+        "url": url,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "content_type": resp.headers.get("Content-Type", ""),
+        "digest": h.hexdigest(),
+        "size": size,
+        "fetched_at": now,
+        "accessed_at": now,
+    }
+    _write_meta(meta_path, meta)
+    return meta
+
+
+def _entries() -> list:
+    """All (meta_path, meta) pairs currently on disk."""
+    try:
+        names = os.listdir(_dir())
+    except OSError:
+        return []
+    out = []
+    for name in names:
+        if name.endswith(".json"):
+            path = os.path.join(_dir(), name)
+            meta = _read_meta(path)
+            if meta is not None:
+                out.append((path, meta))
+    return out
+
+
+def _entry_bytes(meta: dict) -> int:
+    size = meta.get("size", 0)
+    for path in columnar_store.files_for(meta["digest"]):
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+    return size
+
+
+def references(digest: str) -> bool:
+    """True while any cached URL body has this digest."""
+    return any(m["digest"] == digest for _, m in _entries())
+
+
+def _drop_columnar_if_unused(digest: str) -> None:
+    """Delete digest's columnar copies once no cached URL or upload has that content."""
+    if not references(digest) and not upload_store.references(digest):
+        columnar_store.delete(digest)
+
+
+def _unpin(body_path: str) -> None:
+    with _pins_lock:
+        _pins[body_path] -= 1
+        if _pins[body_path] <= 0:
+            del _pins[body_path]
+
+
+def open_body(url: str, body_path: str, digest: str) -> BinaryIO:
+    """Open a body returned by fetch(), pinned against eviction until closed.
+
+    A body evicted since fetch() returned it is fetched again; raises
+    ValueError if the URL's content changed in the meantime.
+    """
+    for _ in range(2):
+        with _pins_lock:
+            try:
+                reader = upload_store.NotifyingReader(body_path, lambda: _unpin(body_path))
+            except FileNotFoundError:
+                pass
+            else:
+                _pins[body_path] += 1
+                return reader
+        refetched = fetch(url)
+        if refetched.digest != digest:
+            raise ValueError(f"{url} changed while it was being read; try again")
+        body_path = refetched.path
+    raise ValueError(f"{url} was evicted from the HTTP cache while it was being read")
+
+
+def _evict(keep: str) -> None:
+    """Drop least recently used entries until the cache fits its byte budget."""
+    entries = _entries()
+    total = sum(_entry_bytes(m) for _, m in entries)
+    limit = _max_bytes()
+    if total <= limit:
+        return
+    entries.sort(key=lambda e: e[1].get("accessed_at", 0))
+    live_digests = Counter(m["digest"] for _, m in entries)
+    for meta_path, meta in entries:
+        if total <= limit:
+            break
+        if meta_path == keep:
+            continue
+        body_path = meta_path[: -len(".json")] + ".body"
+        with _pins_lock:
+            if _pins[body_path]:
+                continue
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        total -= _entry_bytes(meta)
+        live_digests[meta["digest"]] -= 1
+        if live_digests[meta["digest"]] == 0 and not upload_store.references(meta["digest"]):
+            columnar_store.delete(meta["digest"])
+        _count("evictions")
+
+
+def stats() -> dict:
+    entries = _entries()
+    with _stats_lock:
+        out = dict(_stats)
+    out.update({
+        "entries": len(entries),
+        "bytes": sum(_entry_bytes(m) for _, m in entries),
+        "max_bytes": _max_bytes(),
+        "ttl_seconds": _ttl(),
+    })
+    return out
@@ -1,9 +1,21 @@
+import asyncio
+import base64
 import json
 import logging
+import os
+import threading
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 import boto3
 
+try:
+    from aiobotocore import session as aiobotocore_session
+except Exception:
+    aiobotocore_session = None
+
 from app.services import upload_store
 
 log = logging.getLogger(__name__)
@@ -11,37 +23,118 @@ log = logging.getLogger(__name__)
 _FUNCTION_NAME = "photon-code-executor"
 _REGION = "us-east-1"
 
+# Synchronous Lambda invocations accept at most 6 MB of request payload.
+_PAYLOAD_LIMIT_BYTES = 6 * 1024 * 1024
+_DEFAULT_STAGE_BYTES = 64 * 1024 * 1024
+_DEFAULT_CONCURRENCY = 32
+# Forwarded to the sandbox so it loads and samples datasets like this server.
+_PROFILE_SETTINGS = (
+    "PHOTON_LOAD_MAX_MB",
+    "PHOTON_COMPACT_DTYPES",
+    "PHOTON_PROFILE_SAMPLE_THRESHOLD",
+    "PHOTON_PROFILE_SAMPLE_SIZE",
+)
 
-def execute_via_lambda(code: str, source: str = "") -> dict:
-    """Send code to the Lambda sandbox and return the execution result.
+_client_lock = threading.Lock()
+_boto_client = None
+_pool = None
 
-    Returns a dict with keys: stdout, stderr, exit_code, output_image (str|None).
-    Raises RuntimeError if Lambda cannot be reached (caller maps this to 503).
+
+class _AioClient:
+    """The aiobotocore Lambda client of one event loop, opened on first use."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.lock = asyncio.Lock()
+        self.context = None
+        self.client = None
+
+
+_aio: Optional[_AioClient] = None
+
+# Base64 file payloads prepared ahead of execution, keyed by content digest.
+_staged: "OrderedDict[str, str]" = OrderedDict()
+_staged_bytes = 0
+_staged_lock = threading.Lock()
+
+
+def stage_upload(upload_id: str) -> bool:
+    """Encode an upload's payload ahead of time so execution can skip it.
+
+    Returns False when the upload is too large for a synchronous Lambda
+    payload. Staged payloads are kept LRU within PHOTON_LAMBDA_STAGE_BYTES.
+    Raises KeyError if the upload does not exist.
     """
-    client = boto3.client("lambda", region_name=_REGION)
-    job_id = str(uuid.uuid4())
+    global _staged_bytes
+    meta = upload_store.metadata(upload_id)
+    digest = meta["sha256"]
+    with _staged_lock:
+        if digest in _staged:
+            _staged.move_to_end(digest)
+            return True
+    with upload_store.open_content(upload_id) as f:
+        raw = f.read(_PAYLOAD_LIMIT_BYTES + 1)
+    if 4 * ((len(raw) + 2) // 3) > _PAYLOAD_LIMIT_BYTES:
+        return False
+    encoded = base64.b64encode(raw).decode("ascii")
+    limit = int(os.environ.get("PHOTON_LAMBDA_STAGE_BYTES", _DEFAULT_STAGE_BYTES))
+    with _staged_lock:
+        if digest not in _staged:
+            _staged[digest] = encoded
+            _staged_bytes += len(encoded)
+        while _staged_bytes > limit and _staged:
+            _, dropped = _staged.popitem(last=False)
+            _staged_bytes -= len(dropped)
+    return True
+
+
+def _file_payload(upload_id: str) -> tuple:
+    """(base64 content, extension) for an upload, from the staging cache when possible."""
+    meta = upload_store.metadata(upload_id)
+    with _staged_lock:
+        encoded = _staged.get(meta.get("sha256"))
+    if encoded is None:
+        # The store holds raw bytes; the JSON payload is the only place needing base64.
+        encoded = base64.b64encode(upload_store.get(upload_id)["content"]).decode("ascii")
+    return encoded, meta["extension"]
+
+
+def sandbox_profile_enabled(source: str) -> bool:
+    """Whether source is profiled inside the Lambda sandbox instead of on this server.
 
+    With PHOTON_SANDBOX_PROFILE=1, http(s) datasets are downloaded and parsed
+    only by the sandbox, which keeps the file in its /tmp for the execution
+    that follows; the server never holds the dataset.
+    """
+    return os.environ.get("PHOTON_SANDBOX_PROFILE", "0") == "1" and source.startswith(
+        ("http://", "https://")
+    )
+
+
+def _build_payload(code: str, source: str) -> tuple:
+    """Return (job_id, JSON payload) for an invocation."""
+    job_id = str(uuid.uuid4())
     payload: dict = {"code": code, "job_id": job_id}
 
+    # Sandbox-profiled URLs: the code reads the sandbox's local copy, which
+    # the handler re-downloads first if this container has not seen it.
+    if sandbox_profile_enabled(source):
+        payload["source_url"] = source
+
     # For uploaded files, embed the file content so Lambda can write it to /tmp
     if source.startswith("photon-upload://"):
         upload_id = source.removeprefix("photon-upload://")
         try:
-            data = upload_store.get(upload_id)
-            payload["file_content"] = data["content"]
-            payload["file_extension"] = data["extension"]
+            payload["file_content"], payload["file_extension"] = _file_payload(upload_id)
         except KeyError:
             log.error("Upload %s not found when building Lambda payload", upload_id)
 
-    response = client.invoke(
-        FunctionName=_FUNCTION_NAME,
-        InvocationType="RequestResponse",
-        Payload=json.dumps(payload),
-    )
+    return job_id, json.dumps(payload)
 
-    if response.get("FunctionError"):
-        raw = json.loads(response["Payload"].read())
-        error_msg = raw.get("errorMessage", "Lambda execution error")
+
+def _parse_result(job_id: str, function_error, raw: bytes) -> dict:
+    if function_error:
+        error_msg = json.loads(raw).get("errorMessage", "Lambda execution error")
         log.error("Lambda FunctionError for job %s: %s", job_id, error_msg)
         return {
             "stdout": "",
@@ -49,6 +142,132 @@ def execute_via_lambda(code: str, source: str = "") -> dict:
             "exit_code": 1,
             "output_image": None,
         }
-
-    result = json.loads(response["Payload"].read())
+    result = json.loads(raw)
     return json.loads(result["body"])
+
+
+def _client():
+    """boto3 clients are thread-safe and slow to build, so one is shared per process."""
+    global _boto_client
+    with _client_lock:
+        if _boto_client is None:
+            _boto_client = boto3.client("lambda", region_name=_REGION)
+        return _boto_client
+
+
+def _invoke(payload: str):
+    """Invoke the sandbox synchronously; returns (FunctionError, raw response payload)."""
+    response = _client().invoke(
+        FunctionName=_FUNCTION_NAME,
+        InvocationType="RequestResponse",
+        Payload=payload,
+    )
+    return response.get("FunctionError"), response["Payload"].read()
+
+
+def execute_via_lambda(code: str, source: str = "") -> dict:
+    """Send code to the Lambda sandbox and return the execution result.
+
+    Returns a dict with keys: stdout, stderr, exit_code, output_image (str|None).
+    Raises RuntimeError if Lambda cannot be reached (caller maps this to 503).
+    """
+    job_id, payload = _build_payload(code, source)
+    return _parse_result(job_id, *_invoke(payload))
+
+
+def profile_via_lambda(source: str, sheet: Optional[str] = None) -> dict:
+    """Have the sandbox download and profile a URL dataset.
+
+    Returns {"profile", "digest", "path"}: the profile in profiler.profile()'s
+    shape, the SHA-256 of the file and the sandbox-local path the generated
+    code should read. Raises ValueError when the sandbox cannot fetch or
+    parse the dataset, RuntimeError when the function itself fails.
+    """
+    settings = {name: os.environ[name] for name in _PROFILE_SETTINGS if name in os.environ}
+    payload = json.dumps(
+        {"action": "profile", "source_url": source, "sheet": sheet, "settings": settings}
+    )
+    function_error, raw = _invoke(payload)
+    if function_error:
+        error_msg = json.loads(raw).get("errorMessage", "Lambda execution error")
+        raise RuntimeError(f"Sandbox profiling failed: {error_msg}")
+    result = json.loads(raw)
+    body = json.loads(result["body"])
+    if result.get("statusCode") != 200:
+        raise ValueError(body.get("error", "Sandbox could not profile the dataset"))
+    return body
+
+
+def _invoke_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _client_lock:
+        if _pool is None:
+            workers = int(os.environ.get("PHOTON_LAMBDA_CONCURRENCY", _DEFAULT_CONCURRENCY))
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photon-lambda")
+        return _pool
+
+
+async def execute_via_lambda_async(
+    code: str, source: str = "", timeout: Optional[float] = None
+) -> dict:
+    """Async execute_via_lambda().
+
+    Uses aiobotocore when installed. Otherwise the blocking boto3 call runs on
+    a dedicated pool of PHOTON_LAMBDA_CONCURRENCY threads, so long Lambda
+    waits never occupy the server's shared request threadpool.
+
+    timeout (seconds) stops waiting for the result and raises TimeoutError.
+    A boto3 call already running keeps its pool thread until it returns.
+    """
+    return await asyncio.wait_for(_invoke_async(code, source), timeout)
+
+
+async def profile_via_lambda_async(
+    source: str, sheet: Optional[str] = None, timeout: Optional[float] = None
+) -> dict:
+    """Async profile_via_lambda(), run on the Lambda invocation pool."""
+    loop = asyncio.get_running_loop()
+    call = loop.run_in_executor(_invoke_pool(), profile_via_lambda, source, sheet)
+    return await asyncio.wait_for(call, timeout)
+
+
+async def _invoke_async(code: str, source: str) -> dict:
+    if aiobotocore_session is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_invoke_pool(), execute_via_lambda, code, source)
+
+    job_id, payload = await asyncio.get_running_loop().run_in_executor(
+        _invoke_pool(), _build_payload, code, source
+    )
+    client = await _aio_client()
+    response = await client.invoke(
+        FunctionName=_FUNCTION_NAME,
+        InvocationType="RequestResponse",
+        Payload=payload,
+    )
+    async with response["Payload"] as stream:
+        raw = await stream.read()
+    return _parse_result(job_id, response.get("FunctionError"), raw)
+
+
+async def _aio_client():
+    """The shared aiobotocore client for the running loop; it keeps its connection pool."""
+    global _aio
+    loop = asyncio.get_running_loop()
+    if _aio is None or _aio.loop is not loop:
+        _aio = _AioClient(loop)
+    state = _aio
+    async with state.lock:
+        if state.client is None:
+            session = aiobotocore_session.get_session()
+            state.context = session.create_client("lambda", region_name=_REGION)
+            state.client = await state.context.__aenter__()
+    return state.client
+
+
+async def close_async_client() -> None:
+    """Close the shared aiobotocore client, if one is open. Called at app shutdown."""
+    global _aio
+    state, _aio = _aio, None
+    if state is not None and state.context is not None:
+        await state.context.__aexit__(None, None, None)
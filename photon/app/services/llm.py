@@ -1,54 +1,129 @@
+import json
 import os
 import re
+import threading
+from typing import Optional
 
 import anthropic
 
+MODEL = "claude-sonnet-4-6"
+
+# Fallback follow-up questions per profiler data type.
+_DEFAULT_SUGGESTIONS = {
+    "tabular": [
+        "Show top 10 rows by highest value",
+        "Which category performs worst?",
+        "Show distribution of each numeric column",
+    ],
+    "time_series": [
+        "Show seasonal patterns across years",
+        "Forecast the next 3 periods",
+        "Find anomalies in the trend",
+    ],
+    "wide_format": [
+        "Show correlation matrix between columns",
+        "Which features have the most variance?",
+        "Cluster similar rows together",
+    ],
+}
+
+# One async client per API key, so concurrent requests share a connection pool.
+_async_clients: dict = {}
+_async_clients_lock = threading.Lock()
+
+
+def default_suggestions(data_type: str) -> list:
+    """The canned follow-up questions for a profiler data type."""
+    return list(_DEFAULT_SUGGESTIONS.get(data_type, _DEFAULT_SUGGESTIONS["tabular"]))
+
+
+def _require_api_key() -> str:
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        raise ValueError(
+            "ANTHROPIC_API_KEY not set. Add it to your .env file. "
+            "See .env.example for the format."
+        )
+    return api_key
+
+
+def _timeout_kwargs(timeout: Optional[float]) -> dict:
+    """Per-call timeout for the async client; None keeps the client default."""
+    return {} if timeout is None else {"timeout": timeout}
+
+
+def _async_client(api_key: str) -> "anthropic.AsyncAnthropic":
+    with _async_clients_lock:
+        client = _async_clients.get(api_key)
+        if client is None:
+            client = _async_clients[api_key] = anthropic.AsyncAnthropic(api_key=api_key)
+        return client
+
 
-def generate_analysis_code(
+async def generate_analysis_code_async(
     question: str,
     profile: dict,
     playbook: str,
     source: str,
     conversation_history: list = [],
+    sheet: str = None,
+    timeout: Optional[float] = None,
 ) -> str:
     """Generate dashboard analysis code grounded in profile, methodology, and conversation history.
 
+    sheet names the worksheet to read when source is an Excel workbook.
+    timeout (seconds) bounds the API call, e.g. to a request's remaining budget.
+    Calls share one AsyncAnthropic client per API key.
+
     Raises ValueError if ANTHROPIC_API_KEY is not set.
     Returns a clean Python code string with no markdown fences.
     """
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        raise ValueError(
-            "ANTHROPIC_API_KEY not set. Add it to your .env file. "
-            "See .env.example for the format."
-        )
-
-    prompt = _build_code_prompt(question, profile, playbook, source, conversation_history)
-    client = anthropic.Anthropic(api_key=api_key)
-    message = client.messages.create(
-        model="claude-sonnet-4-6",
+    api_key = _require_api_key()
+    prompt = _build_code_prompt(question, profile, playbook, source, conversation_history, sheet)
+    message = await _async_client(api_key).messages.create(
+        model=MODEL,
         max_tokens=4000,
         messages=[{"role": "user", "content": prompt}],
+        **_timeout_kwargs(timeout),
     )
-    raw = message.content[0].text
-    return _strip_fences(raw)
+    return strip_fences(message.content[0].text)
 
 
-def generate_insight_narrative(
+async def stream_analysis_code(
     question: str,
     profile: dict,
-    kpi_cards: list,
-    anomalies: list,
+    playbook: str,
+    source: str,
     conversation_history: list = [],
-) -> str:
-    """Generate a plain-English insight narrative from execution results.
+    sheet: str = None,
+    timeout: Optional[float] = None,
+):
+    """Stream generate_analysis_code_async() output as raw text deltas.
 
-    Returns empty string on any failure — never crashes the main pipeline.
+    The deltas still include any markdown fences; join them and pass the
+    result through strip_fences() for the runnable code.
+
+    Raises ValueError if ANTHROPIC_API_KEY is not set.
     """
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        return ""
+    api_key = _require_api_key()
+    prompt = _build_code_prompt(question, profile, playbook, source, conversation_history, sheet)
+    async with _async_client(api_key).messages.stream(
+        model=MODEL,
+        max_tokens=4000,
+        messages=[{"role": "user", "content": prompt}],
+        **_timeout_kwargs(timeout),
+    ) as stream:
+        async for text in stream.text_stream:
+            yield text
 
+
+def _build_insight_prompt(
+    question: str,
+    profile: dict,
+    kpi_cards: list,
+    anomalies: list,
+    conversation_history: list,
+) -> str:
     kpi_lines = "\n".join(
         f"- {k.get('label', '')}: {k.get('value', '')} ({k.get('delta', '')})"
         for k in kpi_cards
@@ -73,7 +148,7 @@ def generate_insight_narrative(
         if lines:
             history_block = "Prior conversation context:\n" + "\n".join(lines) + "\n\n"
 
-    prompt = f"""{history_block}You are a senior data analyst presenting findings to a business stakeholder.
+    return f"""{history_block}You are a senior data analyst presenting findings to a business stakeholder.
 
 Question asked: {question}
 Dataset: {profile.get("summary", "")}
@@ -97,59 +172,44 @@ Rules:
 - Do not start with "Based on" or "The analysis shows"
 - Be direct and confident"""
 
-    try:
-        client = anthropic.Anthropic(api_key=api_key)
-        message = client.messages.create(
-            model="claude-sonnet-4-6",
-            max_tokens=300,
-            messages=[{"role": "user", "content": prompt}],
-        )
-        return message.content[0].text.strip()
-    except Exception:
-        return ""
-
 
-def generate_follow_up_suggestions(
+async def generate_insight_narrative_async(
     question: str,
     profile: dict,
     kpi_cards: list,
-) -> list:
-    """Generate 3 natural follow-up questions based on the analysis performed.
+    anomalies: list,
+    conversation_history: list = [],
+    timeout: Optional[float] = None,
+) -> str:
+    """Generate a plain-English insight narrative from execution results.
 
-    Returns safe defaults per data type on any failure.
+    Returns empty string on any failure — never crashes the main pipeline.
     """
     api_key = os.environ.get("ANTHROPIC_API_KEY")
-    data_type = profile.get("data_type", "tabular")
-
-    _defaults = {
-        "tabular": [
-            "Show top 10 rows by highest value",
-            "Which category performs worst?",
-            "Show distribution of each numeric column",
-        ],
-        "time_series": [
-            "Show seasonal patterns across years",
-            "Forecast the next 3 periods",
-            "Find anomalies in the trend",
-        ],
-        "wide_format": [
-            "Show correlation matrix between columns",
-            "Which features have the most variance?",
-            "Cluster similar rows together",
-        ],
-    }
-    defaults = _defaults.get(data_type, _defaults["tabular"])
-
     if not api_key:
-        return defaults
+        return ""
+
+    prompt = _build_insight_prompt(question, profile, kpi_cards, anomalies, conversation_history)
+    try:
+        message = await _async_client(api_key).messages.create(
+            model=MODEL,
+            max_tokens=300,
+            messages=[{"role": "user", "content": prompt}],
+            **_timeout_kwargs(timeout),
+        )
+        return message.content[0].text.strip()
+    except Exception:
+        return ""
 
+
+def _build_suggestion_prompt(question: str, profile: dict, kpi_cards: list) -> str:
     kpi_summary = ", ".join(
         f"{k.get('label', '')}: {k.get('value', '')}" for k in kpi_cards
     ) or "no metrics extracted"
 
     col_names = [c["name"] for c in profile.get("columns", [])][:6]
 
-    prompt = f"""Given this data analysis:
+    return f"""Given this data analysis:
 Question: {question}
 Data: {profile.get("summary", "")}
 Columns: {", ".join(col_names)}
@@ -164,18 +224,38 @@ Each must:
 Return ONLY a JSON array of 3 strings. No other text.
 Example: ["Which month has highest sales?", "Compare Q1 vs Q2 performance", "Show outliers in revenue column"]"""
 
+
+def _parse_suggestions(raw: str, defaults: list) -> list:
+    suggestions = json_parse_list(raw.strip())
+    if isinstance(suggestions, list) and len(suggestions) == 3:
+        return suggestions
+    return defaults
+
+
+async def generate_follow_up_suggestions_async(
+    question: str,
+    profile: dict,
+    kpi_cards: list,
+    timeout: Optional[float] = None,
+) -> list:
+    """Generate 3 natural follow-up questions based on the analysis performed.
+
+    Returns safe defaults per data type on any failure.
+    """
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    defaults = default_suggestions(profile.get("data_type", "tabular"))
+    if not api_key:
+        return defaults
+
+    prompt = _build_suggestion_prompt(question, profile, kpi_cards)
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        message = client.messages.create(
-            model="claude-sonnet-4-6",
+        message = await _async_client(api_key).messages.create(
+            model=MODEL,
             max_tokens=150,
             messages=[{"role": "user", "content": prompt}],
+            **_timeout_kwargs(timeout),
         )
-        raw = message.content[0].text.strip()
-        suggestions = json_parse_list(raw)
-        if isinstance(suggestions, list) and len(suggestions) == 3:
-            return suggestions
-        return defaults
+        return _parse_suggestions(message.content[0].text, defaults)
     except Exception:
         return defaults
 
@@ -186,6 +266,7 @@ def _build_code_prompt(
     playbook: str,
     source: str,
     conversation_history: list,
+    sheet: str = None,
 ) -> str:
     col_lines = "\n".join(
         f"  {c['name']} | {c['dtype']} | {c['null_pct']}% null"
@@ -208,6 +289,8 @@ def _build_code_prompt(
         if lines:
             history_section = "=== CONVERSATION HISTORY ===\n" + "\n".join(lines) + "\n\n"
 
+    excel_args = f", sheet_name={sheet!r}" if sheet else ""
+
     return f"""{history_section}=== DATA PROFILE ===
 Dataset: {profile.get("summary", "")}
 Rows: {profile.get("row_count")} | Columns: {profile.get("column_count")}
@@ -229,7 +312,7 @@ Write Python code that does ALL of the following:
 1. Load data from: {source}
    - pandas can load URLs directly — just pass the URL string to pd.read_csv() or pd.read_excel().
    - For CSV: df = pd.read_csv("{source}")
-   - For Excel (.xlsx): df = pd.read_excel("{source}")
+   - For Excel (.xlsx): df = pd.read_excel("{source}"{excel_args})
    - Do NOT use requests or urllib — pandas handles URL fetching internally.
    - Always import io at the top (needed for StringIO if you use it elsewhere).
 
@@ -277,7 +360,8 @@ Write Python code that does ALL of the following:
 6. Return only the Python code. No markdown. No triple backticks. No explanation."""
 
 
-def _strip_fences(text: str) -> str:
+def strip_fences(text: str) -> str:
+    """Remove a surrounding markdown code fence from LLM output."""
     text = text.strip()
     text = re.sub(r"^```(?:python)?\n?", "", text)
     text = re.sub(r"\n?```$", "", text)
@@ -289,6 +373,6 @@ def json_parse_list(text: str) -> list:
     try:
         start = text.index("[")
         end = text.rindex("]") + 1
-        return __import__("json").loads(text[start:end])
+        return json.loads(text[start:end])
     except Exception:
         return []
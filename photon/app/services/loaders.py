@@ -0,0 +1,185 @@
+"""
+Format readers used by profiler.read_source().
+
+Every reader takes a binary file-like object and a byte ceiling, reads the
+input incrementally, and raises ValueError as soon as the parsed data grows
+past the ceiling, so one oversized dataset fails fast instead of taking the
+API worker down.
+
+CSV uses pyarrow's streaming reader when pyarrow is installed and falls back
+to chunked pandas parsing otherwise (or when pyarrow's type inference
+rejects a later block). JSON Lines files are read line-by-line in chunks.
+Excel goes through a pluggable engine and decodes only the requested sheet.
+"""
+
+import io
+import json
+import logging
+import os
+from typing import BinaryIO, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except Exception:
+    pa = None
+    pacsv = None
+
+log = logging.getLogger(__name__)
+
+_CSV_BLOCK_BYTES = 16 * 1024 * 1024
+_CHUNK_ROWS = 200_000
+
+
+def _too_large(limit_bytes: int) -> ValueError:
+    return ValueError(
+        f"Dataset exceeds the {limit_bytes // (1024 * 1024)} MB in-memory limit "
+        "(PHOTON_LOAD_MAX_MB). Filter or split the file before analysis."
+    )
+
+
+def _check_frame(df: pd.DataFrame, limit_bytes: int) -> pd.DataFrame:
+    if int(df.memory_usage(index=True, deep=True).sum()) > limit_bytes:
+        raise _too_large(limit_bytes)
+    return df
+
+
+def _concat_chunks(chunks, limit_bytes: int) -> pd.DataFrame:
+    frames = []
+    total = 0
+    for chunk in chunks:
+        total += int(chunk.memory_usage(index=True, deep=True).sum())
+        if total > limit_bytes:
+            raise _too_large(limit_bytes)
+        frames.append(chunk)
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _read_csv_arrow(f: BinaryIO, limit_bytes: int) -> pd.DataFrame:
+    reader = pacsv.open_csv(
+        f,
+        read_options=pacsv.ReadOptions(block_size=_CSV_BLOCK_BYTES),
+        # Empty and "NA"-style cells are nulls in string columns too, as with pandas.
+        convert_options=pacsv.ConvertOptions(strings_can_be_null=True),
+    )
+    batches = []
+    total = 0
+    for batch in reader:
+        total += batch.nbytes
+        if total > limit_bytes:
+            raise _too_large(limit_bytes)
+        batches.append(batch)
+    table = pa.Table.from_batches(batches, schema=reader.schema)
+    del batches
+    # self_destruct frees each Arrow column as soon as it has been converted,
+    # so peak memory stays near the size of the final DataFrame.
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_csv(f: BinaryIO, limit_bytes: int) -> pd.DataFrame:
+    """Parse CSV from a seekable binary stream."""
+    if pacsv is not None:
+        try:
+            return _read_csv_arrow(f, limit_bytes)
+        except pa.ArrowInvalid as e:
+            # Typically a column whose type changes after the first block.
+            log.info("pyarrow CSV parse failed (%s); falling back to pandas", e)
+            f.seek(0)
+    chunks = pd.read_csv(f, chunksize=_CHUNK_ROWS, encoding_errors="replace")
+    with chunks:
+        return _concat_chunks(chunks, limit_bytes)
+
+
+def _is_json_lines(f: BinaryIO) -> bool:
+    """True when the first line is a complete JSON object and more lines follow."""
+    first = f.readline()
+    second = f.readline()
+    while second and not second.strip():
+        second = f.readline()
+    f.seek(0)
+    if not second:
+        return False
+    try:
+        return isinstance(json.loads(first), dict)
+    except ValueError:
+        return False
+
+
+def read_json(f: BinaryIO, limit_bytes: int) -> pd.DataFrame:
+    """Parse a JSON document or a JSON Lines file from a seekable binary stream."""
+    if _is_json_lines(f):
+        chunks = pd.read_json(io.TextIOWrapper(f, encoding="utf-8"), lines=True, chunksize=_CHUNK_ROWS)
+        with chunks:
+            return _concat_chunks(chunks, limit_bytes)
+    return _check_frame(pd.read_json(f), limit_bytes)
+
+
+def _has_module(name: str) -> bool:
+    try:
+        __import__(name)
+        return True
+    except Exception:
+        return False
+
+
+def excel_engine(extension: str = ".xlsx") -> Optional[str]:
+    """Pick the pandas Excel engine: PHOTON_EXCEL_ENGINE if set, else calamine
+    (Rust, several times faster) when python-calamine is installed, else
+    openpyxl, which pandas opens in read-only streaming mode. Legacy .xls
+    files without calamine use pandas' default (xlrd)."""
+    configured = os.environ.get("PHOTON_EXCEL_ENGINE")
+    if configured:
+        return configured
+    if _has_module("python_calamine"):
+        return "calamine"
+    return "openpyxl" if extension != ".xls" else None
+
+
+def list_sheets(f: BinaryIO, extension: str = ".xlsx") -> List[str]:
+    """Return sheet names without parsing any sheet's cells."""
+    engine = excel_engine(extension)
+    if engine == "calamine":
+        from python_calamine import CalamineWorkbook
+
+        return list(CalamineWorkbook.from_filelike(f).sheet_names)
+    if engine == "openpyxl":
+        import openpyxl
+
+        wb = openpyxl.load_workbook(f, read_only=True)
+        try:
+            return list(wb.sheetnames)
+        finally:
+            wb.close()
+    return list(pd.ExcelFile(f, engine=engine).sheet_names)
+
+
+def read_excel(
+    f: BinaryIO, limit_bytes: int, sheet: Optional[str] = None, extension: str = ".xlsx"
+) -> pd.DataFrame:
+    """Parse one sheet of a workbook (the first when sheet is None).
+
+    Only the selected sheet is decoded; the others are never read.
+    Raises ValueError for an unknown sheet name.
+    """
+    try:
+        df = pd.read_excel(f, sheet_name=sheet if sheet is not None else 0, engine=excel_engine(extension))
+    except ValueError as e:
+        if sheet is not None and "not found" in str(e):
+            raise ValueError(f"Sheet not found: {sheet}")
+        raise
+    return _check_frame(df, limit_bytes)
+
+
+def read(f: BinaryIO, extension: str, limit_bytes: int, sheet: Optional[str] = None) -> pd.DataFrame:
+    """Parse f with the reader for extension (".xlsx"/".xls", ".json", else CSV)."""
+    if extension in (".xlsx", ".xls"):
+        return read_excel(f, limit_bytes, sheet, extension)
+    if extension == ".json":
+        return read_json(f, limit_bytes)
+    return read_csv(f, limit_bytes)
@@ -0,0 +1,128 @@
+"""
+Per-stage latency instrumentation for the workflow pipeline.
+
+Code under a request wraps each stage in span(name). A span records its
+duration in two places:
+  - the request's Timings, which the route turns into a Server-Timing
+    header (and a `timings` block when PHOTON_DEBUG=1)
+  - a process-wide histogram per stage, served by GET /metrics in the
+    Prometheus text format
+
+The current Timings lives in a context variable set by track(), so spans
+deep in services (or in executor threads started with a copied context)
+report to the right request without threading it through every call.
+Spans outside a tracked request, such as background pre-processing and
+speculative runs, record nothing.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Histogram bucket upper bounds, in seconds.
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Timings:
+    """Stage durations for one request, in the order the stages finished."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        """Milliseconds per stage, plus the elapsed total."""
+        out = {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+        out["total"] = round(self.total() * 1000, 1)
+        return out
+
+    def header(self) -> str:
+        """The Server-Timing header value."""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_dict().items())
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+
+
+_current: ContextVar[Optional[Timings]] = ContextVar("photon_timings", default=None)
+_lock = threading.Lock()
+_histograms: dict = {}
+
+
+def debug_enabled() -> bool:
+    return os.environ.get("PHOTON_DEBUG", "0") == "1"
+
+
+def track() -> Timings:
+    """Start timing a request in the current context and return its Timings."""
+    timings = Timings()
+    _current.set(timings)
+    return timings
+
+
+def observe(name: str, seconds: float) -> None:
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = _Histogram()
+        hist.observe(seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as stage name of the current request, if any."""
+    timings = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            elapsed = time.perf_counter() - start
+            timings.add(name, elapsed)
+            observe(name, elapsed)
+
+
+def render() -> str:
+    """All stage histograms in the Prometheus text exposition format."""
+    lines = [
+        "# HELP photon_stage_seconds Workflow pipeline stage latency.",
+        "# TYPE photon_stage_seconds histogram",
+    ]
+    with _lock:
+        for name in sorted(_histograms):
+            hist = _histograms[name]
+            cumulative = 0
+            for bound, count in zip(_BUCKETS, hist.counts):
+                cumulative += count
+                lines.append(f'photon_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'photon_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {hist.count}')
+            lines.append(f'photon_stage_seconds_sum{{stage="{name}"}} {hist.sum:.6f}')
+            lines.append(f'photon_stage_seconds_count{{stage="{name}"}} {hist.count}')
+    return "\n".join(lines) + "\n"
+
+
+def _reset() -> None:
+    """Drop all histograms. For use in tests only."""
+    with _lock:
+        _histograms.clear()
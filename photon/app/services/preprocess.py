@@ -0,0 +1,236 @@
+"""
+Background pre-processing of uploads.
+
+As soon as an upload is stored, schedule() queues a job that runs the work
+/workflow/generate would otherwise do after the user asks a question:
+  parse    load the file, compact dtypes, write the columnar copy
+  profile  profile the frame into the profile cache
+  stage    encode the Lambda file payload ahead of execution
+
+Jobs are keyed by content digest, so duplicate uploads share one job.
+profile_source() is what the workflow calls: it waits for an in-flight job
+(up to PHOTON_PREPROCESS_WAIT_SECONDS), then serves the cached profile, or
+computes it inline when no job covered it. status() reports progress for
+the frontend to poll. Progress is also published as an upload-store record
+(upload_store.update_record), so a status request that lands on another
+worker sharing the backend sees it too.
+
+profile_source_async() does the same for async routes on its own pool of
+PHOTON_PROFILE_CONCURRENCY threads, which bounds how many requests parse
+and profile at once and keeps that CPU work off the event loop.
+
+Settings:
+  PHOTON_PREPROCESS               1 (default) to pre-process uploads, 0 to skip
+  PHOTON_PREPROCESS_WORKERS       background threads, default 2
+  PHOTON_PREPROCESS_WAIT_SECONDS  how long a request waits on a job, default 120
+  PHOTON_PROFILE_CONCURRENCY      request-time profiling threads, default 4
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from app.services import columnar_store, deadline, metrics, profile_cache, upload_store
+from app.services.lambda_executor import stage_upload
+from app.services.profiler import DatasetSource, fetch_source, profile, read_source
+
+log = logging.getLogger(__name__)
+
+_STAGES = ("parse", "profile", "stage")
+# Finished jobs kept for status(); older ones fall back to the caches.
+_MAX_JOBS = 1024
+_KIND = "preprocess-job"
+
+
+class _Job:
+    def __init__(self, key: str):
+        self.key = key
+        self.stages = {name: "pending" for name in _STAGES}
+        self.error: Optional[str] = None
+        self.future: Future = Future()
+
+    @property
+    def state(self) -> str:
+        if self.error is not None:
+            return "failed"
+        if self.future.done():
+            return "ready"
+        if any(v != "pending" for v in self.stages.values()):
+            return "running"
+        return "queued"
+
+    def snapshot(self, state: Optional[str] = None) -> dict:
+        return {"state": state or self.state, "stages": dict(self.stages), "error": self.error}
+
+
+def _publish(job: _Job, state: Optional[str] = None) -> None:
+    """Share the job's progress with the other workers; best effort."""
+    snapshot = job.snapshot(state)
+    try:
+        upload_store.update_record(_KIND, job.key, lambda _: snapshot)
+    except Exception as e:
+        log.warning("Could not publish pre-processing state of %s: %s", job.key, e)
+
+
+_lock = threading.Lock()
+_jobs: "OrderedDict[str, _Job]" = OrderedDict()
+_pool: Optional[ThreadPoolExecutor] = None
+_request_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _enabled() -> bool:
+    return os.environ.get("PHOTON_PREPROCESS", "1") == "1"
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            workers = int(os.environ.get("PHOTON_PREPROCESS_WORKERS", 2))
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photon-preprocess")
+        return _pool
+
+
+def _get_request_pool() -> ThreadPoolExecutor:
+    global _request_pool
+    with _lock:
+        if _request_pool is None:
+            workers = int(os.environ.get("PHOTON_PROFILE_CONCURRENCY", 4))
+            _request_pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="photon-profile-request"
+            )
+        return _request_pool
+
+
+def _compute_profile(src: DatasetSource) -> dict:
+    with metrics.span("load"):
+        df = read_source(src)
+    with metrics.span("profile"):
+        data_profile = profile(df)
+    profile_cache.put(src.key, data_profile)
+    return data_profile
+
+
+def _run(job: _Job, upload_id: str) -> None:
+    try:
+        src = fetch_source(f"photon-upload://{upload_id}")
+        job.stages["parse"] = "running"
+        _publish(job)
+        df = read_source(src)
+        job.stages["parse"] = "done"
+        job.stages["profile"] = "running"
+        _publish(job)
+        if not profile_cache.contains(src.key):
+            profile_cache.put(src.key, profile(df))
+        del df
+        job.stages["profile"] = "done"
+        job.stages["stage"] = "running"
+        _publish(job)
+        job.stages["stage"] = "done" if stage_upload(upload_id) else "skipped"
+    except Exception as e:
+        log.warning("Pre-processing of upload %s failed: %s", upload_id, e)
+        job.error = str(e)
+        for name, value in job.stages.items():
+            if value in ("pending", "running"):
+                job.stages[name] = "failed" if value == "running" else "skipped"
+    finally:
+        # Published before waiters wake, so every worker sees the final state together.
+        _publish(job, "failed" if job.error is not None else "ready")
+        job.future.set_result(None)
+
+
+def schedule(upload_id: str) -> None:
+    """Queue pre-processing for an upload unless its content is already covered."""
+    if not _enabled():
+        return
+    try:
+        key = upload_store.metadata(upload_id)["sha256"]
+    except KeyError:
+        return
+    with _lock:
+        if key in _jobs and _jobs[key].error is None:
+            _jobs.move_to_end(key)
+            return
+        job = _Job(key)
+        _jobs[key] = job
+        while len(_jobs) > _MAX_JOBS:
+            _jobs.popitem(last=False)
+    # Published before the job can start, so "queued" never overwrites progress.
+    _publish(job)
+    _get_pool().submit(_run, job, upload_id)
+
+
+def status(upload_id: str) -> dict:
+    """Readiness of an upload's pre-processing; raises KeyError for unknown uploads."""
+    key = upload_store.metadata(upload_id)["sha256"]
+    with _lock:
+        job = _jobs.get(key)
+    if job is not None:
+        return job.snapshot()
+    # The job may be running on another worker that shares the upload backend.
+    shared = upload_store.get_record(_KIND, key)
+    if shared is not None:
+        return shared
+    # No job anywhere: report whatever the caches already hold.
+    parsed = columnar_store.exists(key)
+    profiled = profile_cache.contains(key)
+    return {
+        "state": "ready" if profiled else "idle",
+        "stages": {
+            "parse": "done" if parsed else "pending",
+            "profile": "done" if profiled else "pending",
+            "stage": "pending",
+        },
+        "error": None,
+    }
+
+
+def profile_source(src: DatasetSource) -> dict:
+    """Return src's profile, reusing the cache or an in-flight job, computing it otherwise.
+
+    Raises TimeoutError instead of profiling inline once the request budget is spent.
+    """
+    with _lock:
+        job = _jobs.get(src.key)
+    if job is not None and not job.future.done():
+        wait = deadline.current().timeout(float(os.environ.get("PHOTON_PREPROCESS_WAIT_SECONDS", 120)))
+        try:
+            with metrics.span("preprocess_wait"):
+                job.future.result(timeout=wait)
+        except FutureTimeoutError:
+            log.warning("Pre-processing of %s still running after %.0fs; profiling inline", src.source, wait)
+    cached = profile_cache.get(src.key)
+    if cached is not None:
+        return cached
+    if deadline.current().expired():
+        raise TimeoutError(f"Request budget spent before profiling {src.source}")
+    return _compute_profile(src)
+
+
+def _load_profile(source: str, sheet: Optional[str]) -> tuple:
+    with metrics.span("resolve"):
+        src = fetch_source(source, sheet)
+    return src.key, profile_source(src)
+
+
+async def profile_source_async(source: str, sheet: Optional[str] = None) -> tuple:
+    """Resolve source and return (content key, profile) without blocking the event loop.
+
+    Raises ValueError for unusable sources, like fetch_source().
+    """
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the caller's context so metrics spans reach its request.
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_get_request_pool(), ctx.run, _load_profile, source, sheet)
+
+
+def _reset() -> None:
+    """Forget all jobs. For use in tests only."""
+    with _lock:
+        _jobs.clear()
@@ -0,0 +1,223 @@
+"""
+Content-addressed cache of dataset profiles.
+
+Keys are SHA-256 digests of the dataset bytes, so the same file reached via
+a new upload id or a re-fetched URL maps to the same entry, and any change
+in content is a miss. Follow-up questions on a dataset skip parsing and
+profiling entirely.
+
+Two tiers:
+- memory: LRU over serialized profiles, bounded by PHOTON_PROFILE_CACHE_BYTES
+- disk (optional): one JSON file per key under PHOTON_PROFILE_CACHE_DIR,
+  shared across restarts and worker processes, bounded by
+  PHOTON_PROFILE_CACHE_DISK_BYTES; least recently used files (by mtime,
+  refreshed on every disk hit) are deleted past it
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+_DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+_DEFAULT_DISK_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ProfileCache:
+    """Two-tier LRU cache mapping content digests to profile dicts."""
+
+    def __init__(
+        self,
+        max_bytes: int = _DEFAULT_MAX_BYTES,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = _DEFAULT_DISK_MAX_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            raw = self._entries.get(key)
+            if raw is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(raw)
+        raw = self._read_disk(key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, raw)
+        return json.loads(raw)
+
+    def contains(self, key: str) -> bool:
+        """True if key is cached in either tier; does not count as a hit or miss."""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.disk_dir is not None and os.path.exists(self._disk_path(key))
+
+    def put(self, key: str, profile: dict) -> None:
+        raw = json.dumps(profile, default=str)
+        with self._lock:
+            self._insert(key, raw)
+        self._write_disk(key, raw)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "disk_dir": self.disk_dir,
+                "disk_max_bytes": self.disk_max_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
+
+    def _insert(self, key: str, raw: str) -> None:
+        """Add or refresh an entry and evict LRU entries past the byte budget. Caller holds the lock."""
+        size = len(raw)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = raw
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = f.read()
+            # The mtime is the disk tier's recency for eviction.
+            os.utime(path)
+            return raw
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            log.warning("Profile cache disk read failed for %s: %s", key, e)
+            return None
+
+    def _write_disk(self, key: str, raw: str) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(raw)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning("Profile cache disk write failed for %s: %s", key, e)
+            return
+        self._evict_disk(keep=path)
+
+    def _evict_disk(self, keep: str) -> None:
+        """Delete least recently used profile files until the disk tier fits its budget."""
+        entries = []
+        try:
+            with os.scandir(self.disk_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json"):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError as e:
+            log.warning("Profile cache disk scan failed: %s", e)
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # Already gone: another worker evicted it.
+                pass
+            total -= size
+            with self._lock:
+                self.disk_evictions += 1
+
+
+# Lazily initialized singleton — one cache per process.
+_cache: Optional[ProfileCache] = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache() -> ProfileCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ProfileCache(
+                    max_bytes=int(os.environ.get("PHOTON_PROFILE_CACHE_BYTES", _DEFAULT_MAX_BYTES)),
+                    disk_dir=os.environ.get("PHOTON_PROFILE_CACHE_DIR") or None,
+                    disk_max_bytes=int(
+                        os.environ.get("PHOTON_PROFILE_CACHE_DISK_BYTES", _DEFAULT_DISK_MAX_BYTES)
+                    ),
+                )
+    return _cache
+
+
+def get(key: str) -> Optional[dict]:
+    """Return the cached profile for a content digest, or None on a miss."""
+    return _get_cache().get(key)
+
+
+def put(key: str, profile: dict) -> None:
+    _get_cache().put(key, profile)
+
+
+def contains(key: str) -> bool:
+    return _get_cache().contains(key)
+
+
+def stats() -> dict:
+    return _get_cache().stats()
+
+
+def _reset() -> None:
+    """Drop the singleton so the next call re-reads the environment. For use in tests only."""
+    global _cache
+    _cache = None
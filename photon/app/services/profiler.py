@@ -1,132 +1,160 @@
-import base64
-import io
+import hashlib
 import os
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional
 
 import pandas as pd
-import requests
 
-from app.services import upload_store
+from app.services import columnar_store, compaction, deadline, http_cache, loaders, upload_store
+# profile() lives in frame_profile so the Lambda sandbox can ship it; callers
+# keep importing it from here.
+from app.services.frame_profile import profile  # noqa: F401
+
+# Hard ceiling on the in-memory size of a loaded dataset.
+_LOAD_MAX_MB = 2048
+_STREAM_CHUNK_BYTES = 1024 * 1024
+
+
+@dataclass
+class DatasetSource:
+    """A dataset resolved to a local file or a stored upload, plus its format and content hash."""
+
+    source: str
+    extension: str
+    digest: str
+    path: Optional[str] = None
+    upload_id: Optional[str] = None
+    sheet: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        """Cache key for artifacts derived from this source (one per workbook sheet).
+
+        Sheet keys are prefixed with the digest so columnar_store.delete(digest)
+        finds them.
+        """
+        if self.sheet is None:
+            return self.digest
+        return f"{self.digest}-{hashlib.sha256(self.sheet.encode('utf-8')).hexdigest()}"
+
+    def open(self) -> BinaryIO:
+        if self.upload_id is not None:
+            try:
+                return upload_store.open_content(self.upload_id)
+            except KeyError:
+                raise ValueError(f"Upload not found or expired: {self.upload_id}")
+        if self.source.startswith(("http://", "https://")):
+            return http_cache.open_body(self.source, self.path, self.digest)
+        return open(self.path, "rb")
+
+
+def _hash_stream(f: BinaryIO) -> str:
+    h = hashlib.sha256()
+    for block in iter(lambda: f.read(_STREAM_CHUNK_BYTES), b""):
+        h.update(block)
+    return h.hexdigest()
+
+
+def _fetch_url(source: str) -> DatasetSource:
+    """Resolve a URL through the on-disk HTTP cache."""
+    dl = deadline.current()
+    if dl.expired():
+        raise TimeoutError(f"Request budget spent before fetching {source}")
+    cached = http_cache.fetch(source, timeout=dl.timeout(30))
+    content_type = cached.content_type
+    if source.endswith(".xlsx") or "spreadsheet" in content_type or "excel" in content_type:
+        ext = ".xlsx"
+    elif source.endswith(".json") or "json" in content_type:
+        ext = ".json"
+    else:
+        ext = ".csv"
+    return DatasetSource(source, ext, cached.digest, path=cached.path)
 
 
-def load_dataframe(source: str) -> pd.DataFrame:
-    """Load a CSV, Excel, or JSON dataset into a DataFrame from a local path or URL."""
+def fetch_source(source: str, sheet: Optional[str] = None) -> DatasetSource:
+    """Resolve a local path, URL, or photon-upload:// id to raw bytes without parsing.
+
+    URL bodies come from the HTTP cache, streamed to disk rather than held
+    in memory; uploads are read in place from the upload store. sheet selects a worksheet of an Excel source.
+    """
+    src = _resolve(source)
+    if sheet is not None:
+        if src.extension not in (".xlsx", ".xls"):
+            raise ValueError("A sheet can only be selected for Excel sources")
+        src.sheet = sheet
+    return src
+
+
+def _resolve(source: str) -> DatasetSource:
     if source.startswith("photon-upload://"):
         upload_id = source.removeprefix("photon-upload://")
         try:
-            data = upload_store.get(upload_id)
+            meta = upload_store.metadata(upload_id)
         except KeyError:
             raise ValueError(f"Upload not found or expired: {upload_id}")
-        content = base64.b64decode(data["content"])
-        ext = data["extension"]
-        if ext in ('.xlsx', '.xls'):
-            return pd.read_excel(io.BytesIO(content))
-        return pd.read_csv(io.BytesIO(content))
+        src = DatasetSource(source, meta["extension"], meta.get("sha256", ""), upload_id=upload_id)
+        if not src.digest:
+            with src.open() as f:
+                src.digest = _hash_stream(f)
+        return src
 
     is_url = source.startswith("http://") or source.startswith("https://")
 
     if is_url:
-        try:
-            resp = requests.get(source, timeout=30)
-            resp.raise_for_status()
-        except requests.RequestException as e:
-            raise ValueError(f"Failed to fetch URL: {e}")
-        content_type = resp.headers.get("Content-Type", "")
-        if source.endswith(".xlsx") or "spreadsheet" in content_type or "excel" in content_type:
-            return pd.read_excel(io.BytesIO(resp.content))
-        if source.endswith(".json") or "json" in content_type:
-            return pd.read_json(io.StringIO(resp.text))
-        return pd.read_csv(io.StringIO(resp.text))
+        return _fetch_url(source)
 
     if not os.path.exists(source):
         raise ValueError(f"File not found: {source}")
-    if source.endswith(".xlsx"):
-        return pd.read_excel(source)
-    if source.endswith(".json"):
-        return pd.read_json(source)
-    if source.endswith(".csv"):
-        return pd.read_csv(source)
-    raise ValueError(
-        f"Unsupported file format. Expected .csv, .xlsx, or .json, got: {source}"
-    )
-
-
-def profile(df: pd.DataFrame) -> dict:
-    """Inspect a DataFrame and return structured metadata about its content."""
-    row_count = len(df)
-    column_count = len(df.columns)
-
-    columns = []
-    numeric_columns = []
-    datetime_columns = []
-
-    for col in df.columns:
-        series = df[col]
-        null_pct = round(float(series.isna().mean() * 100), 1)
-        n_unique = int(series.nunique(dropna=True))
-        sample_values = [str(v) for v in series.dropna().head(3).tolist()]
-
-        if pd.api.types.is_numeric_dtype(series):
-            dtype_label = "numeric"
-            numeric_columns.append(col)
-        elif pd.api.types.is_datetime64_any_dtype(series):
-            dtype_label = "datetime"
-            datetime_columns.append(col)
-        elif series.dtype == object:
-            # Try to infer datetime from string values.
-            parsed = pd.to_datetime(series, errors="coerce", format="mixed")
-            if parsed.notna().mean() > 0.8:
-                dtype_label = "datetime"
-                datetime_columns.append(col)
-            else:
-                dtype_label = "string"
-        else:
-            dtype_label = "string"
-
-        columns.append(
-            {
-                "name": col,
-                "dtype": dtype_label,
-                "null_pct": null_pct,
-                "n_unique": n_unique,
-                "sample_values": sample_values,
-            }
+    ext = os.path.splitext(source)[1].lower()
+    if ext not in (".xlsx", ".json", ".csv"):
+        raise ValueError(
+            f"Unsupported file format. Expected .csv, .xlsx, or .json, got: {source}"
         )
+    with open(source, "rb") as f:
+        digest = _hash_stream(f)
+    return DatasetSource(source, ext, digest, path=source)
+
+
+def read_source(src: DatasetSource, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Parse a fetched source into a DataFrame, streaming where the format allows.
+
+    Uploads, URL datasets and workbooks are parsed once and kept as a
+    columnar copy keyed by src.key; later reads memory-map that copy,
+    projected to columns if given.
+    Freshly parsed frames are dtype-compacted (PHOTON_COMPACT_DTYPES=0 turns
+    this off) before the copy is written, so mapped reads are compact too.
+    Raises ValueError when the parsed data exceeds PHOTON_LOAD_MAX_MB.
+    """
+    df = columnar_store.read(src.key, columns)
+    if df is not None:
+        return df
+
+    limit_bytes = int(os.environ.get("PHOTON_LOAD_MAX_MB", _LOAD_MAX_MB)) * 1024 * 1024
+    is_excel = src.extension in (".xlsx", ".xls")
+    with src.open() as f:
+        df = loaders.read(f, src.extension, limit_bytes, src.sheet)
+
+    if os.environ.get("PHOTON_COMPACT_DTYPES", "1") == "1":
+        df, report = compaction.compact_dtypes(df)
+        df.attrs["compaction"] = report
+    if is_excel or src.source.startswith(("photon-upload://", "http://", "https://")):
+        columnar_store.write(src.key, df)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def load_dataframe(
+    source: str, columns: Optional[List[str]] = None, sheet: Optional[str] = None
+) -> pd.DataFrame:
+    """Load a CSV, Excel, or JSON dataset into a DataFrame from a local path or URL."""
+    return read_source(fetch_source(source, sheet), columns)
 
-    has_nulls = any(c["null_pct"] > 5.0 for c in columns)
-
-    if datetime_columns and numeric_columns:
-        data_type = "time_series"
-    elif column_count > 20 and row_count < 100:
-        data_type = "wide_format"
-    else:
-        data_type = "tabular"
-
-    null_count = sum(1 for c in columns if c["null_pct"] > 5.0)
-    type_label = data_type.replace("_", " ").title()
-    summary = (
-        f"{type_label} dataset with {row_count} rows, {column_count} columns"
-    )
-    type_mentions = []
-    if datetime_columns:
-        type_mentions.append("datetime")
-    if numeric_columns:
-        type_mentions.append("numeric")
-    if type_mentions:
-        summary += f", including {' and '.join(type_mentions)} columns"
-    summary += "."
-    if null_count:
-        summary += (
-            f" {null_count} column{'s' if null_count > 1 else ''} "
-            "have significant nulls."
-        )
 
-    return {
-        "row_count": row_count,
-        "column_count": column_count,
-        "columns": columns,
-        "data_type": data_type,
-        "has_nulls": has_nulls,
-        "numeric_columns": numeric_columns,
-        "datetime_columns": datetime_columns,
-        "summary": summary,
-    }
+def list_sheets(source: str) -> List[str]:
+    """Return the worksheet names of an Excel source without parsing any sheet."""
+    src = fetch_source(source)
+    if src.extension not in (".xlsx", ".xls"):
+        raise ValueError("Only Excel sources have sheets")
+    with src.open() as f:
+        return loaders.list_sheets(f, src.extension)
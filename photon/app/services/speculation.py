@@ -0,0 +1,213 @@
+"""
+Speculative pre-computation of suggested follow-up questions.
+
+With PHOTON_SPECULATE=1, once a workflow response is ready its follow-up
+suggestions are run through the pipeline in the background, so the result
+is already in the workflow cache when the user clicks one.
+
+Speculative runs are grouped per conversation (API key plus session id, or
+source when there is none). A new question in that conversation cancels
+the group's runs, except the one for that very question: the request
+joins it instead of starting over.
+
+Cost and priority controls:
+  PHOTON_SPECULATE_BUDGET          runs per API key per window, default 30
+  PHOTON_SPECULATE_WINDOW_SECONDS  budget window, default 3600
+  PHOTON_SPECULATE_CONCURRENCY     speculative runs at once per worker, default 1
+A run only starts while no foreground workflow request is in flight.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional
+
+from app.services.workflow_cache import normalize_question
+
+log = logging.getLogger(__name__)
+
+_DEFAULT_BUDGET = 30
+_DEFAULT_WINDOW_SECONDS = 3600
+_DEFAULT_CONCURRENCY = 1
+
+
+class _State:
+    """Scheduling state bound to one event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.slots = asyncio.Semaphore(
+            int(os.environ.get("PHOTON_SPECULATE_CONCURRENCY", _DEFAULT_CONCURRENCY))
+        )
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.foreground = 0
+        # group key -> {normalized question: _Run}
+        self.groups: dict = {}
+
+
+class _Run:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        # Set when a request joins the run; it then skips the priority gates.
+        self.promoted = asyncio.Event()
+
+
+_lock = threading.Lock()
+_state: Optional[_State] = None
+# api key -> [runs, window start]
+_budgets: dict = {}
+_counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "joined": 0, "over_budget": 0}
+
+
+def enabled() -> bool:
+    return os.environ.get("PHOTON_SPECULATE", "0") == "1"
+
+
+def _get_state() -> _State:
+    global _state
+    loop = asyncio.get_running_loop()
+    if _state is None or _state.loop is not loop:
+        _state = _State(loop)
+    return _state
+
+
+def _take_budget(api_key: str) -> bool:
+    budget = int(os.environ.get("PHOTON_SPECULATE_BUDGET", _DEFAULT_BUDGET))
+    window = float(os.environ.get("PHOTON_SPECULATE_WINDOW_SECONDS", _DEFAULT_WINDOW_SECONDS))
+    now = time.time()
+    with _lock:
+        rec = _budgets.get(api_key)
+        if rec is None or now >= rec[1] + window:
+            rec = _budgets[api_key] = [0, now]
+        if rec[0] >= budget:
+            _counters["over_budget"] += 1
+            return False
+        rec[0] += 1
+        return True
+
+
+@contextmanager
+def foreground():
+    """Mark a user-facing request in flight; speculative runs wait until none are."""
+    state = _get_state()
+    state.foreground += 1
+    state.idle.clear()
+    try:
+        yield
+    finally:
+        state.foreground -= 1
+        if state.foreground == 0:
+            state.idle.set()
+
+
+def claim(group: str, question: str) -> Optional[asyncio.Task]:
+    """A new question arrived in group: cancel its other runs.
+
+    Returns the speculative task already running for this question, if
+    any, for the caller to await instead of repeating the work.
+    """
+    state = _get_state()
+    runs = state.groups.pop(group, {})
+    match = runs.pop(normalize_question(question), None)
+    for run in runs.values():
+        if run.task.cancel():
+            _counters["cancelled"] += 1
+    if match is not None and not match.task.done():
+        match.promoted.set()
+        _counters["joined"] += 1
+        return match.task
+    return None
+
+
+async def _wait_turn(state: _State, run: _Run) -> bool:
+    """Wait until no foreground request is in flight, or the run is promoted.
+
+    Returns True if a speculative slot was taken (and must be released).
+    """
+    while not run.promoted.is_set():
+        idle = asyncio.ensure_future(state.idle.wait())
+        promoted = asyncio.ensure_future(run.promoted.wait())
+        try:
+            await asyncio.wait({idle, promoted}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            idle.cancel()
+            promoted.cancel()
+        if run.promoted.is_set():
+            return False
+        await state.slots.acquire()
+        if state.idle.is_set() or run.promoted.is_set():
+            return True
+        # A foreground request started while we waited for the slot.
+        state.slots.release()
+    return False
+
+
+async def _run(
+    group: str, question: str, run: _Run, runner: Callable[[str], Awaitable]
+) -> None:
+    state = _get_state()
+    holds_slot = False
+    try:
+        holds_slot = await _wait_turn(state, run)
+        await runner(question)
+        _counters["completed"] += 1
+    except Exception as e:
+        _counters["failed"] += 1
+        log.info("Speculative run for %r failed: %s", question, e)
+    finally:
+        if holds_slot:
+            state.slots.release()
+        runs = state.groups.get(group, {})
+        key = normalize_question(question)
+        if runs.get(key) is run:
+            del runs[key]
+
+
+def submit(
+    group: str, api_key: str, questions: list, runner: Callable[[str], Awaitable]
+) -> int:
+    """Schedule runner(question) in the background for each question within budget.
+
+    Returns how many runs were scheduled.
+    """
+    state = _get_state()
+    runs = state.groups.setdefault(group, {})
+    scheduled = 0
+    for question in questions:
+        key = normalize_question(question)
+        if key in runs or not _take_budget(api_key):
+            continue
+        run = runs[key] = _Run()
+        # A fresh context, so runs are not timed as part of the submitting request.
+        run.task = state.loop.create_task(
+            _run(group, question, run, runner), context=contextvars.Context()
+        )
+        _counters["submitted"] += 1
+        scheduled += 1
+    return scheduled
+
+
+def stats() -> dict:
+    return {"enabled": enabled(), **_counters}
+
+
+async def _drain() -> None:
+    """Wait for every scheduled run to finish. For use in tests only."""
+    state = _get_state()
+    pending = [run.task for runs in state.groups.values() for run in runs.values()]
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def _reset() -> None:
+    """Forget all state and budgets. For use in tests only."""
+    global _state
+    _state = None
+    with _lock:
+        _budgets.clear()
+        for name in _counters:
+            _counters[name] = 0
@@ -0,0 +1,498 @@
+"""
+Shared upload-store backends, so that several API workers see the same uploads.
+
+disk   PHOTON_UPLOAD_DIR (default <tmp>/photon/shared-uploads), one directory
+       per host or on a shared volume:
+         blobs/<sha256>.bin   content, one file per distinct upload
+         refs/<id>.json       metadata, digest and creation time of an upload id
+         tmp/                 spool files, renamed into blobs/ when complete,
+                              and resumable session parts (<name>.chunk)
+         records/<kind>/<key>.json  shared records (see upload_store.update_record)
+       Every file is written under a temporary name and os.replace()d into
+       place, so readers never see partial files. Mutations hold an
+       exclusive lock on <dir>/.lock (fcntl, or msvcrt on Windows). Blob
+       mtimes track last use for LRU eviction past PHOTON_UPLOAD_DISK_BYTES.
+
+redis  REDIS_URL, the server the rate limiter already uses:
+         photon:upload:ref:<id>       JSON metadata, expires with the id's TTL
+         photon:upload:blob:<sha256>  content; its TTL is pushed out to the
+                                      newest id's on every upload, so it
+                                      outlives every id pointing at it
+         photon:upload:record:<kind>:<key>  shared records, updated under WATCH
+         photon:upload:part:<name>    resumable session parts
+       Memory is bounded by the server's maxmemory policy, not by Photon.
+
+Both keep the memory backend's contract: one blob per digest, ids expire
+after PHOTON_UPLOAD_TTL_SECONDS, KeyError for missing or expired ids.
+Hit/miss counters in stats() are per worker.
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import BinaryIO, Callable, Iterator, Optional
+
+from app.services.upload_store import FileParts, disk_budget, release_columnar, ttl_seconds
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+log = logging.getLogger(__name__)
+
+_CHUNK_BYTES = 1024 * 1024
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class DiskUploadStore:
+    """Blobs and refs as files in a directory shared by all workers."""
+
+    name = "disk"
+
+    def __init__(self, root: str = None):
+        self.root = root or os.environ.get(
+            "PHOTON_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "photon", "shared-uploads")
+        )
+        for sub in ("blobs", "refs", "tmp", "records"):
+            os.makedirs(os.path.join(self.root, sub), exist_ok=True)
+        self.parts = FileParts(lambda: os.path.join(self.root, "tmp"))
+        self._thread_lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "dedup_hits": 0, "evictions": 0, "expirations": 0}
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", f"{digest}.bin")
+
+    def _ref_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, "refs", f"{upload_id}.json")
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Exclusive across threads of this worker and across worker processes."""
+        with self._thread_lock, open(os.path.join(self.root, ".lock"), "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_ref(self, upload_id: str):
+        try:
+            with open(self._ref_path(upload_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _refs(self) -> dict:
+        out = {}
+        for name in os.listdir(os.path.join(self.root, "refs")):
+            if name.endswith(".json"):
+                ref = self._read_ref(name[: -len(".json")])
+                if ref is not None:
+                    out[name[: -len(".json")]] = ref
+        return out
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _enforce(self) -> None:
+        """Expire ids, drop unreferenced blobs, evict LRU blobs past the budget. Caller holds the lock."""
+        refs = self._refs()
+        cutoff = time.time() - ttl_seconds()
+        for upload_id, ref in list(refs.items()):
+            if ref["created"] <= cutoff:
+                self._remove(self._ref_path(upload_id))
+                del refs[upload_id]
+                self._counters["expirations"] += 1
+
+        live = {ref["digest"] for ref in refs.values()}
+        blobs = []
+        for name in os.listdir(os.path.join(self.root, "blobs")):
+            digest = name[: -len(".bin")]
+            path = self._blob_path(digest)
+            if digest not in live:
+                self._remove(path)
+                release_columnar(digest)
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            blobs.append((st.st_mtime, st.st_size, digest))
+
+        total = sum(size for _, size, _ in blobs)
+        limit = disk_budget()
+        for _, size, digest in sorted(blobs):
+            if total <= limit:
+                break
+            for upload_id in [k for k, r in refs.items() if r["digest"] == digest]:
+                self._remove(self._ref_path(upload_id))
+                self._counters["evictions"] += 1
+            self._remove(self._blob_path(digest))
+            release_columnar(digest)
+            total -= size
+
+    def _commit(self, upload_id: str, digest: str, meta: dict, path: str) -> None:
+        """Adopt the spool file at path as digest's blob and write the ref. Caller holds the lock."""
+        blob = self._blob_path(digest)
+        if os.path.exists(blob):
+            self._counters["dedup_hits"] += 1
+            self._remove(path)
+            os.utime(blob)
+        else:
+            os.replace(path, blob)
+        ref = {"meta": {**meta, "sha256": digest}, "digest": digest, "created": time.time()}
+        _atomic_write(self._ref_path(upload_id), json.dumps(ref).encode("utf-8"))
+        self._enforce()
+
+    def put(self, upload_id: str, data: dict) -> None:
+        content = bytes(data["content"])
+        meta = {k: v for k, v in data.items() if k != "content"}
+        digest = meta.get("sha256") or hashlib.sha256(content).hexdigest()
+        with self.spool_file() as f:
+            f.write(content)
+        with self._locked():
+            self._commit(upload_id, digest, meta, f.name)
+
+    def spool_file(self) -> BinaryIO:
+        return tempfile.NamedTemporaryFile(
+            dir=os.path.join(self.root, "tmp"), suffix=".part", delete=False
+        )
+
+    def put_file(self, upload_id: str, path: str, meta: dict) -> None:
+        with self._locked():
+            self._commit(upload_id, meta["sha256"], meta, path)
+
+    def _live(self, upload_id: str) -> dict:
+        ref = self._read_ref(upload_id)
+        if ref is None or time.time() - ref["created"] >= ttl_seconds():
+            self._counters["misses"] += 1
+            raise KeyError(upload_id)
+        try:
+            os.utime(self._blob_path(ref["digest"]))
+        except OSError:
+            # Evicted by another worker between reading the ref and now.
+            self._counters["misses"] += 1
+            raise KeyError(upload_id)
+        self._counters["hits"] += 1
+        return ref
+
+    def _open_blob(self, upload_id: str, ref: dict) -> BinaryIO:
+        try:
+            return open(self._blob_path(ref["digest"]), "rb")
+        except OSError:
+            raise KeyError(upload_id)
+
+    def get(self, upload_id: str) -> dict:
+        ref = self._live(upload_id)
+        with self._open_blob(upload_id, ref) as f:
+            return {**ref["meta"], "content": f.read()}
+
+    def metadata(self, upload_id: str) -> dict:
+        return dict(self._live(upload_id)["meta"])
+
+    def open_content(self, upload_id: str) -> BinaryIO:
+        # An open handle stays readable if another worker evicts the blob.
+        return self._open_blob(upload_id, self._live(upload_id))
+
+    def _record_path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, "records", kind, f"{key}.json")
+
+    def _read_record(self, path: str) -> Optional[dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry["record"] if entry["expires"] > time.time() else None
+
+    def references(self, digest: str) -> bool:
+        return os.path.exists(self._blob_path(digest))
+
+    def get_record(self, kind: str, key: str) -> Optional[dict]:
+        return self._read_record(self._record_path(kind, key))
+
+    def update_record(self, kind: str, key: str, fn: Callable) -> Optional[dict]:
+        path = self._record_path(kind, key)
+        with self._locked():
+            record = fn(self._read_record(path))
+            if record is None:
+                self._remove(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                entry = {"record": record, "expires": time.time() + ttl_seconds()}
+                _atomic_write(path, json.dumps(entry).encode("utf-8"))
+            return record
+
+    def contains(self, upload_id: str) -> bool:
+        ref = self._read_ref(upload_id)
+        return (
+            ref is not None
+            and time.time() - ref["created"] < ttl_seconds()
+            and os.path.exists(self._blob_path(ref["digest"]))
+        )
+
+    def stats(self) -> dict:
+        blobs = os.listdir(os.path.join(self.root, "blobs"))
+        return {
+            "backend": self.name,
+            "dir": self.root,
+            "entries": len(os.listdir(os.path.join(self.root, "refs"))),
+            "blobs": len(blobs),
+            "disk_bytes": sum(
+                os.path.getsize(os.path.join(self.root, "blobs", n)) for n in blobs
+            ),
+            "disk_budget": disk_budget(),
+            "ttl_seconds": ttl_seconds(),
+            **self._counters,
+        }
+
+    def reset(self) -> None:
+        with self._locked():
+            for sub in ("refs", "blobs", "tmp"):
+                for name in os.listdir(os.path.join(self.root, sub)):
+                    self._remove(os.path.join(self.root, sub, name))
+            for kind in os.listdir(os.path.join(self.root, "records")):
+                for name in os.listdir(os.path.join(self.root, "records", kind)):
+                    self._remove(os.path.join(self.root, "records", kind, name))
+        for name in self._counters:
+            self._counters[name] = 0
+
+
+class RedisUploadStore:
+    """Blobs and refs as Redis keys, shared by every worker on every host."""
+
+    name = "redis"
+    _PREFIX = "photon:upload:"
+
+    def __init__(self, redis_url: str = None, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("redis package not installed")
+            client = redis.Redis.from_url(
+                redis_url or os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+            )
+        self._client = client
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "dedup_hits": 0}
+        self.parts = _RedisParts(self)
+
+    def _ref_key(self, upload_id: str) -> str:
+        return f"{self._PREFIX}ref:{upload_id}"
+
+    def _blob_key(self, digest: str) -> str:
+        return f"{self._PREFIX}blob:{digest}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _ttl(self) -> int:
+        return max(1, int(ttl_seconds()))
+
+    def _write_ref(self, upload_id: str, digest: str, meta: dict) -> None:
+        ttl = self._ttl()
+        ref = json.dumps({"meta": {**meta, "sha256": digest}, "digest": digest})
+        pipe = self._client.pipeline()
+        # The newest id expires last, so extending the blob to its TTL keeps
+        # the blob alive exactly as long as any id still points at it.
+        pipe.expire(self._blob_key(digest), ttl)
+        pipe.set(self._ref_key(upload_id), ref, ex=ttl)
+        pipe.execute()
+
+    def put(self, upload_id: str, data: dict) -> None:
+        content = bytes(data["content"])
+        meta = {k: v for k, v in data.items() if k != "content"}
+        digest = meta.get("sha256") or hashlib.sha256(content).hexdigest()
+        if not self._client.set(self._blob_key(digest), content, nx=True, ex=self._ttl()):
+            self._count("dedup_hits")
+        self._write_ref(upload_id, digest, meta)
+
+    def spool_file(self) -> BinaryIO:
+        tmp_dir = os.path.join(tempfile.gettempdir(), "photon", "spool")
+        os.makedirs(tmp_dir, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=tmp_dir, suffix=".part", delete=False)
+
+    def put_file(self, upload_id: str, path: str, meta: dict) -> None:
+        digest = meta["sha256"]
+        blob_key = self._blob_key(digest)
+        try:
+            if self._client.exists(blob_key):
+                self._count("dedup_hits")
+            else:
+                # Append under a private key and rename, so readers never see
+                # a partial blob and only one copy is held in memory per chunk.
+                tmp_key = f"{blob_key}:tmp:{uuid.uuid4().hex}"
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(_CHUNK_BYTES), b""):
+                        self._client.append(tmp_key, block)
+                self._client.expire(tmp_key, self._ttl())
+                # RENAMENX: when a concurrent identical upload got there first,
+                # keep its blob and drop this copy instead of overwriting it.
+                if not self._client.renamenx(tmp_key, blob_key):
+                    self._client.delete(tmp_key)
+                    self._count("dedup_hits")
+            self._write_ref(upload_id, digest, meta)
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _live(self, upload_id: str) -> dict:
+        raw = self._client.get(self._ref_key(upload_id))
+        if raw is None:
+            self._count("misses")
+            raise KeyError(upload_id)
+        self._count("hits")
+        return json.loads(raw)
+
+    def get(self, upload_id: str) -> dict:
+        ref = self._live(upload_id)
+        content = self._client.get(self._blob_key(ref["digest"]))
+        if content is None:
+            raise KeyError(upload_id)
+        return {**ref["meta"], "content": content}
+
+    def metadata(self, upload_id: str) -> dict:
+        return self._live(upload_id)["meta"]
+
+    def open_content(self, upload_id: str) -> BinaryIO:
+        return io.BytesIO(self.get(upload_id)["content"])
+
+    def contains(self, upload_id: str) -> bool:
+        return bool(self._client.exists(self._ref_key(upload_id)))
+
+    def references(self, digest: str) -> bool:
+        return bool(self._client.exists(self._blob_key(digest)))
+
+    def _record_key(self, kind: str, key: str) -> str:
+        return f"{self._PREFIX}record:{kind}:{key}"
+
+    def get_record(self, kind: str, key: str) -> Optional[dict]:
+        raw = self._client.get(self._record_key(kind, key))
+        return json.loads(raw) if raw is not None else None
+
+    def update_record(self, kind: str, key: str, fn: Callable) -> Optional[dict]:
+        name = self._record_key(kind, key)
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(name)
+                    raw = pipe.get(name)
+                    record = fn(json.loads(raw) if raw is not None else None)
+                    pipe.multi()
+                    if record is None:
+                        pipe.delete(name)
+                    else:
+                        pipe.set(name, json.dumps(record), ex=self._ttl())
+                    pipe.execute()
+                    return record
+                except redis.WatchError:
+                    # Another worker changed the record in between; re-read and retry.
+                    continue
+
+    def stats(self) -> dict:
+        entries = sum(1 for _ in self._client.scan_iter(match=f"{self._PREFIX}ref:*"))
+        blob_keys = [
+            k for k in self._client.scan_iter(match=f"{self._PREFIX}blob:*")
+            if b":tmp:" not in (k if isinstance(k, bytes) else k.encode())
+        ]
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "backend": self.name,
+            "entries": entries,
+            "blobs": len(blob_keys),
+            "bytes": sum(self._client.strlen(k) for k in blob_keys),
+            "ttl_seconds": ttl_seconds(),
+            **counters,
+        }
+
+    def reset(self) -> None:
+        keys = list(self._client.scan_iter(match=f"{self._PREFIX}*"))
+        if keys:
+            self._client.delete(*keys)
+        with self._lock:
+            for name in self._counters:
+                self._counters[name] = 0
+
+
+class _RedisPartWriter:
+    def __init__(self, client, key: str, ttl: int):
+        self._client = client
+        self._key = key
+        self._ttl = ttl
+        client.delete(key)
+
+    def write(self, block: bytes) -> None:
+        self._client.append(self._key, block)
+
+    def close(self) -> None:
+        self._client.expire(self._key, self._ttl)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _RedisParts:
+    """Session chunk parts as Redis strings, appended block by block."""
+
+    def __init__(self, store: RedisUploadStore):
+        self._store = store
+
+    def _key(self, name: str) -> str:
+        return f"{self._store._PREFIX}part:{name}"
+
+    def open(self, name: str) -> _RedisPartWriter:
+        return _RedisPartWriter(self._store._client, self._key(name), self._store._ttl())
+
+    def read(self, name: str) -> Iterator[bytes]:
+        key = self._key(name)
+        size = self._store._client.strlen(key)
+        for start in range(0, size, _CHUNK_BYTES):
+            yield self._store._client.getrange(key, start, start + _CHUNK_BYTES - 1)
+
+    def delete(self, name: str) -> None:
+        self._store._client.delete(self._key(name))
+
+
+def create(name: str):
+    if name == "disk":
+        return DiskUploadStore()
+    if name == "redis":
+        return RedisUploadStore()
+    raise ValueError(f"Unknown upload backend: {name}")
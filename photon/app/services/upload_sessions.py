@@ -0,0 +1,266 @@
+"""
+Streaming and resumable uploads.
+
+Uploaded bytes are appended to a spool file next to the upload store's spill
+files and hashed as they arrive, so memory per upload stays constant however
+large the file is. Finished spools are handed to upload_store.put_file().
+
+A resumable session receives the file as numbered chunks at explicit byte
+offsets. Each chunk is all-or-nothing: it is written to its own part in
+the upload backend and only counted once the request finishes, so a chunk
+that breaks off is dropped and the client asks the session for its offset
+and resends from there. Session state is a backend record
+(upload_store.update_record), and the parts live in the backend too, so
+the chunks of one upload may land on any worker sharing the backend.
+Completing a session assembles the parts into a spool and hashes them.
+Sessions idle for longer than PHOTON_UPLOAD_TTL_SECONDS are discarded.
+
+Settings:
+  PHOTON_MAX_UPLOAD_BYTES   largest accepted upload, default 1 GB
+"""
+
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+from app.services import upload_store
+
+log = logging.getLogger(__name__)
+
+_DEFAULT_MAX_UPLOAD_BYTES = 1024 * 1024 * 1024
+CHUNK_BYTES = 1024 * 1024
+# A chunk claimed by a worker that died mid-write is released after this.
+_CHUNK_LEASE_SECONDS = 600
+_KIND = "upload-session"
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeds PHOTON_MAX_UPLOAD_BYTES (HTTP 413)."""
+
+
+class ChunkConflict(ValueError):
+    """A chunk arrived out of order or while another chunk was being written (HTTP 409)."""
+
+
+def max_upload_bytes() -> int:
+    return int(os.environ.get("PHOTON_MAX_UPLOAD_BYTES", _DEFAULT_MAX_UPLOAD_BYTES))
+
+
+def check_size(size: int) -> None:
+    if size > max_upload_bytes():
+        raise UploadTooLarge(
+            f"Upload exceeds the {max_upload_bytes()} byte limit (PHOTON_MAX_UPLOAD_BYTES)"
+        )
+
+
+class Spool:
+    """Append-only spool file that hashes and size-checks every block written."""
+
+    def __init__(self):
+        with upload_store.spool_file() as f:
+            self.path = f.name
+        self.size = 0
+        self.hasher = hashlib.sha256()
+
+    def write(self, f, block: bytes) -> None:
+        check_size(self.size + len(block))
+        f.write(block)
+        self.hasher.update(block)
+        self.size += len(block)
+
+    def open(self):
+        """Open for appending at the current size."""
+        f = open(self.path, "r+b")
+        f.seek(self.size)
+        return f
+
+    def discard(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def commit(self, upload_id: str, meta: dict) -> str:
+        """Move the spool into the upload store; returns the content digest."""
+        digest = self.hasher.hexdigest()
+        upload_store.put_file(upload_id, self.path, {**meta, "sha256": digest})
+        return digest
+
+
+class UploadSession:
+    """A snapshot of a session's backend record."""
+
+    def __init__(self, record: dict):
+        self.id = record["id"]
+        self.filename = record["filename"]
+        self.extension = record["extension"]
+        self.declared_size = record["size"]
+        self.chunks = record["chunks"]
+        self.offset = record["offset"]
+
+    def state(self) -> dict:
+        return {
+            "session_id": self.id,
+            "filename": self.filename,
+            "offset": self.offset,
+            "next_index": self.chunks,
+            "size": self.declared_size,
+        }
+
+
+class ChunkWriter:
+    """Writes one chunk's part, enforcing the upload limit as bytes arrive."""
+
+    def __init__(self, session: UploadSession, index: int):
+        self.session = session
+        self.index = index
+        self.size = 0
+        self._part = upload_store.open_part(_part_name(session.id, index))
+
+    def write(self, block: bytes) -> None:
+        check_size(self.session.offset + self.size + len(block))
+        self._part.write(block)
+        self.size += len(block)
+
+    def close(self) -> None:
+        self._part.close()
+
+
+def _part_name(session_id: str, index: int) -> str:
+    return f"{session_id}.{index}"
+
+
+def _busy(record: dict) -> bool:
+    return record["lease"] > time.time()
+
+
+def create(filename: str, extension: str, size: Optional[int] = None) -> UploadSession:
+    """Open a resumable session; raises UploadTooLarge if the declared size is over the limit."""
+    if size is not None:
+        check_size(size)
+    record = {
+        "id": str(uuid.uuid4()), "filename": filename, "extension": extension,
+        "size": size, "chunks": 0, "offset": 0, "lease": 0,
+    }
+    upload_store.update_record(_KIND, record["id"], lambda _: record)
+    return UploadSession(record)
+
+
+def get(session_id: str) -> UploadSession:
+    """Raises KeyError if the session does not exist or has expired."""
+    record = upload_store.get_record(_KIND, session_id)
+    if record is None:
+        raise KeyError(session_id)
+    return UploadSession(record)
+
+
+def begin_chunk(session_id: str, index: int, offset: int) -> ChunkWriter:
+    """Claim the session for writing chunk index at offset; returns the chunk's writer.
+
+    Raises KeyError for unknown sessions and ChunkConflict when the chunk is
+    not the next one expected or another chunk is in flight.
+    """
+    def claim(record):
+        if record is None:
+            raise KeyError(session_id)
+        if _busy(record):
+            raise ChunkConflict("Another chunk is being written to this session")
+        if index != record["chunks"] or offset != record["offset"]:
+            raise ChunkConflict(
+                f"Expected chunk {record['chunks']} at offset {record['offset']}, "
+                f"got chunk {index} at offset {offset}"
+            )
+        return {**record, "lease": time.time() + _CHUNK_LEASE_SECONDS}
+
+    session = UploadSession(upload_store.update_record(_KIND, session_id, claim))
+    try:
+        return ChunkWriter(session, index)
+    except BaseException:
+        upload_store.update_record(_KIND, session_id, lambda r: r and {**r, "lease": 0})
+        raise
+
+
+def end_chunk(writer: ChunkWriter, ok: bool) -> UploadSession:
+    """Release the session, counting the chunk or dropping its part."""
+    writer.close()
+    if not ok:
+        upload_store.delete_part(_part_name(writer.session.id, writer.index))
+
+    def release(record):
+        if record is None:
+            return None
+        if ok:
+            record = {**record, "chunks": record["chunks"] + 1, "offset": record["offset"] + writer.size}
+        return {**record, "lease": 0}
+
+    record = upload_store.update_record(_KIND, writer.session.id, release)
+    if record is None:
+        raise KeyError(writer.session.id)
+    return UploadSession(record)
+
+
+def _delete_parts(session: UploadSession) -> None:
+    for index in range(session.chunks + 1):
+        upload_store.delete_part(_part_name(session.id, index))
+
+
+def complete(session_id: str, sha256: Optional[str] = None) -> tuple:
+    """Finish a session and store its upload; returns (upload_id, digest, filename).
+
+    Raises KeyError for unknown sessions, ChunkConflict while a chunk is in
+    flight, and ValueError when the declared size or sha256 does not match.
+    """
+    def claim(record):
+        if record is None:
+            raise KeyError(session_id)
+        if _busy(record):
+            raise ChunkConflict("A chunk is still being written to this session")
+        if record["size"] is not None and record["offset"] != record["size"]:
+            raise ValueError(
+                f"Received {record['offset']} of {record['size']} bytes; upload is incomplete"
+            )
+        return {**record, "lease": time.time() + _CHUNK_LEASE_SECONDS}
+
+    session = UploadSession(upload_store.update_record(_KIND, session_id, claim))
+    spool = Spool()
+    try:
+        with spool.open() as f:
+            for index in range(session.chunks):
+                for block in upload_store.read_part(_part_name(session_id, index)):
+                    spool.write(f, block)
+        if spool.size != session.offset:
+            raise KeyError(session_id)
+        digest = spool.hasher.hexdigest()
+        if sha256 and sha256.lower() != digest:
+            raise ValueError("Checksum mismatch: received bytes do not match sha256")
+    except KeyError:
+        spool.discard()
+        abort(session_id)
+        raise ValueError("Upload session data was lost; start the upload again")
+    except BaseException:
+        spool.discard()
+        upload_store.update_record(_KIND, session_id, lambda r: r and {**r, "lease": 0})
+        raise
+
+    upload_id = str(uuid.uuid4())
+    spool.commit(upload_id, {"filename": session.filename, "extension": session.extension})
+    upload_store.update_record(_KIND, session_id, lambda _: None)
+    _delete_parts(session)
+    log.info("Upload session %s completed as %s (%d bytes)", session_id, upload_id, session.offset)
+    return upload_id, digest, session.filename
+
+
+def abort(session_id: str) -> None:
+    removed = []
+
+    def drop(record):
+        if record is not None:
+            removed.append(record)
+        return None
+
+    upload_store.update_record(_KIND, session_id, drop)
+    if removed:
+        _delete_parts(UploadSession(removed[0]))
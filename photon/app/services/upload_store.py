@@ -1,13 +1,521 @@
-_store: dict = {}
+"""
+Store for uploaded files, behind a pluggable backend.
+
+PHOTON_UPLOAD_BACKEND picks where uploads live:
+  memory  (default) this process only; a single API worker
+  disk    a directory shared by every worker on the host (see upload_backends)
+  redis   a Redis server shared by every host, at REDIS_URL (see upload_backends)
+
+All backends store content once per SHA-256 digest, as a blob that every
+photon-upload:// id with the same bytes points at. Uploading the same file
+again (another tab, another session) only adds an id. Artifacts derived
+from an upload (columnar copy, profile) are keyed by the same digest, so
+they are shared too. Each id expires PHOTON_UPLOAD_TTL_SECONDS after it
+was uploaded; a blob goes when its last id does.
+
+The memory backend keeps blobs in memory until the in-memory byte budget
+is exceeded; the least recently used blobs then spill their content to a
+local directory and are read back transparently on the next get().
+Spilled blobs are deleted for good once the disk budget is exceeded,
+taking every id that points at them along.
+
+Backends also hold the small shared state that has to follow a user from
+worker to worker: records (resumable session offsets, pre-processing
+progress) changed atomically through update_record(), and the chunk
+parts of resumable sessions. Both expire PHOTON_UPLOAD_TTL_SECONDS after
+their last write.
+
+Content is kept as raw bytes. open_content() hands readers a BytesIO over the
+stored buffer, or the spill file itself, so parsing never copies or
+reloads the upload; transports that need text (JSON, base64) encode at
+their own edge. A spill file that is reloaded or evicted while readers
+have it open is removed when the last of them closes, since Windows
+cannot delete an open file.
+
+Settings (read on each call):
+  PHOTON_UPLOAD_BACKEND        memory | disk | redis, default memory
+  PHOTON_UPLOAD_TTL_SECONDS    default 24 h
+  PHOTON_UPLOAD_MEMORY_BYTES   default 256 MB
+  PHOTON_UPLOAD_DISK_BYTES     default 8 GB
+  PHOTON_UPLOAD_SPILL_DIR      default <tmp>/photon/uploads
+"""
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import BinaryIO, Callable, Iterator, Optional
+
+from app.services import columnar_store
+
+log = logging.getLogger(__name__)
+
+_DEFAULT_TTL_SECONDS = 24 * 3600
+_DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+_DEFAULT_DISK_BYTES = 8 * 1024 * 1024 * 1024
+_PART_READ_BYTES = 1024 * 1024
+
+
+def ttl_seconds() -> float:
+    return float(os.environ.get("PHOTON_UPLOAD_TTL_SECONDS", _DEFAULT_TTL_SECONDS))
+
+
+def disk_budget() -> int:
+    return int(os.environ.get("PHOTON_UPLOAD_DISK_BYTES", _DEFAULT_DISK_BYTES))
+
+
+def _memory_budget() -> int:
+    return int(os.environ.get("PHOTON_UPLOAD_MEMORY_BYTES", _DEFAULT_MEMORY_BYTES))
+
+
+def _spill_dir() -> str:
+    return os.environ.get(
+        "PHOTON_UPLOAD_SPILL_DIR", os.path.join(tempfile.gettempdir(), "photon", "uploads")
+    )
+
+
+class FileParts:
+    """Session chunk parts as <name>.chunk files in a directory.
+
+    Parts whose session was abandoned are swept once they are older than
+    the upload TTL.
+    """
+
+    def __init__(self, directory: Callable[[], str]):
+        self._directory = directory
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._directory(), f"{name}.chunk")
+
+    def _sweep(self) -> None:
+        cutoff = time.time() - ttl_seconds()
+        for entry in os.scandir(self._directory()):
+            try:
+                if entry.name.endswith(".chunk") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def open(self, name: str) -> BinaryIO:
+        os.makedirs(self._directory(), exist_ok=True)
+        self._sweep()
+        return open(self._path(name), "wb")
+
+    def read(self, name: str) -> Iterator[bytes]:
+        try:
+            f = open(self._path(name), "rb")
+        except OSError:
+            raise KeyError(name)
+        with f:
+            while block := f.read(_PART_READ_BYTES):
+                yield block
+
+    def delete(self, name: str) -> None:
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+
+class _Blob:
+    __slots__ = ("content", "size", "spilled", "refs")
+
+    def __init__(self, content, size: int, spilled: bool):
+        self.content = content
+        self.size = size
+        self.spilled = spilled
+        self.refs = 0
+
+
+class _Ref:
+    __slots__ = ("meta", "digest", "created")
+
+    def __init__(self, meta: dict, digest: str, created: float):
+        self.meta = meta
+        self.digest = digest
+        self.created = created
+
+
+class NotifyingReader(io.BufferedReader):
+    """Read handle on a file that calls on_close once when closed, so its owner
+    can keep the file until the last reader is done."""
+
+    def __init__(self, path: str, on_close):
+        super().__init__(io.FileIO(path, "rb"))
+        self._on_close = on_close
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            super().close()
+        finally:
+            self._on_close()
+
+
+class MemoryUploadStore:
+    """Process-local blobs with an in-memory budget and spill to local disk."""
+
+    name = "memory"
+
+    def __init__(self):
+        # Reentrant: a reader garbage-collected while the lock is held closes itself.
+        self._lock = threading.RLock()
+        self._blobs: "OrderedDict[str, _Blob]" = OrderedDict()
+        self._refs: dict = {}
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._readers: Counter = Counter()
+        self._deferred: set = set()
+        self._records: dict = {}
+        self.parts = FileParts(_spill_dir)
+        self._counters = {
+            "hits": 0, "misses": 0, "dedup_hits": 0, "spills": 0, "reloads": 0,
+            "evictions": 0, "expirations": 0,
+        }
+
+    def _spill_path(self, digest: str) -> str:
+        return os.path.join(_spill_dir(), f"{digest}.bin")
+
+    def _remove_spill(self, digest: str) -> None:
+        """Delete digest's spill file, or defer it while readers have it open. Caller holds the lock."""
+        if self._readers[digest]:
+            self._deferred.add(digest)
+            return
+        try:
+            os.remove(self._spill_path(digest))
+        except OSError:
+            pass
+
+    def _reuse_spill(self, digest: str) -> bool:
+        """Take back a spill file whose removal was deferred; it already holds digest's bytes.
+        Caller holds the lock."""
+        if digest in self._deferred:
+            self._deferred.discard(digest)
+            return True
+        return False
+
+    def _reader_closed(self, digest: str) -> None:
+        with self._lock:
+            self._readers[digest] -= 1
+            if self._readers[digest] > 0:
+                return
+            del self._readers[digest]
+            if digest in self._deferred:
+                self._deferred.discard(digest)
+                self._remove_spill(digest)
+
+    def _spill(self, digest: str, blob: _Blob) -> None:
+        """Move a blob's content to disk. Caller holds the lock."""
+        os.makedirs(_spill_dir(), exist_ok=True)
+        if not self._reuse_spill(digest):
+            with open(self._spill_path(digest), "wb") as f:
+                f.write(blob.content)
+        blob.content = None
+        blob.spilled = True
+        self._memory_bytes -= blob.size
+        self._disk_bytes += blob.size
+        self._counters["spills"] += 1
+
+    def _drop_blob(self, digest: str) -> None:
+        """Delete a blob and its derived columnar copy. Caller holds the lock."""
+        blob = self._blobs.pop(digest)
+        if blob.spilled:
+            self._disk_bytes -= blob.size
+            self._remove_spill(digest)
+        else:
+            self._memory_bytes -= blob.size
+        release_columnar(digest)
+
+    def _release(self, upload_id: str, reason: str) -> None:
+        """Remove an upload id, dropping its blob with the last reference. Caller holds the lock."""
+        ref = self._refs.pop(upload_id)
+        self._counters[reason] += 1
+        blob = self._blobs.get(ref.digest)
+        if blob is not None:
+            blob.refs -= 1
+            if blob.refs <= 0:
+                self._drop_blob(ref.digest)
+
+    def _enforce(self) -> None:
+        """Expire, spill and evict until both budgets hold. Caller holds the lock."""
+        now = time.time()
+        ttl = ttl_seconds()
+        for upload_id in [k for k, r in self._refs.items() if now - r.created >= ttl]:
+            self._release(upload_id, "expirations")
+
+        memory_budget = _memory_budget()
+        if self._memory_bytes > memory_budget:
+            for digest, blob in list(self._blobs.items()):
+                if self._memory_bytes <= memory_budget:
+                    break
+                if not blob.spilled:
+                    self._spill(digest, blob)
+
+        limit = disk_budget()
+        if self._disk_bytes > limit:
+            for digest, blob in list(self._blobs.items()):
+                if self._disk_bytes <= limit:
+                    break
+                if blob.spilled:
+                    for upload_id in [k for k, r in self._refs.items() if r.digest == digest]:
+                        self._release(upload_id, "evictions")
+
+    def _add_ref(self, upload_id: str, digest: str, meta: dict) -> None:
+        """Point upload_id at an existing blob. Caller holds the lock."""
+        if upload_id in self._refs:
+            self._release(upload_id, "evictions")
+        self._refs[upload_id] = _Ref({**meta, "sha256": digest}, digest, time.time())
+        self._blobs[digest].refs += 1
+        self._blobs.move_to_end(digest)
+
+    def put(self, upload_id: str, data: dict) -> None:
+        content = bytes(data["content"])
+        meta = {k: v for k, v in data.items() if k != "content"}
+        digest = meta.get("sha256") or hashlib.sha256(content).hexdigest()
+        with self._lock:
+            if digest in self._blobs:
+                self._counters["dedup_hits"] += 1
+            else:
+                self._blobs[digest] = _Blob(content, len(content), spilled=False)
+                self._memory_bytes += len(content)
+            self._add_ref(upload_id, digest, meta)
+            self._enforce()
+
+    def spool_file(self) -> BinaryIO:
+        os.makedirs(_spill_dir(), exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=_spill_dir(), suffix=".part", delete=False)
+
+    def put_file(self, upload_id: str, path: str, meta: dict) -> None:
+        digest = meta["sha256"]
+        with self._lock:
+            if digest in self._blobs:
+                self._counters["dedup_hits"] += 1
+                os.remove(path)
+            else:
+                size = os.path.getsize(path)
+                if self._reuse_spill(digest):
+                    os.remove(path)
+                else:
+                    os.replace(path, self._spill_path(digest))
+                self._blobs[digest] = _Blob(None, size, spilled=True)
+                self._disk_bytes += size
+            self._add_ref(upload_id, digest, meta)
+            self._enforce()
+
+    def _live(self, upload_id: str) -> tuple:
+        """Look up an unexpired id and mark its blob recently used. Caller holds the lock."""
+        self._enforce()
+        ref = self._refs.get(upload_id)
+        if ref is None:
+            self._counters["misses"] += 1
+            raise KeyError(upload_id)
+        self._blobs.move_to_end(ref.digest)
+        self._counters["hits"] += 1
+        return ref, self._blobs[ref.digest]
+
+    def get(self, upload_id: str) -> dict:
+        with self._lock:
+            ref, blob = self._live(upload_id)
+            if blob.spilled:
+                path = self._spill_path(ref.digest)
+                with open(path, "rb") as f:
+                    blob.content = f.read()
+                blob.spilled = False
+                self._disk_bytes -= blob.size
+                self._memory_bytes += blob.size
+                self._remove_spill(ref.digest)
+                self._counters["reloads"] += 1
+                self._enforce()
+            return {**ref.meta, "content": blob.content}
+
+    def metadata(self, upload_id: str) -> dict:
+        with self._lock:
+            ref, _ = self._live(upload_id)
+            return dict(ref.meta)
+
+    def open_content(self, upload_id: str) -> BinaryIO:
+        with self._lock:
+            ref, blob = self._live(upload_id)
+            if not blob.spilled:
+                return io.BytesIO(blob.content)
+            # Reloading or evicting the blob leaves the file until this handle closes.
+            self._readers[ref.digest] += 1
+            return NotifyingReader(
+                self._spill_path(ref.digest), lambda: self._reader_closed(ref.digest)
+            )
+
+    def references(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._blobs
+
+    def get_record(self, kind: str, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._records.get((kind, key))
+            if entry is None or entry[1] <= time.time():
+                return None
+            return dict(entry[0])
+
+    def update_record(self, kind: str, key: str, fn: Callable) -> Optional[dict]:
+        with self._lock:
+            now = time.time()
+            self._records = {k: v for k, v in self._records.items() if v[1] > now}
+            entry = self._records.get((kind, key))
+            record = fn(dict(entry[0]) if entry else None)
+            if record is None:
+                self._records.pop((kind, key), None)
+            else:
+                self._records[(kind, key)] = (dict(record), now + ttl_seconds())
+            return record
+
+    def contains(self, upload_id: str) -> bool:
+        with self._lock:
+            ref = self._refs.get(upload_id)
+            return ref is not None and time.time() - ref.created < ttl_seconds()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "entries": len(self._refs),
+                "blobs": len(self._blobs),
+                "memory_entries": sum(1 for b in self._blobs.values() if not b.spilled),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget": _memory_budget(),
+                "disk_entries": sum(1 for b in self._blobs.values() if b.spilled),
+                "disk_bytes": self._disk_bytes,
+                "disk_budget": disk_budget(),
+                "ttl_seconds": ttl_seconds(),
+                **self._counters,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            for upload_id in list(self._refs):
+                self._release(upload_id, "evictions")
+            self._records.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _get_backend():
+    """Return the backend named by PHOTON_UPLOAD_BACKEND, building it on first use."""
+    global _backend
+    name = os.environ.get("PHOTON_UPLOAD_BACKEND", "memory").lower()
+    with _backend_lock:
+        if _backend is None or _backend.name != name:
+            if name == "memory":
+                _backend = MemoryUploadStore()
+            elif name in ("disk", "redis"):
+                from app.services import upload_backends
+
+                _backend = upload_backends.create(name)
+            else:
+                raise ValueError(f"Unknown PHOTON_UPLOAD_BACKEND: {name}")
+            log.info("Upload store backend: %s", name)
+        return _backend
 
 
 def put(upload_id: str, data: dict) -> None:
-    _store[upload_id] = data
+    """Store data["content"] (bytes-like) with the remaining keys as metadata.
+
+    data["sha256"], when present, must be the digest of the content.
+    """
+    _get_backend().put(upload_id, data)
+
+
+def spool_file() -> BinaryIO:
+    """Open a new temporary file on the backend's filesystem, for put_file() to adopt."""
+    return _get_backend().spool_file()
+
+
+def put_file(upload_id: str, path: str, meta: dict) -> None:
+    """Store the file at path (from spool_file()) without reading it into memory.
+
+    meta["sha256"] must be the file's digest. The file is consumed: moved
+    into the store, or deleted if the content is already stored.
+    """
+    _get_backend().put_file(upload_id, path, meta)
 
 
 def get(upload_id: str) -> dict:
-    return _store[upload_id]  # raises KeyError if not found
+    """Return the upload's metadata and content; raises KeyError if missing or expired."""
+    return _get_backend().get(upload_id)
+
+
+def metadata(upload_id: str) -> dict:
+    """Return the upload's metadata without touching its content; raises KeyError."""
+    return _get_backend().metadata(upload_id)
+
+
+def open_content(upload_id: str) -> BinaryIO:
+    """Open the upload for reading without copying it where the backend allows; raises KeyError.
+
+    In-memory content is wrapped in a BytesIO, which shares the stored
+    buffer; content on disk is read straight from its file.
+    """
+    return _get_backend().open_content(upload_id)
 
 
 def contains(upload_id: str) -> bool:
-    return upload_id in _store
+    return _get_backend().contains(upload_id)
+
+
+def references(digest: str) -> bool:
+    """True while any stored upload has content with this digest."""
+    return _get_backend().references(digest)
+
+
+def release_columnar(digest: str) -> None:
+    """Delete digest's columnar copies unless a cached URL download still has that content."""
+    from app.services import http_cache
+
+    if not http_cache.references(digest):
+        columnar_store.delete(digest)
+
+
+def get_record(kind: str, key: str) -> Optional[dict]:
+    """Return the shared record kind/key, or None if it is missing or expired."""
+    return _get_backend().get_record(kind, key)
+
+
+def update_record(kind: str, key: str, fn: Callable) -> Optional[dict]:
+    """Atomically replace record kind/key with fn(current record or None).
+
+    fn returns the new record, or None to delete it; an exception from fn
+    leaves the record unchanged. Every worker sharing the backend sees the
+    result, and the record expires PHOTON_UPLOAD_TTL_SECONDS after this write.
+    """
+    return _get_backend().update_record(kind, key, fn)
+
+
+def open_part(name: str) -> BinaryIO:
+    """Open a new session chunk part for writing (write() and close() only)."""
+    return _get_backend().parts.open(name)
+
+
+def read_part(name: str) -> Iterator[bytes]:
+    """Yield a part's bytes in blocks; raises KeyError if it is missing."""
+    return _get_backend().parts.read(name)
+
+
+def delete_part(name: str) -> None:
+    _get_backend().parts.delete(name)
+
+
+def stats() -> dict:
+    """Occupancy and eviction counters for /health/caches."""
+    return _get_backend().stats()
+
+
+def _reset() -> None:
+    """Drop every entry. For use in tests only."""
+    _get_backend().reset()
@@ -9,11 +9,13 @@ _CHROMA_DEFAULT = os.path.normpath(
 )
 _COLLECTION_NAME = "photon_datasets"
 _PLAYBOOKS_COLLECTION_NAME = "photon_playbooks"
+_CODE_COLLECTION_NAME = "photon_code_cache"
 
 # Lazily initialized singletons — one client and one collection per process.
 _client = None
 _collection = None
 _playbooks_collection = None
+_code_collection = None
 
 
 def _ensure_client() -> None:
@@ -54,6 +56,18 @@ def _get_playbooks_collection():
     return _playbooks_collection
 
 
+def _get_code_collection():
+    global _code_collection
+    if _code_collection is not None:
+        return _code_collection
+    _ensure_client()
+    _code_collection = _client.get_or_create_collection(
+        name=_CODE_COLLECTION_NAME,
+        metadata={"hnsw:space": "cosine"},
+    )
+    return _code_collection
+
+
 # ── Dataset store ────────────────────────────────────────────────────────────
 
 def add_dataset(dataset: dict) -> None:
@@ -151,18 +165,74 @@ def search_playbooks(data_type: str) -> str:
     return docs[0] if docs else ""
 
 
+# ── Code cache store ─────────────────────────────────────────────────────────
+
+def add_code_example(
+    entry_id: str, question: str, code: str, embedding: list, metadata: dict
+) -> None:
+    """Upsert generated analysis code under the embedding of its question.
+
+    The caller embeds the question (it already has the embedding from the
+    lookup that missed). metadata values must be strings.
+    """
+    _get_code_collection().upsert(
+        ids=[entry_id],
+        embeddings=[embedding],
+        documents=[code],
+        metadatas=[{**metadata, "question": question}],
+    )
+
+
+def search_code_examples(embedding: list, where: dict, top_k: int = 1) -> list:
+    """Return the top_k code entries matching the where filter, nearest first.
+
+    Returns a list of dicts: {"id": str, "score": float, "code": str, "meta": dict}
+    Score is cosine similarity (1 = identical).
+    """
+    coll = _get_code_collection()
+    if coll.count() == 0:
+        return []
+    raw = coll.query(
+        query_embeddings=[embedding],
+        n_results=top_k,
+        where=where,
+        include=["documents", "metadatas", "distances"],
+    )
+    ids = raw.get("ids", [[]])[0]
+    documents = raw.get("documents", [[]])[0]
+    metadatas = raw.get("metadatas", [[]])[0]
+    distances = raw.get("distances", [[]])[0]
+    return [
+        {
+            "id": ids[i],
+            "score": round(1.0 - distances[i], 4),
+            "code": documents[i],
+            "meta": metadatas[i],
+        }
+        for i in range(len(ids))
+    ]
+
+
+def delete_code_example(entry_id: str) -> None:
+    _get_code_collection().delete(ids=[entry_id])
+
+
+def count_code_examples() -> int:
+    return _get_code_collection().count()
+
+
 # ── Test helpers ─────────────────────────────────────────────────────────────
 
 def _reset(persist_dir: str = None) -> None:
     """Reset singleton state. For use in tests only.
 
-    Deletes both collections before clearing references so that
+    Deletes all collections before clearing references so that
     EphemeralClient (a process-level singleton in ChromaDB 1.x)
     starts clean for the next test.
     """
-    global _client, _collection, _playbooks_collection
+    global _client, _collection, _playbooks_collection, _code_collection
     if _client is not None:
-        for name in (_COLLECTION_NAME, _PLAYBOOKS_COLLECTION_NAME):
+        for name in (_COLLECTION_NAME, _PLAYBOOKS_COLLECTION_NAME, _CODE_COLLECTION_NAME):
             try:
                 _client.delete_collection(name)
             except Exception:
@@ -170,5 +240,6 @@ def _reset(persist_dir: str = None) -> None:
     _client = None
     _collection = None
     _playbooks_collection = None
+    _code_collection = None
     if persist_dir is not None:
         os.environ["CHROMA_PERSIST_DIR"] = persist_dir
@@ -0,0 +1,206 @@
+"""
+SQLite cache of complete /workflow/generate results.
+
+Re-asking the same question about the same data costs three LLM calls and
+a Lambda run, so finished results are stored under a key built from
+everything that shapes them:
+  - the dataset content digest (per sheet, as in the profile cache)
+  - the question, lower-cased with whitespace collapsed
+  - the conversation history as the prompts see it (last 6 messages,
+    content truncated to 300 characters). Assistant turns count by role
+    only: their text is the narrative of the question before them, which
+    clients reformat before sending it back (the UI strips markdown), and
+    keying on it would keep follow-ups precomputed by speculation.py from
+    ever matching.
+  - a hash of the methodology playbook, so editing a playbook invalidates its entries
+  - the source path the generated code reads from
+  - the LLM model id
+
+Entries expire PHOTON_WORKFLOW_CACHE_TTL seconds after they are written.
+When the database holds more than PHOTON_WORKFLOW_CACHE_MAX_BYTES of
+results, least recently used entries are evicted. The database lives at
+PHOTON_WORKFLOW_CACHE_PATH and is shared by every worker on the host;
+PHOTON_WORKFLOW_CACHE=0 turns the cache off.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+_DEFAULT_TTL_SECONDS = 24 * 3600
+_DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+_HISTORY_MESSAGES = 6
+_HISTORY_CHARS = 300
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+
+def enabled() -> bool:
+    return os.environ.get("PHOTON_WORKFLOW_CACHE", "1") == "1"
+
+
+def _path() -> str:
+    return os.environ.get(
+        "PHOTON_WORKFLOW_CACHE_PATH",
+        os.path.join(tempfile.gettempdir(), "photon", "workflow_cache.sqlite3"),
+    )
+
+
+def _ttl() -> float:
+    return float(os.environ.get("PHOTON_WORKFLOW_CACHE_TTL", _DEFAULT_TTL_SECONDS))
+
+
+def _max_bytes() -> int:
+    return int(os.environ.get("PHOTON_WORKFLOW_CACHE_MAX_BYTES", _DEFAULT_MAX_BYTES))
+
+
+@contextmanager
+def _db():
+    """A connection that commits on success and is always closed."""
+    path = _path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case question and collapse whitespace, for comparing questions."""
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+def _history_key(conversation_history: list) -> list:
+    parts = []
+    for msg in conversation_history[-_HISTORY_MESSAGES:]:
+        role = msg.get("role", "")
+        content = "" if role == "assistant" else str(msg.get("content", ""))[:_HISTORY_CHARS]
+        parts.append([role, content])
+    return parts
+
+
+def make_key(
+    digest: str,
+    question: str,
+    conversation_history: list,
+    playbook: str,
+    code_source: str,
+    model: str,
+) -> str:
+    """Cache key for one workflow result; see the module docstring for the parts."""
+    parts = {
+        "dataset": digest,
+        "question": normalize_question(question),
+        "history": _history_key(conversation_history),
+        "playbook": hashlib.sha256(playbook.encode("utf-8")).hexdigest(),
+        "source": code_source,
+        "model": model,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[dict]:
+    """Return the cached result for key, or None when absent or expired."""
+    now = time.time()
+    try:
+        with _lock, _db() as conn:
+            row = conn.execute(
+                "SELECT value, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > _ttl():
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                _counters["misses"] += 1
+                return None
+            conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            _counters["hits"] += 1
+    except sqlite3.Error as e:
+        log.warning("Workflow cache read failed: %s", e)
+        return None
+    return json.loads(row[0])
+
+
+def put(key: str, result: dict) -> None:
+    """Store result under key, evicting expired and least recently used entries."""
+    raw = json.dumps(result, default=str)
+    now = time.time()
+    max_bytes = _max_bytes()
+    if len(raw) > max_bytes:
+        return
+    try:
+        with _lock, _db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, raw, len(raw), now, now),
+            )
+            _counters["writes"] += 1
+            conn.execute("DELETE FROM results WHERE created < ?", (now - _ttl(),))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > max_bytes:
+                rows = conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall()
+                for old_key, size in rows:
+                    if total <= max_bytes:
+                        break
+                    conn.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                    total -= size
+                    _counters["evictions"] += 1
+    except sqlite3.Error as e:
+        log.warning("Workflow cache write failed: %s", e)
+
+
+def stats() -> dict:
+    with _lock:
+        counters = dict(_counters)
+    entries, size = 0, 0
+    if enabled():
+        try:
+            with _lock, _db() as conn:
+                entries, size = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+                ).fetchone()
+        except sqlite3.Error as e:
+            log.warning("Workflow cache stats failed: %s", e)
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        "enabled": enabled(),
+        "path": _path(),
+        "entries": entries,
+        "bytes": size,
+        "max_bytes": _max_bytes(),
+        **counters,
+        "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+    }
+
+
+def _reset() -> None:
+    """Zero the counters. For use in tests only."""
+    with _lock:
+        for name in _counters:
+            _counters[name] = 0
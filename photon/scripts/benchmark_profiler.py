@@ -0,0 +1,230 @@
+"""Benchmark load_dataframe() and profile() over a grid of synthetic datasets.
+
+Datasets cover the three profiler classifications (tabular, time_series,
+wide_format) across row counts, column counts, dtype mixes and null ratios.
+Tabular data reuses the manufacturing generator from generate_demo_data.py.
+A frame is wide_format only below 100 rows, so wide cases scale by column
+count instead of row count.
+Each case is written to a temporary CSV, loaded and profiled --repeat times
+(best time wins), then profiled once more under tracemalloc for the
+profiler's own peak memory (Python and NumPy allocations made by profile()
+on the already loaded frame; loading is not traced).
+
+Run from the photon/ directory:
+    python -m scripts.benchmark_profiler --save-baseline data/benchmarks/profiler_baseline.json
+    python -m scripts.benchmark_profiler --baseline data/benchmarks/profiler_baseline.json --tolerance 0.2
+
+data/benchmarks/profiler_baseline.json is the committed quick-grid baseline;
+data/benchmarks/README.md has it as a table. --smoke runs tiny sizes once,
+which tests/test_benchmark_profiler.py uses to keep the script working.
+
+With --baseline the script exits 1 when any case's load or profile
+throughput (rows/s) drops more than --tolerance below the baseline.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.profiler import load_dataframe, profile
+from scripts.generate_demo_data import generate as generate_manufacturing
+
+QUICK_GRID = {
+    "rows": [1_000, 20_000],
+    "wide_rows": [50],
+    "wide_columns": [40, 1_000],
+    "mixes": ["numeric", "mixed"],
+    "null_ratios": [0.0, 0.2],
+}
+FULL_GRID = {
+    "rows": [1_000, 50_000, 500_000],
+    "wide_rows": [20, 90],
+    "wide_columns": [40, 1_000, 10_000],
+    "mixes": ["numeric", "mixed", "string"],
+    "null_ratios": [0.0, 0.2],
+}
+SMOKE_GRID = {
+    "rows": [200],
+    "wide_rows": [30],
+    "wide_columns": [25],
+    "mixes": ["mixed"],
+    "null_ratios": [0.2],
+}
+_STRING_SHARE = {"numeric": 0.0, "mixed": 0.5, "string": 0.9}
+
+
+def _inject_nulls(df: pd.DataFrame, ratio: float, rng: np.random.Generator) -> pd.DataFrame:
+    if ratio <= 0:
+        return df
+    out = df.copy()
+    for col in out.columns[1:]:
+        mask = rng.random(len(out)) < ratio
+        out[col] = out[col].mask(mask)
+    return out
+
+
+def _columns(rows: int, count: int, string_share: float, rng: np.random.Generator) -> dict:
+    n_strings = int(round(count * string_share))
+    data = {}
+    for i in range(count):
+        if i < n_strings:
+            data[f"s{i}"] = rng.choice([f"cat-{k}" for k in range(20)], size=rows)
+        else:
+            data[f"x{i}"] = rng.normal(size=rows).round(3)
+    return data
+
+
+def make_tabular(rows: int, mix: str, null_ratio: float, seed: int = 0) -> pd.DataFrame:
+    # A date column next to numeric ones would make the profiler call this a time series.
+    df = generate_manufacturing(rows, seed=42 + seed).drop(columns=["date"])
+    if mix == "numeric":
+        df = df.select_dtypes("number")
+    elif mix == "string":
+        df = df.select_dtypes(exclude="number")
+    return _inject_nulls(df, null_ratio, np.random.default_rng(seed))
+
+
+def make_time_series(rows: int, mix: str, null_ratio: float, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {"timestamp": pd.date_range("2000-01-01", periods=rows, freq="h").strftime("%Y-%m-%d %H:%M")}
+    data.update(_columns(rows, 8, _STRING_SHARE[mix] / 2, rng))
+    return _inject_nulls(pd.DataFrame(data), null_ratio, rng)
+
+
+def make_wide(rows: int, columns: int, mix: str, null_ratio: float, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {"id": np.arange(rows)}
+    data.update(_columns(rows, columns, _STRING_SHARE[mix], rng))
+    return _inject_nulls(pd.DataFrame(data), null_ratio, rng)
+
+
+def build_cases(grid: dict):
+    """Yield (name, DataFrame factory) pairs for every point of the grid.
+
+    Names start with the data_type the profiler should report for the case.
+    """
+    for mix in grid["mixes"]:
+        for nulls in grid["null_ratios"]:
+            for rows in grid["rows"]:
+                suffix = f"r{rows}-{mix}-n{int(nulls * 100)}"
+                yield f"tabular-{suffix}", lambda r=rows, m=mix, n=nulls: make_tabular(r, m, n)
+                yield f"time_series-{suffix}", lambda r=rows, m=mix, n=nulls: make_time_series(r, m, n)
+            for rows in grid["wide_rows"]:
+                for cols in grid["wide_columns"]:
+                    yield (
+                        f"wide_format-c{cols}-r{rows}-{mix}-n{int(nulls * 100)}",
+                        lambda r=rows, c=cols, m=mix, n=nulls: make_wide(r, c, m, n),
+                    )
+
+
+def _best_of(repeat: int, fn):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_case(name: str, factory, workdir: str, repeat: int) -> dict:
+    df = factory()
+    path = os.path.join(workdir, f"{name}.csv")
+    df.to_csv(path, index=False)
+    rows = len(df)
+    del df
+
+    load_s, loaded = _best_of(repeat, lambda: load_dataframe(path))
+    profile_s, result = _best_of(repeat, lambda: profile(loaded))
+
+    os.remove(path)
+    # Started after loading so the reader's buffers do not mask the profiler's own peak.
+    tracemalloc.start()
+    profile(loaded)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "rows": rows,
+        "columns": result["column_count"],
+        "data_type": result["data_type"],
+        "load_s": round(load_s, 4),
+        "profile_s": round(profile_s, 4),
+        "load_rows_per_s": round(rows / load_s, 1) if load_s else None,
+        "profile_rows_per_s": round(rows / profile_s, 1) if profile_s else None,
+        "profile_peak_mb": round(peak / (1024 * 1024), 2),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return human-readable regressions where throughput fell below baseline * (1 - tolerance)."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ("load_rows_per_s", "profile_rows_per_s"):
+            if not base.get(metric) or not current.get(metric):
+                continue
+            floor = base[metric] * (1 - tolerance)
+            if current[metric] < floor:
+                drop = 1 - current[metric] / base[metric]
+                regressions.append(
+                    f"{name}: {metric} {current[metric]:.0f} vs baseline {base[metric]:.0f} (-{drop:.0%})"
+                )
+    return regressions
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    size = p.add_mutually_exclusive_group()
+    size.add_argument("--full", action="store_true", help="Run the full grid instead of the quick one")
+    size.add_argument("--smoke", action="store_true", help="Run tiny sizes to check the script works")
+    p.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the best is kept")
+    p.add_argument("--only", help="Run only cases whose name contains this substring")
+    p.add_argument("--save-baseline", help="Write results to this JSON file")
+    p.add_argument("--baseline", help="Compare against this JSON baseline")
+    p.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput drop (0.2 = 20%%)")
+    args = p.parse_args(argv)
+
+    grid = FULL_GRID if args.full else SMOKE_GRID if args.smoke else QUICK_GRID
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="photon-bench-") as workdir:
+        for name, factory in build_cases(grid):
+            if args.only and args.only not in name:
+                continue
+            res = run_case(name, factory, workdir, args.repeat)
+            results[name] = res
+            print(
+                f"{name:45s} load {res['load_s']*1000:8.1f} ms  "
+                f"profile {res['profile_s']*1000:8.1f} ms  peak {res['profile_peak_mb']:8.2f} MB"
+            )
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} tolerance:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} tolerance.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Smoke test for scripts/benchmark_profiler.py.
+
+Runs the --smoke grid (a few hundred rows) once so the script keeps working
+as the profiler changes. Timings are not checked here; the committed
+baseline in data/benchmarks is for manual comparison.
+"""
+import json
+import os
+
+import pytest
+
+from scripts import benchmark_profiler
+
+_BASELINE = os.path.join(
+    os.path.dirname(__file__), "..", "data", "benchmarks", "profiler_baseline.json"
+)
+
+
+def test_smoke_grid_runs_and_compares(tmp_path):
+    out = tmp_path / "baseline.json"
+    benchmark_profiler.main(["--smoke", "--repeat", "1", "--save-baseline", str(out)])
+    results = json.loads(out.read_text())
+    assert {name.split("-")[0] for name in results} == {"tabular", "time_series", "wide_format"}
+    for name, res in results.items():
+        assert name.startswith(res["data_type"] + "-"), name
+        assert res["rows"] > 0 and res["profile_rows_per_s"] > 0
+
+    faster = {name: {**res, "profile_rows_per_s": res["profile_rows_per_s"] * 100}
+              for name, res in results.items()}
+    out.write_text(json.dumps(faster))
+    with pytest.raises(SystemExit) as exc:
+        benchmark_profiler.main(["--smoke", "--repeat", "1", "--baseline", str(out)])
+    assert exc.value.code == 1
+
+
+def test_committed_baseline_matches_grid():
+    with open(_BASELINE, encoding="utf-8") as f:
+        baseline = json.load(f)
+    grid = benchmark_profiler.QUICK_GRID
+    assert set(baseline) == {name for name, _ in benchmark_profiler.build_cases(grid)}
+    for name, res in baseline.items():
+        assert name.startswith(res["data_type"] + "-"), name
+    # The peak covers profiling alone, so it grows with the data instead of
+    # sitting at the CSV reader's block size.
+    assert baseline["tabular-r20000-mixed-n0"]["profile_peak_mb"] > 5 * baseline["tabular-r1000-mixed-n0"]["profile_peak_mb"]
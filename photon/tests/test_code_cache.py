@@ -0,0 +1,84 @@
+"""
+Tests for code_cache.py. ChromaDB runs in memory and get_embedding is
+replaced by a keyword embedder, so similarity is predictable.
+"""
+import pytest
+
+import app.services.vector_db as vdb
+from app.services import code_cache
+
+_PROFILE = {"columns": [{"name": "dept", "dtype": "string"}, {"name": "defects", "dtype": "numeric"}]}
+_CODE = 'import pandas as pd\ndf = pd.read_csv("/tmp/a.csv")\nprint("PHOTON_SUMMARY:{}")'
+
+
+def _embedder(text: str, **_) -> list:
+    t = text.lower()
+    if "defect" in t and "department" in t:
+        return [1.0, 0.05, 0.0]
+    if "trend" in t:
+        return [0.0, 1.0, 0.0]
+    return [0.0, 0.0, 1.0]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    vdb._reset(persist_dir=":memory:")
+    code_cache._reset()
+    monkeypatch.setenv("PHOTON_CODE_CACHE", "1")
+    monkeypatch.setattr(code_cache, "get_embedding", _embedder)
+    yield code_cache
+    vdb._reset()
+
+
+def test_paraphrase_reuses_code_pointed_at_new_source(cache):
+    hit, embedding = cache.lookup("Defects by department", _PROFILE, "/tmp/a.csv", "m")
+    assert hit is None
+    cache.put("Defects by department", _PROFILE, "/tmp/a.csv", "m", _CODE, embedding)
+
+    hit, _ = cache.lookup("Which department has most defects?", _PROFILE, "/tmp/b.csv", "m")
+    assert hit["code"] == _CODE.replace("/tmp/a.csv", "/tmp/b.csv")
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 1
+
+
+def test_other_schema_model_or_question_misses(cache):
+    cache.put("Defects by department", _PROFILE, "/tmp/a.csv", "m", _CODE)
+    other_schema = {"columns": [{"name": "dept", "dtype": "string"}]}
+    assert cache.lookup("Defects by department", other_schema, "/tmp/a.csv", "m")[0] is None
+    assert cache.lookup("Defects by department", _PROFILE, "/tmp/a.csv", "m2")[0] is None
+    assert cache.lookup("Defect trend", _PROFILE, "/tmp/a.csv", "m")[0] is None
+
+
+def test_discard_and_unportable_code(cache):
+    cache.put("Defects by department", _PROFILE, "/tmp/a.csv", "m", 'print("no source")')
+    assert cache.stats()["entries"] == 0
+    cache.put("Defects by department", _PROFILE, "/tmp/a.csv", "m", _CODE)
+    hit, _ = cache.lookup("Defects by department", _PROFILE, "/tmp/a.csv", "m")
+    cache.discard(hit["id"])
+    assert cache.lookup("Defects by department", _PROFILE, "/tmp/a.csv", "m")[0] is None
+
+
+def test_embedding_failure_is_a_miss(cache, monkeypatch):
+    def _broken(text, **_):
+        raise RuntimeError("no embedding backend")
+
+    monkeypatch.setattr(code_cache, "get_embedding", _broken)
+    assert cache.lookup("Defects by department", _PROFILE, "/tmp/a.csv", "m") == (None, None)
+    assert cache.stats()["errors"] == 1
+
+
+def test_sheets_do_not_share_code(cache):
+    code = _CODE.replace("read_csv(\"/tmp/a.csv\")", "read_excel(\"/tmp/a.csv\", sheet_name='Q1')")
+    cache.put("Defects by department", _PROFILE, "/tmp/a.csv", "m", code, sheet="Q1")
+    assert cache.lookup("Defects by department", _PROFILE, "/tmp/a.csv", "m", sheet="Q2")[0] is None
+    assert cache.lookup("Defects by department", _PROFILE, "/tmp/a.csv", "m")[0] is None
+    question = "Which department has most defects?"
+    hit, _ = cache.lookup(question, _PROFILE, "/tmp/b.xlsx", "m", sheet="Q1")
+    assert "sheet_name='Q1'" in hit["code"]
+
+
+def test_api_keys_do_not_share_code(cache):
+    cache.put("Defects by department", _PROFILE, "/tmp/a.csv", "m", _CODE, api_key="tenant-a")
+    assert cache.lookup("Defects by department", _PROFILE, "/tmp/a.csv", "m", api_key="tenant-b")[0] is None
+    assert cache.lookup("Defects by department", _PROFILE, "/tmp/a.csv", "m")[0] is None
+    hit, _ = cache.lookup("Defects by department", _PROFILE, "/tmp/b.csv", "m", api_key="tenant-a")
+    assert hit["code"] == _CODE.replace("/tmp/a.csv", "/tmp/b.csv")
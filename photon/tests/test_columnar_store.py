@@ -0,0 +1,76 @@
+"""
+Tests for columnar_store.py and the upload path that uses it.
+
+PHOTON_COLUMNAR_DIR points at a per-test tmp_path so nothing is shared
+between tests or with a developer's real cache directory.
+"""
+import hashlib
+
+import pandas as pd
+import pytest
+
+from app.services import columnar_store, upload_store
+from app.services.profiler import DatasetSource, load_dataframe
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture(autouse=True)
+def _columnar_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(tmp_path))
+
+
+def test_roundtrip_with_column_projection():
+    df = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"], "c": [0.5, 0.25, 0.125]})
+    assert columnar_store.write("k1", df)
+    assert columnar_store.exists("k1")
+    pd.testing.assert_frame_equal(columnar_store.read("k1"), df)
+    assert list(columnar_store.read("k1", ["c", "a"]).columns) == ["c", "a"]
+
+
+def test_read_missing_key_returns_none():
+    assert columnar_store.read("nope") is None
+
+
+def test_upload_is_parsed_once(monkeypatch):
+    content = b"a,b\n1,x\n2,y\n"
+    upload_store.put("columnar-test", {
+        "content": content,
+        "filename": "t.csv",
+        "extension": ".csv",
+        "sha256": hashlib.sha256(content).hexdigest(),
+    })
+    first = load_dataframe("photon-upload://columnar-test")
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("CSV parsed twice")
+
+    monkeypatch.setattr("app.services.loaders.read_csv", _fail)
+    second = load_dataframe("photon-upload://columnar-test", columns=["b"])
+    assert second["b"].tolist() == first["b"].tolist()
+
+
+def test_delete_removes_sheet_copies_of_a_digest():
+    df = pd.DataFrame({"a": [1, 2]})
+    digest, other = "a" * 64, "b" * 64
+    sheet_key = DatasetSource("book.xlsx", ".xlsx", digest, sheet="Q1").key
+    for key in (digest, sheet_key, other):
+        assert columnar_store.write(key, df)
+    columnar_store.delete(digest)
+    assert not columnar_store.exists(digest)
+    assert not columnar_store.exists(sheet_key)
+    assert columnar_store.exists(other)
+
+
+def test_expired_upload_drops_its_sheet_copies(monkeypatch):
+    content = b"a,b\n1,x\n"
+    digest = hashlib.sha256(content).hexdigest()
+    upload_store.put("sheet-test", {
+        "content": content, "filename": "t.csv", "extension": ".csv", "sha256": digest,
+    })
+    sheet_key = DatasetSource("t.xlsx", ".xlsx", digest, sheet="Q1").key
+    assert columnar_store.write(sheet_key, pd.DataFrame({"a": [1]}))
+    monkeypatch.setenv("PHOTON_UPLOAD_TTL_SECONDS", "0")
+    with pytest.raises(KeyError):
+        upload_store.get("sheet-test")
+    assert not columnar_store.exists(sheet_key)
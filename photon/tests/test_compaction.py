@@ -0,0 +1,41 @@
+"""
+Tests for compaction.py — lossless dtype compaction after loading.
+"""
+import numpy as np
+import pandas as pd
+
+from app.services.compaction import compact_dtypes
+from app.services.profiler import profile
+
+
+def _frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "count": np.arange(100, dtype=np.int64),
+            "half": np.arange(100, dtype=np.float64) / 2,
+            "ratio": np.linspace(0.1, 0.9, 100),
+            "shift": ["Morning", "Night"] * 50,
+            "order_id": [f"ORD-{i:04d}" for i in range(100)],
+            "mixed": ["a", 1] * 50,
+            "date": ["2024-01-01", "2024-01-02"] * 50,
+        }
+    )
+
+
+def test_compaction_is_lossless_and_smaller():
+    df = _frame()
+    compact, report = compact_dtypes(df)
+    assert report["bytes_after"] < report["bytes_before"]
+    assert compact["count"].dtype == np.int8
+    assert compact["half"].dtype == np.float32
+    assert compact["ratio"].dtype == np.float64  # not exactly representable in float32
+    assert isinstance(compact["shift"].dtype, pd.CategoricalDtype)
+    assert compact["mixed"].dtype == object
+    for col in df.columns:
+        assert compact[col].tolist() == df[col].tolist()
+
+
+def test_profile_unchanged_by_compaction():
+    df = _frame()
+    compact, _ = compact_dtypes(df)
+    assert profile(compact) == profile(df)
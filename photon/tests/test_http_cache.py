@@ -0,0 +1,163 @@
+"""
+Tests for http_cache.py — the on-disk cache for URL dataset sources.
+
+requests.get is replaced by a fake server so the tests control status codes
+and validators and can count how many requests reach the network.
+"""
+import os
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from app.services import columnar_store, http_cache, upload_store
+
+
+class _FakeResponse:
+    def __init__(self, status_code: int, body: bytes = b"", headers: dict = None):
+        self.status_code = status_code
+        self._body = body
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size: int = 1):
+        for i in range(0, len(self._body), chunk_size):
+            yield self._body[i:i + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise http_cache.requests.HTTPError(f"{self.status_code} error")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _FakeServer:
+    """Serves one body per URL with an ETag and honours If-None-Match."""
+
+    def __init__(self, bodies: dict):
+        self.bodies = bodies
+        self.calls = []
+
+    def get(self, url, timeout=None, stream=False, headers=None):
+        headers = headers or {}
+        self.calls.append((url, headers))
+        etag = f'"{len(self.bodies[url])}"'
+        if headers.get("If-None-Match") == etag:
+            return _FakeResponse(304)
+        return _FakeResponse(200, self.bodies[url], {"ETag": etag, "Content-Type": "text/csv"})
+
+
+@pytest.fixture(autouse=True)
+def _cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_HTTP_CACHE_DIR", str(tmp_path / "http"))
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(tmp_path / "columnar"))
+
+
+def test_fresh_entry_makes_no_request(monkeypatch):
+    monkeypatch.setenv("PHOTON_HTTP_CACHE_TTL", "3600")
+    server = _FakeServer({"https://x/a.csv": b"a,b\n1,2\n"})
+    with patch("app.services.http_cache.requests.get", side_effect=server.get):
+        first = http_cache.fetch("https://x/a.csv")
+        second = http_cache.fetch("https://x/a.csv")
+    assert len(server.calls) == 1
+    assert first.digest == second.digest
+    with open(second.path, "rb") as f:
+        assert f.read() == b"a,b\n1,2\n"
+
+
+def test_stale_entry_is_revalidated_with_etag(monkeypatch):
+    monkeypatch.setenv("PHOTON_HTTP_CACHE_TTL", "0")
+    server = _FakeServer({"https://x/a.csv": b"a,b\n1,2\n"})
+    with patch("app.services.http_cache.requests.get", side_effect=server.get):
+        first = http_cache.fetch("https://x/a.csv")
+        second = http_cache.fetch("https://x/a.csv")
+    assert len(server.calls) == 2
+    assert server.calls[1][1]["If-None-Match"] == '"8"'
+    assert second.digest == first.digest
+
+
+def test_failed_revalidation_serves_cached_copy(monkeypatch):
+    monkeypatch.setenv("PHOTON_HTTP_CACHE_TTL", "0")
+    server = _FakeServer({"https://x/a.csv": b"a,b\n1,2\n"})
+    with patch("app.services.http_cache.requests.get", side_effect=server.get):
+        first = http_cache.fetch("https://x/a.csv")
+    with patch(
+        "app.services.http_cache.requests.get",
+        side_effect=http_cache.requests.ConnectionError("offline"),
+    ):
+        assert http_cache.fetch("https://x/a.csv").digest == first.digest
+
+
+def test_lru_eviction_past_size_cap(monkeypatch):
+    monkeypatch.setenv("PHOTON_HTTP_CACHE_MAX_BYTES", "20")
+    server = _FakeServer({
+        "https://x/a.csv": b"a\n" + b"1\n" * 5,
+        "https://x/b.csv": b"b\n" + b"2\n" * 5,
+    })
+    with patch("app.services.http_cache.requests.get", side_effect=server.get):
+        http_cache.fetch("https://x/a.csv")
+        http_cache.fetch("https://x/b.csv")
+    stats = http_cache.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] <= 20
+
+
+def test_changed_body_drops_the_old_columnar_copies(monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setenv("PHOTON_HTTP_CACHE_TTL", "0")
+    server = _FakeServer({"https://x/a.csv": b"a,b\n1,2\n"})
+    with patch("app.services.http_cache.requests.get", side_effect=server.get):
+        first = http_cache.fetch("https://x/a.csv")
+        old = [first.digest, first.digest + "-sheet"]
+        for key in old:
+            columnar_store.write(key, pd.DataFrame({"a": [1]}))
+        server.bodies["https://x/a.csv"] = b"a,b\n1,2\n3,4\n"
+        second = http_cache.fetch("https://x/a.csv")
+    assert second.digest != first.digest
+    assert not any(columnar_store.exists(key) for key in old)
+
+
+def test_open_body_is_not_evicted_and_survives_a_race(monkeypatch):
+    monkeypatch.setenv("PHOTON_HTTP_CACHE_MAX_BYTES", "20")
+    server = _FakeServer({
+        "https://x/a.csv": b"a\n" + b"1\n" * 5,
+        "https://x/b.csv": b"b\n" + b"2\n" * 5,
+    })
+    with patch("app.services.http_cache.requests.get", side_effect=server.get):
+        a = http_cache.fetch("https://x/a.csv")
+        with http_cache.open_body(a.url, a.path, a.digest) as f:
+            # Fetching b would evict a, but a is being read.
+            http_cache.fetch("https://x/b.csv")
+            assert os.path.exists(a.path)
+            assert f.read() == server.bodies["https://x/a.csv"]
+
+        # Another worker evicts b between fetch() and open_body(): it is fetched again.
+        b = http_cache.fetch("https://x/b.csv")
+        os.remove(b.path)
+        with http_cache.open_body(b.url, b.path, b.digest) as f:
+            assert f.read() == server.bodies["https://x/b.csv"]
+
+
+def test_eviction_keeps_columnar_copy_shared_with_an_upload(monkeypatch, tmp_path):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setenv("PHOTON_HTTP_CACHE_MAX_BYTES", "20")
+    monkeypatch.setenv("PHOTON_UPLOAD_SPILL_DIR", str(tmp_path / "uploads"))
+    body = b"a\n" + b"1\n" * 5
+    server = _FakeServer({"https://x/a.csv": body, "https://x/b.csv": b"b\n" + b"2\n" * 5})
+    upload_store._reset()
+    upload_store.put("same-bytes", {"content": body, "extension": ".csv"})
+    try:
+        with patch("app.services.http_cache.requests.get", side_effect=server.get):
+            a = http_cache.fetch("https://x/a.csv")
+            columnar_store.write(a.digest, pd.DataFrame({"a": [1] * 5}))
+            http_cache.fetch("https://x/b.csv")
+        assert not os.path.exists(a.path)
+        assert columnar_store.exists(a.digest)
+    finally:
+        upload_store._reset()
@@ -0,0 +1,150 @@
+"""
+Tests for lambda_executor.py. boto3 is replaced by a fake client; no AWS calls.
+"""
+import asyncio
+import base64
+import io
+import json
+import time
+
+import pytest
+
+from app.services import lambda_executor, upload_store
+
+
+class _FakeLambda:
+    def __init__(self):
+        self.payloads = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.payloads.append(json.loads(Payload))
+        body = json.dumps({"stdout": "ok", "stderr": "", "exit_code": 0, "output_image": None})
+        return {"Payload": io.BytesIO(json.dumps({"body": body}).encode())}
+
+
+@pytest.fixture
+def fake_lambda(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_UPLOAD_SPILL_DIR", str(tmp_path))
+    monkeypatch.setattr(lambda_executor, "aiobotocore_session", None)
+    fake = _FakeLambda()
+    monkeypatch.setattr(lambda_executor, "_client", lambda: fake)
+    upload_store._reset()
+    yield fake
+    upload_store._reset()
+
+
+@pytest.mark.asyncio
+async def test_async_invoke_embeds_upload(fake_lambda):
+    upload_store.put("u1", {"content": b"a,b\n1,2\n", "extension": ".csv"})
+    result = await lambda_executor.execute_via_lambda_async("print(1)", "photon-upload://u1")
+    assert result["stdout"] == "ok"
+    sent = fake_lambda.payloads[0]
+    assert base64.b64decode(sent["file_content"]) == b"a,b\n1,2\n"
+    assert sent["file_extension"] == ".csv"
+
+
+def test_staged_payload_is_reused(fake_lambda, monkeypatch):
+    upload_store.put("u1", {"content": b"x,y\n3,4\n", "extension": ".csv"})
+    assert lambda_executor.stage_upload("u1")
+    monkeypatch.setattr(upload_store, "get", lambda upload_id: pytest.fail("payload re-encoded"))
+    lambda_executor.execute_via_lambda("print(1)", "photon-upload://u1")
+    assert base64.b64decode(fake_lambda.payloads[0]["file_content"]) == b"x,y\n3,4\n"
+
+
+def test_oversized_upload_is_not_staged(fake_lambda, monkeypatch):
+    monkeypatch.setattr(lambda_executor, "_PAYLOAD_LIMIT_BYTES", 8)
+    upload_store.put("big", {"content": b"0123456789", "extension": ".csv"})
+    assert not lambda_executor.stage_upload("big")
+
+
+@pytest.mark.asyncio
+async def test_async_invoke_honours_timeout(fake_lambda, monkeypatch):
+    real_invoke = fake_lambda.invoke
+
+    def _slow_invoke(**kwargs):
+        time.sleep(0.5)
+        return real_invoke(**kwargs)
+
+    monkeypatch.setattr(fake_lambda, "invoke", _slow_invoke)
+    with pytest.raises(asyncio.TimeoutError):
+        await lambda_executor.execute_via_lambda_async("print(1)", timeout=0.05)
+
+
+def test_sandbox_profile_sends_url_and_surfaces_errors(fake_lambda, monkeypatch):
+    monkeypatch.setenv("PHOTON_SANDBOX_PROFILE", "1")
+
+    def _profile_invoke(FunctionName, InvocationType, Payload):
+        fake_lambda.payloads.append(json.loads(Payload))
+        body = json.dumps({"error": "Could not fetch https://x/d.csv: 404"})
+        return {"Payload": io.BytesIO(json.dumps({"statusCode": 400, "body": body}).encode())}
+
+    monkeypatch.setattr(fake_lambda, "invoke", _profile_invoke)
+    with pytest.raises(ValueError, match="404"):
+        lambda_executor.profile_via_lambda("https://x/d.csv", "Sheet1")
+    assert fake_lambda.payloads[0] == {
+        "action": "profile", "source_url": "https://x/d.csv", "sheet": "Sheet1", "settings": {}
+    }
+
+    _, payload = lambda_executor._build_payload("print(1)", "https://x/d.csv")
+    assert json.loads(payload)["source_url"] == "https://x/d.csv"
+    monkeypatch.setenv("PHOTON_SANDBOX_PROFILE", "0")
+    _, payload = lambda_executor._build_payload("print(1)", "https://x/d.csv")
+    assert "source_url" not in json.loads(payload)
+
+
+class _FakeAioStream:
+    def __init__(self, raw: bytes):
+        self.raw = raw
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self) -> bytes:
+        return self.raw
+
+
+class _FakeAioSession:
+    def __init__(self):
+        self.created = 0
+        self.closed = 0
+        self.payloads = []
+
+    def get_session(self):
+        return self
+
+    def create_client(self, service, region_name):
+        self.created += 1
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed += 1
+        return False
+
+    async def invoke(self, FunctionName, InvocationType, Payload):
+        self.payloads.append(json.loads(Payload))
+        body = json.dumps({"stdout": "aio", "stderr": "", "exit_code": 0, "output_image": None})
+        return {"Payload": _FakeAioStream(json.dumps({"body": body}).encode())}
+
+
+@pytest.mark.asyncio
+async def test_aiobotocore_client_is_shared_and_closed(fake_lambda, monkeypatch):
+    session = _FakeAioSession()
+    monkeypatch.setattr(lambda_executor, "aiobotocore_session", session)
+    monkeypatch.setattr(lambda_executor, "_aio", None)
+
+    results = await asyncio.gather(
+        *(lambda_executor.execute_via_lambda_async("print(1)") for _ in range(3))
+    )
+    assert [r["stdout"] for r in results] == ["aio"] * 3
+    assert len(session.payloads) == 3
+    assert session.created == 1
+
+    await lambda_executor.close_async_client()
+    assert session.closed == 1
+    assert not fake_lambda.payloads
@@ -0,0 +1,154 @@
+"""
+Tests for aws/lambda_function.py, the sandbox handler deployed to Lambda.
+
+It is deployed as a zip built by aws/build_function.py, so it is loaded by
+path here. Downloads go through a
+fake urlopen; nothing leaves the machine.
+"""
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import urllib.error
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import profiler
+
+_AWS = os.path.join(os.path.dirname(__file__), "..", "..", "aws")
+_HANDLER = os.path.join(_AWS, "lambda_function.py")
+_BUILDER = os.path.join(_AWS, "build_function.py")
+
+
+def _load(path: str, name: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def sandbox(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_SANDBOX_DATA_DIR", str(tmp_path / "sandbox"))
+    for name in ("PHOTON_PROFILE_SAMPLE_THRESHOLD", "PHOTON_PROFILE_SAMPLE_SIZE"):
+        monkeypatch.delenv(name, raising=False)
+    return _load(_HANDLER, "photon_lambda_function")
+
+
+class _Response(io.BytesIO):
+    def __init__(self, content, headers):
+        super().__init__(content)
+        self.headers = headers
+
+
+def _serve(monkeypatch, sandbox, content, etag="v1"):
+    requests = []
+
+    def _urlopen(request, timeout=None):
+        requests.append(dict(request.header_items()))
+        if request.get_header("If-none-match") == etag:
+            raise urllib.error.HTTPError(request.full_url, 304, "Not Modified", {}, None)
+        return _Response(content, {"Content-Type": "text/csv", "ETag": etag})
+
+    monkeypatch.setattr(sandbox.urllib.request, "urlopen", _urlopen)
+    return requests
+
+
+def _frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "date": pd.date_range("2024-01-01", periods=rows, freq="h").strftime("%d/%m/%Y %H:%M"),
+        "units": rng.integers(0, 100, rows),
+        "price": np.where(rng.random(rows) < 0.2, np.nan, rng.random(rows)),
+        "site": rng.choice(["north", "south", None], rows),
+    })
+
+
+@pytest.mark.parametrize("settings", [{}, {"PHOTON_PROFILE_SAMPLE_THRESHOLD": "500",
+                                           "PHOTON_PROFILE_SAMPLE_SIZE": "200"}])
+def test_profile_action_matches_server_profile(sandbox, monkeypatch, tmp_path, settings):
+    path = tmp_path / "data.csv"
+    _frame(2000).to_csv(path, index=False)
+    _serve(monkeypatch, sandbox, path.read_bytes())
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(tmp_path / "columnar"))
+    for name, value in settings.items():
+        monkeypatch.setenv(name, value)
+    expected = profiler.profile(profiler.load_dataframe(str(path)))
+
+    event = {"action": "profile", "source_url": "https://example.com/d.csv", "settings": settings}
+    body = json.loads(sandbox.lambda_handler(event, None)["body"])
+    assert body["profile"] == json.loads(json.dumps(expected, default=str))
+    assert (body["profile"]["sampling"] is not None) == bool(settings)
+
+
+def test_bundle_ships_the_server_profiler(tmp_path):
+    bundle = _load(_BUILDER, "photon_build_function").build(str(tmp_path / "function.zip"))
+    task_dir = tmp_path / "task"
+    # Lambda unpacks the zip into its task directory and runs from there.
+    zipfile.ZipFile(bundle).extractall(task_dir)
+    script = (
+        "import json, lambda_function\n"
+        "from app.services import frame_profile\n"
+        "assert frame_profile.__file__.startswith(%r)\n"
+        "print(json.dumps(frame_profile.profile(__import__('pandas').DataFrame({'a': [1, 2]}))))"
+    ) % str(task_dir)
+    out = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=task_dir,
+        env={**os.environ, "PYTHONPATH": str(task_dir)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert json.loads(out.stdout)["row_count"] == 2
+
+
+def test_profile_action_downloads_once_and_revalidates(sandbox, monkeypatch):
+    requests = _serve(monkeypatch, sandbox, b"dept,defects\nA,1\nB,2\n")
+    event = {"action": "profile", "source_url": "https://example.com/d.csv"}
+
+    first = json.loads(sandbox.lambda_handler(event, None)["body"])
+    assert first["profile"]["row_count"] == 2
+    assert first["path"].endswith(".csv") and os.path.exists(first["path"])
+    json.loads(sandbox.lambda_handler(event, None)["body"])
+    assert len(requests) == 1
+
+    monkeypatch.setattr(sandbox, "URL_TTL_SECONDS", 0)
+    again = json.loads(sandbox.lambda_handler(event, None)["body"])
+    assert again == first
+    assert requests[1]["If-none-match"] == "v1"
+
+
+def test_unreachable_url_is_a_400(sandbox, monkeypatch):
+    def _urlopen(request, timeout=None):
+        raise urllib.error.URLError("no route")
+
+    monkeypatch.setattr(sandbox.urllib.request, "urlopen", _urlopen)
+    result = sandbox.lambda_handler({"action": "profile", "source_url": "https://x/d.csv"}, None)
+    assert result["statusCode"] == 400
+    assert "no route" in json.loads(result["body"])["error"]
+
+
+def test_execution_reuses_the_parsed_frame(sandbox, monkeypatch):
+    url = "https://example.com/d.csv"
+    _serve(monkeypatch, sandbox, b"a,b\n1,2\n3,4\n")
+    path, _ = sandbox.fetch_url(url)
+
+    def _run(read_args=""):
+        code = f"import pandas as pd\nprint(pd.read_csv({path!r}{read_args})['a'].sum())"
+        body = json.loads(sandbox.lambda_handler({"code": code, "source_url": url, "job_id": "warm"}, None)["body"])
+        assert body["exit_code"] == 0, body["stderr"]
+        return body["stdout"].strip()
+
+    assert _run() == "4"
+    assert len([n for n in os.listdir(sandbox.DATA_DIR) if n.endswith(".frame.pkl")]) == 1
+    # Changed behind the cache's back: a warm read must not parse the file again.
+    with open(path, "w") as f:
+        f.write("a,b\n100,1\n")
+    assert _run() == "4"
+    assert _run(", usecols=['a']") == "100"
@@ -8,11 +8,15 @@ the Anthropic API works (that's Anthropic's job). We are testing:
 - that it calls the client, extracts the text, strips markdown fences,
   and returns a non-empty string
 """
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
-from app.services.llm import generate_analysis_code
+from app.services import llm
+from app.services.llm import (
+    generate_analysis_code_async,
+    generate_follow_up_suggestions_async,
+)
 
 _FAKE_PROFILE = {
     "row_count": 10,
@@ -41,18 +45,24 @@ _FAKE_PROFILE = {
 }
 
 
-def test_generate_returns_code(monkeypatch):
+def _fake_async_client(text: str) -> MagicMock:
+    fake_response = MagicMock()
+    fake_response.content = [MagicMock(text=text)]
+    fake_client = MagicMock()
+    fake_client.messages.create = AsyncMock(return_value=fake_response)
+    return fake_client
+
+
+@pytest.mark.asyncio
+async def test_generate_returns_code(monkeypatch):
     monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(llm, "_async_clients", {})
 
     fake_text = "import pandas as pd\ndf = pd.read_csv('data.csv')\nprint(df.head())"
-    fake_response = MagicMock()
-    fake_response.content = [MagicMock(text=fake_text)]
+    fake_client = _fake_async_client(fake_text)
 
-    fake_client = MagicMock()
-    fake_client.messages.create.return_value = fake_response
-
-    with patch("app.services.llm.anthropic.Anthropic", return_value=fake_client):
-        result = generate_analysis_code(
+    with patch("app.services.llm.anthropic.AsyncAnthropic", return_value=fake_client):
+        result = await generate_analysis_code_async(
             question="Show temperature trends",
             profile=_FAKE_PROFILE,
             playbook="Check stationarity before trending.",
@@ -64,36 +74,86 @@ def test_generate_returns_code(monkeypatch):
     assert "import pandas" in result
 
 
-def test_strips_markdown_fences(monkeypatch):
-    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
-
+def test_strips_markdown_fences():
     fenced = "```python\nimport pandas as pd\ndf = pd.read_csv('data.csv')\n```"
-    fake_response = MagicMock()
-    fake_response.content = [MagicMock(text=fenced)]
+    result = llm.strip_fences(fenced)
+    assert not result.startswith("```")
+    assert not result.endswith("```")
+    assert "import pandas" in result
 
-    fake_client = MagicMock()
-    fake_client.messages.create.return_value = fake_response
 
-    with patch("app.services.llm.anthropic.Anthropic", return_value=fake_client):
-        result = generate_analysis_code(
+@pytest.mark.asyncio
+async def test_raises_when_key_missing(monkeypatch):
+    monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+
+    with pytest.raises(ValueError, match="ANTHROPIC_API_KEY not set"):
+        await generate_analysis_code_async(
             question="Any question",
             profile=_FAKE_PROFILE,
             playbook="",
             source="data.csv",
         )
 
-    assert not result.startswith("```")
-    assert not result.endswith("```")
-    assert "import pandas" in result
 
+@pytest.mark.asyncio
+async def test_async_generate_uses_async_client(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key-async")
+    monkeypatch.setattr(llm, "_async_clients", {})
 
-def test_raises_when_key_missing(monkeypatch):
-    monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+    fake_client = _fake_async_client("```python\nimport pandas as pd\n```")
 
-    with pytest.raises(ValueError, match="ANTHROPIC_API_KEY not set"):
-        generate_analysis_code(
+    with patch("app.services.llm.anthropic.AsyncAnthropic", return_value=fake_client):
+        result = await generate_analysis_code_async(
             question="Any question",
             profile=_FAKE_PROFILE,
             playbook="",
             source="data.csv",
         )
+
+    assert result == "import pandas as pd"
+    assert fake_client.messages.create.await_args.kwargs["model"] == llm.MODEL
+    assert "timeout" not in fake_client.messages.create.await_args.kwargs
+
+    with patch("app.services.llm.anthropic.AsyncAnthropic", return_value=fake_client):
+        await generate_analysis_code_async("q", _FAKE_PROFILE, "", "data.csv", timeout=4.5)
+    assert fake_client.messages.create.await_args.kwargs["timeout"] == 4.5
+
+
+@pytest.mark.asyncio
+async def test_async_suggestions_fall_back_to_defaults(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key-async")
+    monkeypatch.setattr(llm, "_async_clients", {})
+
+    fake_client = MagicMock()
+    fake_client.messages.create = AsyncMock(side_effect=RuntimeError("overloaded"))
+
+    with patch("app.services.llm.anthropic.AsyncAnthropic", return_value=fake_client):
+        result = await generate_follow_up_suggestions_async("q", _FAKE_PROFILE, [])
+
+    assert result == llm.default_suggestions("time_series")
+
+
+@pytest.mark.asyncio
+async def test_stream_analysis_code_yields_deltas(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key-async")
+    monkeypatch.setattr(llm, "_async_clients", {})
+
+    async def _text():
+        for part in ["```python\n", "import pandas", " as pd\n", "```"]:
+            yield part
+
+    stream = MagicMock(text_stream=_text())
+    manager = MagicMock()
+    manager.__aenter__ = AsyncMock(return_value=stream)
+    manager.__aexit__ = AsyncMock(return_value=False)
+    fake_client = MagicMock()
+    fake_client.messages.stream = MagicMock(return_value=manager)
+
+    with patch("app.services.llm.anthropic.AsyncAnthropic", return_value=fake_client):
+        parts = [
+            p async for p in llm.stream_analysis_code("q", _FAKE_PROFILE, "", "data.csv")
+        ]
+
+    assert len(parts) == 4
+    assert llm.strip_fences("".join(parts)) == "import pandas as pd"
+    assert fake_client.messages.stream.call_args.kwargs["model"] == llm.MODEL
@@ -0,0 +1,65 @@
+"""
+Tests for metrics.py — request timing spans and stage histograms.
+"""
+import asyncio
+import contextvars
+
+import pytest
+
+from app.services import metrics
+
+
+@pytest.fixture(autouse=True)
+def _isolated():
+    metrics._reset()
+    yield
+    metrics._reset()
+
+
+def _untracked(fn):
+    return contextvars.Context().run(fn)
+
+
+def test_spans_record_to_request_and_histogram():
+    def _request():
+        timings = metrics.track()
+        with metrics.span("load"):
+            pass
+        with metrics.span("load"):
+            pass
+        with metrics.span("profile"):
+            pass
+        return timings
+
+    timings = _untracked(_request)
+    assert list(timings.as_dict()) == ["load", "profile", "total"]
+    assert timings.header().startswith("load;dur=")
+    text = metrics.render()
+    assert 'photon_stage_seconds_count{stage="load"} 2' in text
+    assert 'photon_stage_seconds_bucket{stage="profile",le="+Inf"} 1' in text
+
+
+def test_spans_outside_a_request_record_nothing():
+    def _background():
+        with metrics.span("load"):
+            pass
+
+    _untracked(_background)
+    assert "stage=" not in metrics.render()
+
+
+@pytest.mark.asyncio
+async def test_spans_in_child_tasks_reach_the_request():
+    async def _request():
+        timings = metrics.track()
+
+        async def _stage(name):
+            with metrics.span(name):
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(_stage("narrative"), _stage("suggestions"))
+        return timings
+
+    timings = await asyncio.get_running_loop().create_task(_request(), context=contextvars.Context())
+    assert {"narrative", "suggestions"} <= set(timings.as_dict())
+    assert timings.as_dict()["narrative"] >= 10
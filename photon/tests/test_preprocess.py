@@ -0,0 +1,117 @@
+"""
+Tests for preprocess.py — background parse/profile/stage jobs for uploads.
+"""
+import threading
+
+import pytest
+
+from app.services import deadline, lambda_executor, preprocess, profile_cache, upload_store
+from app.services.profiler import fetch_source
+
+CSV = b"when,value\n2024-01-01,1\n2024-01-02,2\n2024-01-03,3\n"
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_UPLOAD_SPILL_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(tmp_path / "columnar"))
+    monkeypatch.delenv("PHOTON_PROFILE_CACHE_DIR", raising=False)
+    upload_store._reset()
+    profile_cache._reset()
+    preprocess._reset()
+    yield
+    preprocess._reset()
+    upload_store._reset()
+
+
+def _job(upload_id):
+    return preprocess._jobs[upload_store.metadata(upload_id)["sha256"]]
+
+
+def test_upload_is_profiled_and_staged_in_background():
+    upload_store.put("u1", {"content": CSV, "extension": ".csv"})
+    preprocess.schedule("u1")
+    _job("u1").future.result(timeout=30)
+
+    status = preprocess.status("u1")
+    assert status["state"] == "ready"
+    assert status["stages"] == {"parse": "done", "profile": "done", "stage": "done"}
+    digest = upload_store.metadata("u1")["sha256"]
+    assert profile_cache.contains(digest)
+    assert digest in lambda_executor._staged
+
+
+def test_workflow_waits_for_in_flight_job(monkeypatch):
+    release = threading.Event()
+    real_read = preprocess.read_source
+
+    def _slow_read(src, columns=None):
+        release.wait(timeout=30)
+        return real_read(src, columns)
+
+    monkeypatch.setattr(preprocess, "read_source", _slow_read)
+    upload_store.put("u1", {"content": CSV, "extension": ".csv"})
+    preprocess.schedule("u1")
+    assert preprocess.status("u1")["state"] in ("queued", "running")
+
+    threading.Timer(0.2, release.set).start()
+    result = preprocess.profile_source(fetch_source("photon-upload://u1"))
+    assert result["row_count"] == 3
+    # Served from the job's cache entry, not profiled a second time inline.
+    assert profile_cache.stats()["hits"] == 1
+
+
+def test_budget_spent_waiting_for_job_skips_inline_profiling(monkeypatch):
+    release = threading.Event()
+    reads = []
+    real_read = preprocess.read_source
+
+    def _slow_read(src, columns=None):
+        reads.append(src.key)
+        release.wait(timeout=30)
+        return real_read(src, columns)
+
+    monkeypatch.setattr(preprocess, "read_source", _slow_read)
+    upload_store.put("u1", {"content": CSV, "extension": ".csv"})
+    preprocess.schedule("u1")
+    src = fetch_source("photon-upload://u1")
+
+    token = deadline._current.set(deadline.Deadline(0.1))
+    try:
+        with pytest.raises(TimeoutError):
+            preprocess.profile_source(src)
+    finally:
+        deadline._current.reset(token)
+        release.set()
+    # Only the background job read the data; nothing was profiled inline.
+    assert len(reads) == 1
+    _job("u1").future.result(timeout=30)
+
+
+def test_duplicate_uploads_share_one_job():
+    upload_store.put("u1", {"content": CSV, "extension": ".csv"})
+    upload_store.put("u2", {"content": CSV, "extension": ".csv"})
+    preprocess.schedule("u1")
+    preprocess.schedule("u2")
+    assert len(preprocess._jobs) == 1
+    _job("u2").future.result(timeout=30)
+    assert preprocess.status("u2")["state"] == "ready"
+
+
+def test_failed_job_is_reported(tmp_path):
+    upload_store.put("bad", {"content": b"\x00\x01not a workbook", "extension": ".xlsx"})
+    preprocess.schedule("bad")
+    _job("bad").future.result(timeout=30)
+    status = preprocess.status("bad")
+    assert status["state"] == "failed"
+    assert status["stages"]["parse"] == "failed"
+    assert status["error"]
+
+
+def test_disabled_preprocessing_still_profiles_on_demand(monkeypatch):
+    monkeypatch.setenv("PHOTON_PREPROCESS", "0")
+    upload_store.put("u1", {"content": CSV, "extension": ".csv"})
+    preprocess.schedule("u1")
+    assert preprocess.status("u1")["state"] == "idle"
+    assert preprocess.profile_source(fetch_source("photon-upload://u1"))["row_count"] == 3
+    assert preprocess.status("u1")["state"] == "ready"
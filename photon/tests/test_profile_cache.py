@@ -0,0 +1,66 @@
+"""
+Tests for profile_cache.py — the content-addressed profile cache.
+
+Each test builds its own ProfileCache instance so no state leaks through
+the module-level singleton.
+"""
+import json
+import os
+
+from app.services.profile_cache import ProfileCache
+
+
+def _profile(n: int) -> dict:
+    return {"row_count": n, "columns": [{"name": "x" * 50}], "data_type": "tabular"}
+
+
+def test_hit_and_miss_counters():
+    cache = ProfileCache(max_bytes=10_000)
+    assert cache.get("abc") is None
+    cache.put("abc", _profile(1))
+    assert cache.get("abc") == _profile(1)
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_lru_eviction_respects_byte_budget():
+    size = len(json.dumps(_profile(1)))
+    cache = ProfileCache(max_bytes=size * 2)
+    cache.put("a", _profile(1))
+    cache.put("b", _profile(2))
+    cache.get("a")  # "b" is now least recently used
+    cache.put("c", _profile(3))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= size * 2
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    first = ProfileCache(max_bytes=10_000, disk_dir=str(tmp_path))
+    first.put("digest1", _profile(7))
+
+    second = ProfileCache(max_bytes=10_000, disk_dir=str(tmp_path))
+    assert second.get("digest1") == _profile(7)
+    assert second.stats()["disk_hits"] == 1
+    # Promoted into memory: the next lookup is a memory hit.
+    second.get("digest1")
+    assert second.stats()["hits"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used_files(tmp_path):
+    size = len(json.dumps(_profile(0)))
+    cache = ProfileCache(max_bytes=10_000, disk_dir=str(tmp_path), disk_max_bytes=size * 2)
+    cache.put("a", _profile(1))
+    cache.put("b", _profile(2))
+    os.utime(tmp_path / "a.json", (1, 1))
+    os.utime(tmp_path / "b.json", (2, 2))
+    # A disk hit refreshes "a", so "b" is the oldest when "c" arrives.
+    ProfileCache(max_bytes=10_000, disk_dir=str(tmp_path)).get("a")
+    cache.put("c", _profile(3))
+
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "c.json"]
+    assert cache.stats()["disk_evictions"] == 1
@@ -6,7 +6,7 @@ import numpy as np
 import pandas as pd
 import pytest
 
-from app.services.profiler import load_dataframe, profile
+from app.services.profiler import fetch_source, list_sheets, load_dataframe, profile
 
 
 def test_tabular_detection():
@@ -66,3 +66,217 @@ def test_load_csv():
         assert list(df.columns) == ["a", "b", "c"]
     finally:
         os.unlink(tmp_path)
+
+
+def test_exact_mode_has_no_sampling_block():
+    df = pd.DataFrame({"id": [1, 2, 3], "label": ["a", "b", "c"]})
+    result = profile(df)
+    assert result["sampling"] is None
+
+
+def test_sampled_mode_above_threshold(monkeypatch):
+    monkeypatch.setenv("PHOTON_PROFILE_SAMPLE_THRESHOLD", "1000")
+    monkeypatch.setenv("PHOTON_PROFILE_SAMPLE_SIZE", "500")
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 300, size=5000).astype(float)
+    values[rng.random(5000) < 0.5] = np.nan
+    df = pd.DataFrame(
+        {
+            "date": pd.date_range("2020-01-01", periods=5000, freq="h").strftime("%Y-%m-%d %H:%M"),
+            "reading": values,
+        }
+    )
+    result = profile(df)
+    assert result["row_count"] == 5000
+    assert result["sampling"]["sample_size"] == 500
+    assert "n_unique" in result["sampling"]["estimated_fields"]
+    assert result["data_type"] == "time_series"
+    reading = next(c for c in result["columns"] if c["name"] == "reading")
+    assert 40.0 <= reading["null_pct"] <= 60.0
+    assert abs(reading["n_unique"] - 300) <= 10
+    assert "estimated" in result["summary"]
+
+
+def test_forced_exact_mode_ignores_threshold(monkeypatch):
+    monkeypatch.setenv("PHOTON_PROFILE_SAMPLE_THRESHOLD", "1")
+    df = pd.DataFrame({"id": [1, 2, 3]})
+    assert profile(df, mode="exact")["sampling"] is None
+
+
+def test_fetch_source_digest_tracks_content():
+    with tempfile.TemporaryDirectory() as d:
+        a = os.path.join(d, "a.csv")
+        b = os.path.join(d, "b.csv")
+        for path in (a, b):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("x,y\n1,2\n")
+        assert fetch_source(a).digest == fetch_source(b).digest
+        with open(b, "a", encoding="utf-8") as f:
+            f.write("3,4\n")
+        assert fetch_source(a).digest != fetch_source(b).digest
+
+
+def test_datetime_inference_formats_and_rejections():
+    df = pd.DataFrame(
+        {
+            "us_date": ["01/02/2020", "03/04/2021", "12/31/2022"] * 10,
+            "month": ["Jan 2020", "Feb 2020", "Mar 2021"] * 10,
+            "order_id": [f"ORD-2024{i:04d}" for i in range(30)],
+            "code": ["EQ-007", "EQ-011", "EQ-003"] * 10,
+            "note": ["checked twice, 3 parts replaced on line 2"] * 30,
+        }
+    )
+    result = profile(df)
+    assert result["datetime_columns"] == ["us_date", "month"]
+
+
+def test_code_columns_are_rejected_before_any_parse(monkeypatch):
+    from app.services import frame_profile
+
+    parses = []
+    real = frame_profile._parse_ratio
+
+    def _counting(series, fmt):
+        parses.append(fmt)
+        return real(series, fmt)
+
+    monkeypatch.setattr(frame_profile, "_parse_ratio", _counting)
+    for codes in (["EQ-007", "EQ-011"], ["cat-3", "cat-12"], ["OP-003", "OP-1"], ["Line-1", "Line 2"]):
+        assert not frame_profile._looks_like_datetime(pd.Series(codes * 50))
+    assert parses == []
+
+    # Formats whose separators the sample lacks are skipped.
+    assert frame_profile._looks_like_datetime(pd.Series(["05.01.2024", "17.03.2023"] * 50))
+    assert "%m/%d/%Y" not in parses and "%d %b %Y" not in parses
+
+
+def _write(tmpdir, name, text):
+    path = os.path.join(tmpdir, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def test_load_json_lines():
+    with tempfile.TemporaryDirectory() as d:
+        path = _write(d, "rows.json", '{"a": 1, "b": "x"}\n{"a": 2, "b": "y"}\n')
+        df = load_dataframe(path)
+        assert df.shape == (2, 2)
+        assert df["b"].tolist() == ["x", "y"]
+
+
+def test_load_csv_type_change_after_first_block(monkeypatch):
+    pytest.importorskip("pyarrow")
+    from app.services import loaders
+
+    monkeypatch.setattr(loaders, "_CSV_BLOCK_BYTES", 1024)
+    fallbacks = []
+    real = loaders._concat_chunks
+
+    def _spy(chunks, limit_bytes):
+        fallbacks.append(True)
+        return real(chunks, limit_bytes)
+
+    monkeypatch.setattr(loaders, "_concat_chunks", _spy)
+    with tempfile.TemporaryDirectory() as d:
+        # "abc" is not a null marker, so Arrow's int64 column from the first block breaks.
+        path = _write(d, "drift.csv", "a,b\n" + "1,2\n" * 3000 + "abc,3\n")
+        df = load_dataframe(path)
+        assert df.shape == (3001, 2)
+        assert df["a"].iloc[-1] == "abc"
+    assert fallbacks == [True]
+
+
+def test_load_enforces_memory_ceiling(monkeypatch):
+    monkeypatch.setenv("PHOTON_LOAD_MAX_MB", "0")
+    with tempfile.TemporaryDirectory() as d:
+        path = _write(d, "big.csv", "a,b\n1,2\n")
+        with pytest.raises(ValueError, match="in-memory limit"):
+            load_dataframe(path)
+
+
+@pytest.mark.parametrize("name", ["wide.json", "wide.csv"])
+def test_memory_ceiling_counts_string_contents(name):
+    from app.services import loaders
+
+    # 50 rows of 10 KB strings: ~0.5 MB of text behind a few hundred bytes of pointers.
+    df = pd.DataFrame({"text": ["x" * 10_000] * 50})
+    raw = (df.to_json(orient="records") if name.endswith(".json") else df.to_csv(index=False)).encode()
+    with pytest.raises(ValueError, match="in-memory limit"):
+        loaders.read(io.BytesIO(raw), os.path.splitext(name)[1], 100_000)
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_parallel_profile_matches_serial(monkeypatch, executor):
+    rng = np.random.default_rng(1)
+    data = {}
+    for i in range(12):
+        data[f"num_{i}"] = rng.normal(size=50)
+        data[f"cat_{i}"] = rng.choice(["x", "y", None], size=50)
+    data["when"] = pd.date_range("2021-01-01", periods=50).strftime("%Y-%m-%d")
+    df = pd.DataFrame(data)
+
+    monkeypatch.setenv("PHOTON_PROFILE_EXECUTOR", "serial")
+    serial = profile(df)
+    monkeypatch.setenv("PHOTON_PROFILE_EXECUTOR", executor)
+    monkeypatch.setenv("PHOTON_PROFILE_WORKERS", "2")
+    assert profile(df) == serial
+
+
+def test_profile_pools_follow_worker_count_and_avoid_fork():
+    from app.services import frame_profile
+
+    threads = frame_profile._get_pool("thread", 2)
+    assert frame_profile._get_pool("thread", 2) is threads
+    resized = frame_profile._get_pool("thread", 3)
+    assert resized is not threads and resized._max_workers == 3
+
+    processes = frame_profile._get_pool("process", 2)
+    assert processes._mp_context.get_start_method() in ("forkserver", "spawn")
+    assert processes.submit(abs, -4).result() == 4
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_process_pool_chosen_for_text_heavy_frames(monkeypatch, compact):
+    from app.services import compaction, frame_profile
+
+    rng = np.random.default_rng(2)
+    text = pd.DataFrame({f"s_{i}": rng.choice(["north", "south", None], size=200) for i in range(20)})
+    numbers = pd.DataFrame({f"n_{i}": rng.normal(size=200) for i in range(20)})
+    if compact:
+        text, _ = compaction.compact_dtypes(text)
+        assert not any(dtype == object for dtype in text.dtypes)
+
+    kinds = []
+
+    def _serial_pool(kind, workers):
+        kinds.append(kind)
+        return frame_profile.ThreadPoolExecutor(max_workers=1)
+
+    monkeypatch.setattr(frame_profile, "_get_pool", _serial_pool)
+    monkeypatch.setenv("PHOTON_PROFILE_EXECUTOR", "process")
+    monkeypatch.setenv("PHOTON_PROFILE_WORKERS", "2")
+    profile(text)
+    profile(numbers)
+    assert kinds == ["process", "thread"]
+
+
+def test_excel_sheet_selection_is_parsed_once(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(tmp_path / "columnar"))
+    path = str(tmp_path / "book.xlsx")
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({"a": [1, 2]}).to_excel(writer, sheet_name="First", index=False)
+        pd.DataFrame({"b": ["x", "y", "z"]}).to_excel(writer, sheet_name="Second", index=False)
+
+    assert list_sheets(path) == ["First", "Second"]
+    df = load_dataframe(path, sheet="Second")
+    assert df["b"].tolist() == ["x", "y", "z"]
+    with pytest.raises(ValueError, match="Sheet not found"):
+        load_dataframe(path, sheet="Missing")
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("workbook parsed twice")
+
+    monkeypatch.setattr("app.services.loaders.pd.read_excel", _fail)
+    assert load_dataframe(path, sheet="Second")["b"].tolist() == ["x", "y", "z"]
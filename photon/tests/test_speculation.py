@@ -0,0 +1,81 @@
+"""
+Tests for speculation.py — background runs of suggested follow-up questions.
+"""
+import asyncio
+
+import pytest
+
+from app.services import speculation
+
+
+@pytest.fixture(autouse=True)
+def _isolated():
+    speculation._reset()
+    yield
+    speculation._reset()
+
+
+def _recorder(started, release=None):
+    async def _runner(question):
+        started.append(question)
+        if release is not None:
+            await release.wait()
+
+    return _runner
+
+
+@pytest.mark.asyncio
+async def test_runs_wait_for_foreground_requests():
+    started = []
+    with speculation.foreground():
+        speculation.submit("g", "key", ["a?", "b?"], _recorder(started))
+        await asyncio.sleep(0.05)
+        assert started == []
+    await speculation._drain()
+    assert started == ["a?", "b?"]
+    assert speculation.stats()["completed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_budget_is_per_api_key(monkeypatch):
+    monkeypatch.setenv("PHOTON_SPECULATE_BUDGET", "2")
+    started = []
+    assert speculation.submit("g1", "key1", ["a?", "b?", "c?"], _recorder(started)) == 2
+    assert speculation.submit("g2", "key1", ["d?"], _recorder(started)) == 0
+    assert speculation.submit("g3", "key2", ["d?"], _recorder(started)) == 1
+    await speculation._drain()
+    assert sorted(started) == ["a?", "b?", "d?"]
+    assert speculation.stats()["over_budget"] == 2
+
+
+@pytest.mark.asyncio
+async def test_new_question_cancels_other_runs_and_joins_its_own(monkeypatch):
+    monkeypatch.setenv("PHOTON_SPECULATE_CONCURRENCY", "2")
+    release = asyncio.Event()
+    started = []
+    speculation.submit("g", "key", ["First?", "Second?", "Third?"], _recorder(started, release))
+    await asyncio.sleep(0.05)
+    assert started == ["First?", "Second?"]
+
+    with speculation.foreground():
+        task = speculation.claim("g", "  first? ")
+        assert task is not None
+        release.set()
+        # The joined run proceeds even though a foreground request is in flight.
+        await asyncio.wait_for(task, 1)
+    await speculation._drain()
+    stats = speculation.stats()
+    assert (stats["completed"], stats["cancelled"], stats["joined"]) == (1, 2, 1)
+    assert "Third?" not in started
+    assert speculation.claim("g", "Second?") is None
+
+
+@pytest.mark.asyncio
+async def test_joined_run_skips_the_foreground_wait():
+    started = []
+    with speculation.foreground():
+        speculation.submit("g", "key", ["a?"], _recorder(started))
+        await asyncio.sleep(0.05)
+        task = speculation.claim("g", "a?")
+        await asyncio.wait_for(task, 1)
+    assert started == ["a?"]
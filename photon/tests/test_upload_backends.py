@@ -0,0 +1,181 @@
+"""
+Tests for the shared upload-store backends in upload_backends.py.
+
+The same contract tests run against the disk backend (in tmp_path) and the
+Redis backend (against fakeredis, skipped when it is not installed). Two
+store instances over the same directory or server stand in for two API
+workers.
+"""
+import hashlib
+import threading
+import time
+
+import pytest
+
+from app.services import preprocess, upload_backends, upload_sessions, upload_store
+from app.services.profiler import load_dataframe
+
+CSV = b"a,b\n1,x\n2,y\n"
+
+
+def _make(kind: str, tmp_path, shared=None):
+    if kind == "disk":
+        return upload_backends.DiskUploadStore(str(tmp_path / "shared"))
+    fakeredis = pytest.importorskip("fakeredis")
+    server = shared or fakeredis.FakeServer()
+    return upload_backends.RedisUploadStore(client=fakeredis.FakeRedis(server=server)), server
+
+
+@pytest.fixture(params=["disk", "redis"])
+def workers(request, tmp_path):
+    """Two backend instances sharing one underlying store."""
+    if request.param == "disk":
+        return _make("disk", tmp_path), _make("disk", tmp_path)
+    a, server = _make("redis", tmp_path)
+    b, _ = _make("redis", tmp_path, server)
+    return a, b
+
+
+def test_upload_on_one_worker_is_visible_on_another(workers):
+    a, b = workers
+    a.put("u1", {"content": CSV, "filename": "d.csv", "extension": ".csv"})
+    assert b.contains("u1")
+    assert b.metadata("u1")["sha256"] == hashlib.sha256(CSV).hexdigest()
+    assert b.get("u1")["content"] == CSV
+    with b.open_content("u1") as f:
+        assert f.read() == CSV
+    with pytest.raises(KeyError):
+        b.get("missing")
+
+
+def test_identical_content_is_stored_once(workers):
+    a, b = workers
+    a.put("u1", {"content": CSV, "extension": ".csv"})
+    b.put("u2", {"content": CSV, "extension": ".csv"})
+    stats = b.stats()
+    assert (stats["entries"], stats["blobs"], stats["dedup_hits"]) == (2, 1, 1)
+
+
+def test_put_file_adopts_spool(workers):
+    a, b = workers
+    with a.spool_file() as f:
+        f.write(CSV)
+    a.put_file("u1", f.name, {"extension": ".csv", "sha256": hashlib.sha256(CSV).hexdigest()})
+    assert b.get("u1")["content"] == CSV
+
+
+def test_expired_ids_are_gone(workers, monkeypatch):
+    a, b = workers
+    monkeypatch.setenv("PHOTON_UPLOAD_TTL_SECONDS", "1")
+    a.put("u1", {"content": CSV, "extension": ".csv"})
+    time.sleep(1.1)
+    assert not b.contains("u1")
+    with pytest.raises(KeyError):
+        b.metadata("u1")
+
+
+def test_disk_backend_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_UPLOAD_DISK_BYTES", "20")
+    store = _make("disk", tmp_path)
+    store.put("old", {"content": b"A" * 10, "extension": ".csv"})
+    store.put("new", {"content": b"B" * 10, "extension": ".csv"})
+    store.put("newest", {"content": b"C" * 10, "extension": ".csv"})
+    assert not store.contains("old")
+    assert store.contains("new") and store.contains("newest")
+    assert store.stats()["disk_bytes"] == 20
+
+
+def test_backend_is_selected_by_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_UPLOAD_BACKEND", "disk")
+    monkeypatch.setenv("PHOTON_UPLOAD_DIR", str(tmp_path / "shared"))
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(tmp_path / "columnar"))
+    upload_store.put("u1", {"content": CSV, "extension": ".csv"})
+    assert upload_store.stats()["backend"] == "disk"
+    assert load_dataframe("photon-upload://u1")["a"].tolist() == [1, 2]
+    upload_store._reset()
+
+
+@pytest.fixture
+def switch(monkeypatch, tmp_path):
+    """Point the upload_store module at one worker's backend instance."""
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(tmp_path / "columnar"))
+
+    def _on(worker):
+        monkeypatch.setenv("PHOTON_UPLOAD_BACKEND", worker.name)
+        monkeypatch.setattr(upload_store, "_backend", worker)
+
+    yield _on
+    upload_store._backend.reset()
+    monkeypatch.setattr(upload_store, "_backend", None)
+
+
+def test_session_chunks_can_land_on_any_worker(workers, switch):
+    a, b = workers
+    switch(a)
+    session = upload_sessions.create("d.csv", ".csv", len(CSV))
+
+    for index, (worker, part) in enumerate([(b, CSV[:5]), (a, CSV[5:])]):
+        switch(worker)
+        writer = upload_sessions.begin_chunk(session.id, index, upload_sessions.get(session.id).offset)
+        writer.write(part)
+        upload_sessions.end_chunk(writer, ok=True)
+
+    switch(a)
+    writer = upload_sessions.begin_chunk(session.id, 2, len(CSV))
+    switch(b)
+    # The claim is shared: another worker cannot write while a chunk is in flight.
+    with pytest.raises(upload_sessions.ChunkConflict):
+        upload_sessions.begin_chunk(session.id, 2, len(CSV))
+    upload_sessions.end_chunk(writer, ok=False)
+    assert upload_sessions.get(session.id).state()["next_index"] == 2
+
+    upload_id, digest, _ = upload_sessions.complete(session.id, hashlib.sha256(CSV).hexdigest())
+    switch(a)
+    assert upload_store.get(upload_id)["content"] == CSV
+    with pytest.raises(KeyError):
+        upload_sessions.get(session.id)
+
+
+def test_preprocess_status_is_visible_on_another_worker(workers, switch, monkeypatch):
+    a, b = workers
+    release = threading.Event()
+    real_read = preprocess.read_source
+
+    def _slow_read(src, columns=None):
+        release.wait(timeout=30)
+        return real_read(src, columns)
+
+    monkeypatch.setattr(preprocess, "read_source", _slow_read)
+    preprocess._reset()
+    switch(a)
+    a.put("u1", {"content": CSV, "extension": ".csv"})
+    preprocess.schedule("u1")
+    job = next(iter(preprocess._jobs.values()))
+    # Worker b has no job of its own, only the shared record.
+    monkeypatch.setattr(preprocess, "_jobs", {})
+    switch(b)
+    try:
+        assert preprocess.status("u1")["state"] in ("queued", "running")
+    finally:
+        release.set()
+    job.future.result(timeout=30)
+    status = preprocess.status("u1")
+    assert status["state"] == "ready"
+    assert status["stages"]["parse"] == "done"
+    preprocess._reset()
+
+
+def test_redis_concurrent_identical_uploads_keep_one_blob(tmp_path):
+    a, server = _make("redis", tmp_path)
+    b, _ = _make("redis", tmp_path, server)
+    digest = hashlib.sha256(CSV).hexdigest()
+    b.put("u1", {"content": CSV, "extension": ".csv"})
+    # a checked for the blob before b stored it, and writes its own copy.
+    a._client.exists = lambda key: 0
+    with a.spool_file() as f:
+        f.write(CSV)
+    a.put_file("u2", f.name, {"extension": ".csv", "sha256": digest})
+    assert a.stats()["dedup_hits"] == 1
+    assert b.stats()["blobs"] == 1
+    assert [k for k in a._client.scan_iter(match="*:tmp:*")] == []
+    assert a.get("u2")["content"] == CSV
@@ -0,0 +1,172 @@
+"""
+Tests for streaming uploads and resumable upload sessions (routes/upload.py,
+services/upload_sessions.py), driven through the FastAPI test client.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.services import upload_store
+
+CSV = b"a,b\n" + b"".join(b"%d,x%d\n" % (i, i) for i in range(2000))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_SKIP_AUTH", "1")
+    monkeypatch.setenv("PHOTON_UPLOAD_SPILL_DIR", str(tmp_path))
+    upload_store._reset()
+    yield TestClient(main.app)
+    upload_store._reset()
+
+
+def _upload_id(path: str) -> str:
+    return path.removeprefix("photon-upload://")
+
+
+def test_multipart_upload_is_spooled_and_hashed(client):
+    r = client.post("/upload/", files={"file": ("d.csv", CSV, "text/csv")})
+    assert r.status_code == 200
+    upload_id = _upload_id(r.json()["path"])
+    meta = upload_store.metadata(upload_id)
+    assert meta["sha256"] == hashlib.sha256(CSV).hexdigest()
+    with upload_store.open_content(upload_id) as f:
+        assert f.read() == CSV
+    assert not [n for n in os.listdir(upload_store._spill_dir()) if n.endswith(".part")]
+
+
+def test_upload_over_limit_is_rejected(client, monkeypatch):
+    monkeypatch.setenv("PHOTON_MAX_UPLOAD_BYTES", "100")
+    r = client.post("/upload/", files={"file": ("d.csv", CSV, "text/csv")})
+    assert r.status_code == 413
+    assert upload_store.stats()["entries"] == 0
+    assert os.listdir(upload_store._spill_dir()) == []
+
+    r = client.post("/upload/sessions", json={"filename": "d.csv", "size": len(CSV)})
+    assert r.status_code == 413
+
+
+async def _multipart_body(blocks: int, sent: list):
+    """A multipart upload of blocks KB, counting into sent how many were read."""
+    yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="d.csv"\r\n\r\n'
+    for _ in range(blocks):
+        sent.append(1)
+        yield b"x" * 1024
+    yield b"\r\n--b--\r\n"
+
+
+@pytest.mark.asyncio
+async def test_oversized_upload_stops_before_the_body_is_read(client, monkeypatch):
+    monkeypatch.setenv("PHOTON_MAX_UPLOAD_BYTES", "1000")
+    headers = {"content-type": "multipart/form-data; boundary=b"}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as aclient:
+        sent = []
+        r = await aclient.post("/upload/", content=_multipart_body(1024, sent), headers=headers)
+        assert r.status_code == 413
+        # No Content-Length (chunked): reading stops just past the limit plus framing.
+        assert len(sent) < 100
+
+        sent = []
+        headers["content-length"] = str(1024 * 1024)
+        r = await aclient.post("/upload/", content=_multipart_body(1024, sent), headers=headers)
+        assert r.status_code == 413
+        assert len(sent) == 0
+    assert os.listdir(upload_store._spill_dir()) == []
+
+
+def test_resumable_session_roundtrip(client):
+    r = client.post("/upload/sessions", json={"filename": "d.csv", "size": len(CSV)})
+    session_id = r.json()["session_id"]
+    parts = [CSV[i:i + 5000] for i in range(0, len(CSV), 5000)]
+
+    offset = 0
+    for index, part in enumerate(parts):
+        r = client.put(f"/upload/sessions/{session_id}/chunks/{index}?offset={offset}", content=part)
+        assert r.status_code == 200
+        offset += len(part)
+        assert r.json()["offset"] == offset
+
+    # A resent chunk is refused with the position to resume from.
+    r = client.put(f"/upload/sessions/{session_id}/chunks/0?offset=0", content=parts[0])
+    assert r.status_code == 409
+    assert r.json()["offset"] == len(CSV)
+    assert r.json()["next_index"] == len(parts)
+
+    digest = hashlib.sha256(CSV).hexdigest()
+    r = client.post(f"/upload/sessions/{session_id}/complete", json={"sha256": digest})
+    assert r.status_code == 200
+    assert r.json()["sha256"] == digest
+    with upload_store.open_content(_upload_id(r.json()["path"])) as f:
+        assert f.read() == CSV
+    assert client.get(f"/upload/sessions/{session_id}").status_code == 404
+
+
+def test_incomplete_or_corrupt_session_cannot_complete(client):
+    r = client.post("/upload/sessions", json={"filename": "d.csv", "size": len(CSV)})
+    session_id = r.json()["session_id"]
+    client.put(f"/upload/sessions/{session_id}/chunks/0?offset=0", content=CSV[:100])
+    assert client.post(f"/upload/sessions/{session_id}/complete").status_code == 400
+
+    client.put(f"/upload/sessions/{session_id}/chunks/1?offset=100", content=CSV[100:])
+    r = client.post(f"/upload/sessions/{session_id}/complete", json={"sha256": "0" * 64})
+    assert r.status_code == 400
+    assert "Checksum" in r.json()["detail"]
+
+
+def test_retrieve_loads_the_blob_off_the_event_loop(client, monkeypatch):
+    r = client.post("/upload/", files={"file": ("d.csv", CSV, "text/csv")})
+    upload_id = _upload_id(r.json()["path"])
+    on_loop = []
+    real_get = upload_store.get
+
+    def _get(uid):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return real_get(uid)
+
+    monkeypatch.setattr(upload_store, "get", _get)
+    r = client.get(f"/upload/retrieve/{upload_id}")
+    assert r.status_code == 200
+    assert base64.b64decode(r.json()["content"]) == CSV
+    assert on_loop == [False]
+
+
+def test_upload_file_io_runs_off_the_event_loop(client, monkeypatch):
+    from app.services import upload_sessions
+
+    on_loop = []
+
+    def _record():
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+
+    real_spool_init = upload_sessions.Spool.__init__
+    real_end_chunk = upload_sessions.end_chunk
+
+    def _spool_init(self):
+        _record()
+        real_spool_init(self)
+
+    def _end_chunk(writer, ok):
+        _record()
+        return real_end_chunk(writer, ok)
+
+    monkeypatch.setattr(upload_sessions.Spool, "__init__", _spool_init)
+    monkeypatch.setattr(upload_sessions, "end_chunk", _end_chunk)
+    assert client.post("/upload/", files={"file": ("d.csv", CSV, "text/csv")}).status_code == 200
+    session_id = client.post("/upload/sessions", json={"filename": "d.csv"}).json()["session_id"]
+    assert client.put(f"/upload/sessions/{session_id}/chunks/0?offset=0", content=CSV).status_code == 200
+    assert on_loop == [False, False]
@@ -0,0 +1,142 @@
+"""
+Tests for upload_store.py — the bounded, spilling upload store.
+
+Budgets are set through environment variables per test and the spill
+directory is a per-test tmp_path. _reset() clears module state between tests.
+"""
+import pytest
+
+from app.services import upload_store
+from app.services.profiler import load_dataframe
+
+
+@pytest.fixture(autouse=True)
+def _store(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_UPLOAD_SPILL_DIR", str(tmp_path))
+    upload_store._reset()
+    yield
+    upload_store._reset()
+
+
+def _data(n: int, fill: bytes = b"A") -> dict:
+    return {"content": fill * n, "filename": "f.csv", "extension": ".csv"}
+
+
+def test_put_get_contains():
+    upload_store.put("u1", _data(10))
+    assert upload_store.contains("u1")
+    assert upload_store.get("u1")["content"] == b"A" * 10
+    assert not upload_store.contains("missing")
+    with pytest.raises(KeyError):
+        upload_store.get("missing")
+
+
+def test_cold_entries_spill_to_disk_and_reload(monkeypatch):
+    monkeypatch.setenv("PHOTON_UPLOAD_MEMORY_BYTES", "25")
+    upload_store.put("u1", _data(10))
+    upload_store.put("u2", _data(10, b"B"))
+    upload_store.put("u3", _data(10, b"C"))
+    stats = upload_store.stats()
+    assert stats["memory_bytes"] <= 25
+    assert stats["disk_entries"] == 1
+    # u1 was least recently used, so it spilled; reading it brings it back.
+    assert upload_store.get("u1")["filename"] == "f.csv"
+    assert upload_store.stats()["reloads"] == 1
+
+
+def test_disk_budget_evicts_oldest(monkeypatch):
+    monkeypatch.setenv("PHOTON_UPLOAD_MEMORY_BYTES", "0")
+    monkeypatch.setenv("PHOTON_UPLOAD_DISK_BYTES", "15")
+    upload_store.put("u1", _data(10))
+    upload_store.put("u2", _data(10, b"B"))
+    assert not upload_store.contains("u1")
+    assert upload_store.contains("u2")
+    assert upload_store.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    upload_store.put("u1", _data(10))
+    monkeypatch.setenv("PHOTON_UPLOAD_TTL_SECONDS", "0")
+    assert not upload_store.contains("u1")
+    with pytest.raises(KeyError):
+        upload_store.get("u1")
+    assert upload_store.stats()["expirations"] == 1
+
+
+def test_open_content_reads_in_place(monkeypatch):
+    monkeypatch.setenv("PHOTON_UPLOAD_MEMORY_BYTES", "15")
+    upload_store.put("u1", _data(10))
+    with upload_store.open_content("u1") as f:
+        assert f.read() == b"A" * 10
+    upload_store.put("u2", _data(10, b"B"))
+    # u1 is spilled now; reading it streams the spill file without a reload.
+    with upload_store.open_content("u1") as f:
+        assert f.read() == b"A" * 10
+    assert upload_store.stats()["reloads"] == 0
+    assert upload_store.metadata("u1")["filename"] == "f.csv"
+
+
+def test_spill_file_outlives_open_readers(monkeypatch, tmp_path):
+    monkeypatch.setenv("PHOTON_UPLOAD_MEMORY_BYTES", "0")
+    upload_store.put("u1", _data(10))
+    spill = tmp_path / f"{upload_store.metadata('u1')['sha256']}.bin"
+    reader = upload_store.open_content("u1")
+    # Reloading would delete the file under the open handle; it waits for the close.
+    monkeypatch.setenv("PHOTON_UPLOAD_MEMORY_BYTES", "100")
+    assert upload_store.get("u1")["content"] == b"A" * 10
+    assert spill.exists()
+    assert reader.read() == b"A" * 10
+    reader.close()
+    assert not spill.exists()
+
+    # An expired blob's file goes the same way.
+    monkeypatch.setenv("PHOTON_UPLOAD_MEMORY_BYTES", "0")
+    upload_store.put("u2", _data(10, b"B"))
+    reader = upload_store.open_content("u2")
+    monkeypatch.setenv("PHOTON_UPLOAD_TTL_SECONDS", "0")
+    assert not upload_store.contains("u2")
+    with pytest.raises(KeyError):
+        upload_store.get("u2")
+    assert reader.read() == b"B" * 10
+    reader.close()
+    assert list(tmp_path.glob("*.bin")) == []
+
+
+def test_identical_content_is_stored_once():
+    upload_store.put("u1", _data(10))
+    upload_store.put("u2", _data(10))
+    stats = upload_store.stats()
+    assert (stats["entries"], stats["blobs"], stats["dedup_hits"]) == (2, 1, 1)
+    assert stats["memory_bytes"] == 10
+    assert upload_store.metadata("u1")["sha256"] == upload_store.metadata("u2")["sha256"]
+
+    # The blob outlives the first id and goes with the last one.
+    upload_store.put("u1", _data(10, b"B"))
+    assert upload_store.get("u2")["content"] == b"A" * 10
+    upload_store.put("u2", _data(10, b"B"))
+    assert upload_store.stats()["blobs"] == 1
+
+
+def test_duplicate_uploads_share_parsed_data(monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(upload_store._spill_dir()))
+    csv = {"content": b"a,b\n1,x\n2,y\n", "extension": ".csv"}
+    upload_store.put("tab1", dict(csv))
+    upload_store.put("tab2", dict(csv))
+    first = load_dataframe("photon-upload://tab1")
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("same content parsed twice")
+
+    monkeypatch.setattr("app.services.loaders.read_csv", _fail)
+    second = load_dataframe("photon-upload://tab2")
+    assert second.to_dict("list") == first.to_dict("list")
+
+
+def test_spilled_upload_loads_as_dataframe(monkeypatch):
+    monkeypatch.setenv("PHOTON_UPLOAD_MEMORY_BYTES", "0")
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(upload_store._spill_dir()))
+    upload_store.put("csv", {"content": b"a,b\n1,x\n2,y\n", "extension": ".csv", "sha256": "d"})
+    assert upload_store.stats()["disk_entries"] == 1
+    df = load_dataframe("photon-upload://csv")
+    assert df["a"].tolist() == [1, 2]
@@ -0,0 +1,475 @@
+"""
+Tests for routes/workflow.py — the /workflow/generate pipeline.
+
+LLM, Lambda and playbook search are replaced with fakes; loading and
+profiling run for real against a small CSV in tmp_path.
+"""
+import asyncio
+import json
+import os
+import time
+
+import httpx
+import pandas as pd
+import pytest
+
+import app.main as main
+from app.routes import workflow
+from app.services import (
+    code_cache,
+    deadline,
+    metrics,
+    preprocess,
+    profiler,
+    speculation,
+    vector_db,
+)
+
+_STDOUT = 'PHOTON_SUMMARY:{"kpis": [{"label": "Rows", "value": "3", "delta": ""}], "anomalies": []}'
+
+
+@pytest.fixture
+def csv_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_SKIP_AUTH", "1")
+    monkeypatch.setenv("PHOTON_COLUMNAR_DIR", str(tmp_path / "columnar"))
+    monkeypatch.setenv("PHOTON_WORKFLOW_CACHE_PATH", str(tmp_path / "workflow.sqlite3"))
+    speculation._reset()
+    metrics._reset()
+    path = tmp_path / "data.csv"
+    path.write_text("dept,defects\nA,1\nB,2\nC,3\n")
+    return str(path)
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    calls = {}
+
+    async def _code(question, profile, playbook, source, history, sheet=None, timeout=None):
+        calls["code"] = (question, profile["row_count"], playbook, source)
+        calls["code_timeout"] = timeout
+        calls["generated"] = calls.get("generated", 0) + 1
+        return "print('hi')"
+
+    async def _stream(question, profile, playbook, source, history, sheet=None, timeout=None):
+        calls["code"] = (question, profile["row_count"], playbook, source)
+        for part in ["```python\n", "print(", "'hi')\n", "```"]:
+            yield part
+
+    async def _execute(code, source="", timeout=None):
+        calls["execute"] = code
+        await asyncio.sleep(0.2)
+        return {"stdout": _STDOUT, "stderr": "", "exit_code": 0, "output_image": "img"}
+
+    async def _narrative(question, profile, kpis, anomalies, history, timeout=None):
+        return "Three departments."
+
+    async def _suggestions(question, profile, kpis, timeout=None):
+        return ["a?", "b?", "c?"]
+
+    monkeypatch.setattr(workflow, "search_playbooks", lambda data_type: f"playbook:{data_type}")
+    monkeypatch.setattr(workflow, "generate_analysis_code_async", _code)
+    monkeypatch.setattr(workflow, "stream_analysis_code", _stream)
+    monkeypatch.setattr(workflow, "execute_via_lambda_async", _execute)
+    monkeypatch.setattr(workflow, "generate_insight_narrative_async", _narrative)
+    monkeypatch.setattr(workflow, "generate_follow_up_suggestions_async", _suggestions)
+    return calls
+
+
+def _events(text: str) -> list:
+    """Parse an SSE body into (event, data) pairs."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_generate_runs_every_stage(csv_path, fakes):
+    async with _client() as client:
+        r = await client.post("/workflow/generate", json={"question": "Defects?", "source": csv_path})
+    assert r.status_code == 200
+    body = r.json()
+    assert fakes["code"] == ("Defects?", 3, "playbook:tabular", csv_path)
+    assert body["kpi_cards"] == [{"label": "Rows", "value": "3", "delta": ""}]
+    assert body["insight_narrative"] == "Three departments."
+    assert body["follow_up_suggestions"] == ["a?", "b?", "c?"]
+    assert body["execution"]["output_image"] == "img"
+
+
+@pytest.mark.asyncio
+async def test_requests_in_flight_do_not_block_other_endpoints(csv_path, fakes):
+    async with _client() as client:
+        pending = [
+            asyncio.create_task(
+                client.post("/workflow/generate", json={"question": "q", "source": csv_path})
+            )
+            for _ in range(50)
+        ]
+        await asyncio.sleep(0.05)
+        health = await client.get("/health")
+        assert health.status_code == 200
+        assert not all(t.done() for t in pending)
+        results = await asyncio.gather(*pending)
+    assert {r.status_code for r in results} == {200}
+
+
+@pytest.mark.asyncio
+async def test_bad_source_is_a_400(csv_path, fakes):
+    async with _client() as client:
+        r = await client.post(
+            "/workflow/generate",
+            json={"question": "q", "source": os.path.join(os.path.dirname(csv_path), "missing.csv")},
+        )
+    assert r.status_code == 400
+    assert "File not found" in json.loads(r.text)["detail"]
+
+
+@pytest.mark.asyncio
+async def test_narrative_and_suggestions_run_concurrently(csv_path, fakes, monkeypatch):
+    async def _slow_narrative(question, profile, kpis, anomalies, history, timeout=None):
+        await asyncio.sleep(0.3)
+        return "narrative"
+
+    async def _slow_suggestions(question, profile, kpis, timeout=None):
+        await asyncio.sleep(0.3)
+        return ["a?", "b?", "c?"]
+
+    monkeypatch.setattr(workflow, "generate_insight_narrative_async", _slow_narrative)
+    monkeypatch.setattr(workflow, "generate_follow_up_suggestions_async", _slow_suggestions)
+    req = workflow.WorkflowRequest(question="q", source=csv_path)
+    profile = {"data_type": "tabular"}
+
+    start = asyncio.get_running_loop().time()
+    result = await workflow._post_process(req, profile, [], [], True)
+    elapsed = asyncio.get_running_loop().time() - start
+    assert result == ("narrative", ["a?", "b?", "c?"])
+    assert elapsed < 0.5
+
+
+@pytest.mark.asyncio
+async def test_slow_or_failing_call_falls_back_alone(csv_path, fakes, monkeypatch):
+    async def _hung_narrative(question, profile, kpis, anomalies, history, timeout=None):
+        await asyncio.sleep(10)
+
+    async def _broken_suggestions(question, profile, kpis, timeout=None):
+        raise RuntimeError("boom")
+
+    monkeypatch.setenv("PHOTON_POST_PROCESS_TIMEOUT_SECONDS", "0.2")
+    monkeypatch.setattr(workflow, "generate_insight_narrative_async", _hung_narrative)
+    req = workflow.WorkflowRequest(question="q", source=csv_path)
+    narrative, suggestions = await workflow._post_process(req, {"data_type": "time_series"}, [], [], True)
+    assert narrative == ""
+    assert suggestions == ["a?", "b?", "c?"]
+
+    monkeypatch.setattr(workflow, "generate_follow_up_suggestions_async", _broken_suggestions)
+    narrative, suggestions = await workflow._post_process(req, {"data_type": "time_series"}, [], [], False)
+    assert narrative == ""
+    assert suggestions == workflow.default_suggestions("time_series")
+
+
+@pytest.mark.asyncio
+async def test_stream_emits_each_stage_in_order(csv_path, fakes):
+    async with _client() as client:
+        r = await client.post(
+            "/workflow/generate/stream", json={"question": "Defects?", "source": csv_path}
+        )
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert r.headers["x-cache"] == "MISS"
+    events = _events(r.text)
+    names = [name for name, _ in events]
+    assert names == ["profile", "cache"] + ["code_delta"] * 4 + ["code", "execution", "insights", "done"]
+    data = dict(events)
+    assert data["profile"]["profile"]["row_count"] == 3
+    assert "".join(d["text"] for n, d in events if n == "code_delta").startswith("```python")
+    assert data["code"]["code"] == "print('hi')"
+    assert data["execution"]["kpi_cards"] == [{"label": "Rows", "value": "3", "delta": ""}]
+    assert data["insights"]["follow_up_suggestions"] == ["a?", "b?", "c?"]
+    assert fakes["code"] == ("Defects?", 3, "playbook:tabular", csv_path)
+
+
+@pytest.mark.asyncio
+async def test_stream_bad_source_is_still_a_400(csv_path, fakes):
+    async with _client() as client:
+        r = await client.post(
+            "/workflow/generate/stream",
+            json={"question": "q", "source": os.path.join(os.path.dirname(csv_path), "missing.csv")},
+        )
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_stream_reports_later_failures_as_error_event(csv_path, fakes, monkeypatch):
+    async def _unreachable(code, source="", timeout=None):
+        raise ConnectionError("no route")
+
+    monkeypatch.setattr(workflow, "execute_via_lambda_async", _unreachable)
+    async with _client() as client:
+        r = await client.post("/workflow/generate/stream", json={"question": "q", "source": csv_path})
+    events = _events(r.text)
+    assert [name for name, _ in events][-2:] == ["code", "error"]
+    assert events[-1][1]["status"] == 503
+
+
+@pytest.mark.asyncio
+async def test_repeated_question_is_served_from_cache(csv_path, fakes, monkeypatch):
+    body = {"question": "Defects?", "source": csv_path}
+    async with _client() as client:
+        first = await client.post("/workflow/generate", json=body)
+        monkeypatch.setattr(workflow, "execute_via_lambda_async", lambda *a: pytest.fail("re-executed"))
+        again = await client.post("/workflow/generate", json={**body, "question": "  defects? "})
+        streamed = await client.post("/workflow/generate/stream", json=body)
+    assert first.headers["x-cache"] == "MISS"
+    assert again.headers["x-cache"] == "HIT"
+    assert again.json() == first.json()
+    assert streamed.headers["x-cache"] == "HIT"
+    names = [name for name, _ in _events(streamed.text)]
+    assert names == ["profile", "cache", "code", "execution", "insights", "done"]
+
+
+@pytest.mark.asyncio
+async def test_bypass_skips_lookup_and_other_history_misses(csv_path, fakes):
+    body = {"question": "Defects?", "source": csv_path}
+    async with _client() as client:
+        await client.post("/workflow/generate", json=body)
+        bypass = await client.post("/workflow/generate", json={**body, "bypass_cache": True})
+        history = [{"role": "user", "content": "Earlier question"}]
+        other = await client.post("/workflow/generate", json={**body, "conversation_history": history})
+    assert bypass.headers["x-cache"] == "BYPASS"
+    assert other.headers["x-cache"] == "MISS"
+
+
+@pytest.mark.asyncio
+async def test_speculated_follow_up_is_a_cache_hit(csv_path, fakes, monkeypatch):
+    monkeypatch.setenv("PHOTON_SPECULATE", "1")
+    async with _client() as client:
+        first = await client.post("/workflow/generate", json={"question": "Defects?", "source": csv_path})
+        await speculation._drain()
+        assert fakes["generated"] == 4
+        # The UI sends the narrative back reformatted; it does not affect the key.
+        history = [
+            {"role": "user", "content": "Defects?"},
+            {"role": "assistant", "content": "Three departments (formatted)."},
+        ]
+        click = await client.post(
+            "/workflow/generate",
+            json={"question": "b?", "source": csv_path, "conversation_history": history},
+        )
+    assert first.headers["x-cache"] == "MISS"
+    assert click.headers["x-cache"] == "HIT"
+    assert fakes["generated"] == 4
+
+
+@pytest.mark.asyncio
+async def test_joining_a_slow_speculative_run_respects_the_budget(csv_path, fakes, monkeypatch):
+    monkeypatch.setenv("PHOTON_SPECULATE", "1")
+    async with _client() as client:
+        await client.post("/workflow/generate", json={"question": "Defects?", "source": csv_path})
+        tasks = [run.task for runs in speculation._get_state().groups.values() for run in runs.values()]
+        seen = {}
+
+        async def _hung_code(question, profile, playbook, source, history, sheet=None, timeout=None):
+            seen[question] = timeout
+            await asyncio.sleep(30)
+
+        monkeypatch.setattr(workflow, "generate_analysis_code_async", _hung_code)
+        await asyncio.sleep(0.1)
+        assert 0 < seen["a?"] <= 28
+        monkeypatch.setenv("PHOTON_REQUEST_BUDGET_SECONDS", "0.5")
+        start = asyncio.get_running_loop().time()
+        r = await client.post(
+            "/workflow/generate",
+            json={"question": "a?", "source": csv_path, "conversation_history": [
+                {"role": "user", "content": "Defects?"},
+                {"role": "assistant", "content": "Three departments."},
+            ]},
+        )
+    assert r.status_code == 504
+    assert asyncio.get_running_loop().time() - start < 2
+    await asyncio.sleep(0)
+    assert len(tasks) == 3 and all(task.done() for task in tasks)
+
+
+@pytest.mark.asyncio
+async def test_stage_timings_are_reported(csv_path, fakes, monkeypatch):
+    monkeypatch.setenv("PHOTON_DEBUG", "1")
+    async with _client() as client:
+        r = await client.post("/workflow/generate", json={"question": "Defects?", "source": csv_path})
+        streamed = await client.post("/workflow/generate/stream", json={"question": "Other?", "source": csv_path})
+        scraped = await client.get("/metrics")
+    stages = {entry.split(";")[0] for entry in r.headers["server-timing"].split(", ")}
+    assert {"resolve", "playbook", "codegen", "execute", "narrative", "suggestions", "total"} <= stages
+    assert r.json()["timings"]["execute"] >= 200
+    assert streamed.headers["server-timing"].startswith("resolve;dur=")
+    assert "codegen" in _events(streamed.text)[-1][1]["timings"]
+    assert 'photon_stage_seconds_count{stage="execute"} 2' in scraped.text
+
+
+@pytest.mark.asyncio
+async def test_timings_block_needs_debug(csv_path, fakes, monkeypatch):
+    monkeypatch.delenv("PHOTON_DEBUG", raising=False)
+    async with _client() as client:
+        r = await client.post("/workflow/generate", json={"question": "Defects?", "source": csv_path})
+    assert "timings" not in r.json()
+    assert "server-timing" in r.headers
+
+
+@pytest.mark.asyncio
+async def test_downstream_timeouts_come_from_request_budget(csv_path, fakes, monkeypatch):
+    monkeypatch.setenv("PHOTON_REQUEST_BUDGET_SECONDS", "10")
+    async with _client() as client:
+        r = await client.post("/workflow/generate", json={"question": "q", "source": csv_path})
+    assert r.status_code == 200
+    assert 0 < fakes["code_timeout"] <= 10
+
+
+@pytest.mark.asyncio
+async def test_optional_stages_are_shed_when_budget_runs_low(csv_path, fakes, monkeypatch):
+    async def _slow_execute(code, source="", timeout=None):
+        await asyncio.sleep(0.5)
+        return {"stdout": _STDOUT, "stderr": "", "exit_code": 0, "output_image": "img"}
+
+    async def _unwanted(*args, **kwargs):
+        pytest.fail("optional stage ran without budget")
+
+    monkeypatch.setenv("PHOTON_REQUEST_BUDGET_SECONDS", "2")
+    monkeypatch.setenv("PHOTON_OPTIONAL_STAGE_MIN_SECONDS", "1.8")
+    monkeypatch.setattr(workflow, "execute_via_lambda_async", _slow_execute)
+    monkeypatch.setattr(workflow, "generate_insight_narrative_async", _unwanted)
+    monkeypatch.setattr(workflow, "generate_follow_up_suggestions_async", _unwanted)
+    async with _client() as client:
+        r = await client.post("/workflow/generate", json={"question": "q", "source": csv_path})
+    body = r.json()
+    assert r.status_code == 200
+    assert body["kpi_cards"] == [{"label": "Rows", "value": "3", "delta": ""}]
+    assert body["insight_narrative"] == ""
+    assert body["follow_up_suggestions"] == workflow.default_suggestions("tabular")
+
+
+@pytest.mark.asyncio
+async def test_exhausted_budget_is_a_504(csv_path, fakes, monkeypatch):
+    async def _hung_execute(code, source="", timeout=None):
+        await asyncio.wait_for(asyncio.sleep(30), timeout)
+
+    monkeypatch.setenv("PHOTON_REQUEST_BUDGET_SECONDS", "0.5")
+    monkeypatch.setattr(workflow, "execute_via_lambda_async", _hung_execute)
+    start = asyncio.get_running_loop().time()
+    async with _client() as client:
+        r = await client.post("/workflow/generate", json={"question": "q", "source": csv_path})
+    assert r.status_code == 504
+    assert "execution" in r.json()["detail"]
+    assert asyncio.get_running_loop().time() - start < 2
+
+
+@pytest.mark.asyncio
+async def test_url_source_is_profiled_in_the_sandbox(csv_path, fakes, monkeypatch):
+    url = "https://example.com/data.csv"
+    sandbox_path = "/tmp/photon_data/abc.csv"
+    sandbox_profile = profiler.profile(pd.read_csv(csv_path))
+
+    async def _profile(source, sheet=None, timeout=None):
+        fakes["sandbox_profiled"] = source
+        return {"profile": sandbox_profile, "digest": "d" * 64, "path": sandbox_path}
+
+    async def _unwanted(*args, **kwargs):
+        pytest.fail("server loaded the dataset")
+
+    monkeypatch.setenv("PHOTON_SANDBOX_PROFILE", "1")
+    monkeypatch.setattr(workflow, "profile_via_lambda_async", _profile)
+    monkeypatch.setattr(preprocess, "profile_source_async", _unwanted)
+    async with _client() as client:
+        r = await client.post("/workflow/generate", json={"question": "Defects?", "source": url})
+    assert r.status_code == 200
+    assert fakes["sandbox_profiled"] == url
+    assert fakes["code"] == ("Defects?", 3, "playbook:tabular", sandbox_path)
+    assert r.json()["profile"]["row_count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_paraphrased_question_reuses_cached_code(csv_path, fakes, monkeypatch):
+    async def _code(question, profile, playbook, source, history, sheet=None, timeout=None):
+        fakes["generated"] = fakes.get("generated", 0) + 1
+        return f"df = pd.read_csv({source!r})"
+
+    def _embedder(text, **_):
+        return [1.0, 0.0] if "defect" in text else [0.0, 1.0]
+
+    vector_db._reset(persist_dir=":memory:")
+    code_cache._reset()
+    monkeypatch.setenv("PHOTON_CODE_CACHE", "1")
+    monkeypatch.setattr(code_cache, "get_embedding", _embedder)
+    monkeypatch.setattr(workflow, "generate_analysis_code_async", _code)
+    async with _client() as client:
+        for question in ["Defects by department", "Which department has most defects?"]:
+            r = await client.post("/workflow/generate", json={"question": question, "source": csv_path})
+            assert r.status_code == 200
+        r = await client.post(
+            "/workflow/generate",
+            json={
+                "question": "defects per department",
+                "source": csv_path,
+                "conversation_history": [{"role": "user", "content": "Trend?"}],
+            },
+        )
+    assert fakes["generated"] == 2
+    assert fakes["execute"] == f"df = pd.read_csv({csv_path!r})"
+    assert code_cache.stats()["hits"] == 1
+    vector_db._reset()
+
+
+@pytest.mark.asyncio
+async def test_cached_code_is_not_shared_between_api_keys(csv_path, fakes, monkeypatch):
+    async def _code(question, profile, playbook, source, history, sheet=None, timeout=None):
+        fakes["generated"] = fakes.get("generated", 0) + 1
+        return f"df = pd.read_csv({source!r})"
+
+    vector_db._reset(persist_dir=":memory:")
+    code_cache._reset()
+    monkeypatch.setenv("PHOTON_CODE_CACHE", "1")
+    monkeypatch.setattr(code_cache, "get_embedding", lambda text, **_: [1.0, 0.0])
+    monkeypatch.setattr(workflow, "generate_analysis_code_async", _code)
+    async with _client() as client:
+        for key, question in [("a", "Defects by department"), ("b", "Which department has most defects?")]:
+            r = await client.post(
+                "/workflow/generate",
+                json={"question": question, "source": csv_path},
+                headers={"x-api-key": key},
+            )
+            assert r.status_code == 200
+    assert fakes["generated"] == 2
+    assert code_cache.stats()["hits"] == 0
+    vector_db._reset()
+
+
+@pytest.mark.asyncio
+async def test_budget_spent_while_profiling_is_a_504(csv_path, fakes, monkeypatch):
+    fetches = []
+
+    def _slow_fetch(url, timeout=30):
+        fetches.append(timeout)
+        time.sleep(0.4)
+        # What requests raises for the zero timeout an exhausted budget once produced.
+        raise ValueError("Attempted to set connect timeout to 0, but the timeout cannot be set")
+
+    monkeypatch.setenv("PHOTON_REQUEST_BUDGET_SECONDS", "0.2")
+    monkeypatch.setattr(profiler.http_cache, "fetch", _slow_fetch)
+    async with _client() as client:
+        r = await client.post(
+            "/workflow/generate", json={"question": "q", "source": "https://example.com/late.csv"}
+        )
+    assert r.status_code == 504
+    assert "data loading" in r.json()["detail"]
+    assert all(t > 0 for t in fetches)
+
+    token = deadline._current.set(deadline.Deadline(0))
+    try:
+        with pytest.raises(TimeoutError):
+            profiler._fetch_url("https://example.com/late.csv")
+    finally:
+        deadline._current.reset(token)
+    assert deadline.Deadline(0).timeout(30) > 0
@@ -0,0 +1,71 @@
+"""
+Tests for workflow_cache.py — the SQLite cache of /workflow/generate results.
+"""
+import time
+
+import pytest
+
+from app.services import workflow_cache
+
+RESULT = {"code": "print(1)", "execution": {"stdout": "1"}, "insight_narrative": "One."}
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTON_WORKFLOW_CACHE_PATH", str(tmp_path / "workflow.sqlite3"))
+    workflow_cache._reset()
+    yield
+    workflow_cache._reset()
+
+
+def _key(**overrides):
+    parts = {
+        "digest": "d1",
+        "question": "Which dept has most defects?",
+        "conversation_history": [],
+        "playbook": "playbook v1",
+        "code_source": "/tmp/uploaded_data.csv",
+        "model": "model-a",
+    }
+    parts.update(overrides)
+    return workflow_cache.make_key(**parts)
+
+
+def test_round_trip_and_stats():
+    assert workflow_cache.get(_key()) is None
+    workflow_cache.put(_key(), RESULT)
+    assert workflow_cache.get(_key()) == RESULT
+    stats = workflow_cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_key_ignores_case_and_whitespace_but_not_inputs():
+    assert _key(question="  which DEPT has   most defects? ") == _key()
+    assert _key(playbook="playbook v2") != _key()
+    assert _key(model="model-b") != _key()
+    assert _key(digest="d2") != _key()
+    old = [{"role": "user", "content": "x"}] * 7
+    recent = [{"role": "assistant", "content": "y"}] + old[1:]
+    # Only the last six messages reach the prompts, so only they count.
+    assert _key(conversation_history=old) == _key(conversation_history=recent)
+    assert _key(conversation_history=old) != _key()
+
+
+def test_entries_expire(monkeypatch):
+    monkeypatch.setenv("PHOTON_WORKFLOW_CACHE_TTL", "0.5")
+    workflow_cache.put(_key(), RESULT)
+    time.sleep(0.6)
+    assert workflow_cache.get(_key()) is None
+    assert workflow_cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    size = len(workflow_cache.json.dumps(RESULT))
+    monkeypatch.setenv("PHOTON_WORKFLOW_CACHE_MAX_BYTES", str(size * 2))
+    workflow_cache.put(_key(digest="a"), RESULT)
+    workflow_cache.put(_key(digest="b"), RESULT)
+    assert workflow_cache.get(_key(digest="a")) is not None
+    workflow_cache.put(_key(digest="c"), RESULT)
+    assert workflow_cache.get(_key(digest="b")) is None
+    assert workflow_cache.get(_key(digest="a")) is not None
+    assert workflow_cache.stats()["evictions"] == 1